@@ -2,7 +2,7 @@ import logging
 import subprocess
 import sys
 from pathlib import Path
-from typing import Any, List
+from typing import Any, List, Optional, TextIO
 
 import click
 from alembic.config import CommandLine
@@ -79,6 +79,59 @@ def duty_watcher() -> None:
     worker_duty_watcher.enter_update_events_loop(plugin)
 
 
+@cli.command()
+@click.option("--loop", is_flag=True, help="Keep pruning every interval_event_pruner, instead of pruning once.")
+@click.option(
+    "--archive-file",
+    type=click.File("a"),
+    default=None,
+    help="Append the pruned events as JSON lines to this file, before they are deleted.",
+)
+def prune_events(loop: bool, archive_file: Optional[TextIO]) -> None:
+    # Local imports so that only the relevant prometheus-client metrics are present.
+    from duty_board import worker_event_pruner
+
+    plugin: AbstractPlugin = plugin_fetcher.get_plugin()
+    if not loop:
+        worker_event_pruner.prune_events(plugin, archive_file=archive_file)
+        return
+    logger.info("Starting the worker to prune the events that ended a while ago.")
+    start_http_server(port=8000)
+    worker_event_pruner.enter_event_pruner_loop(plugin, archive_file=archive_file)
+
+
+@cli.command()
+@click.option(
+    "--remove-unreferenced",
+    is_flag=True,
+    help="Also remove the files of the image store that no image refers to anymore.",
+)
+def move_images_to_store(remove_unreferenced: bool) -> None:
+    from duty_board.alchemy import move_person_images
+
+    plugin: AbstractPlugin = plugin_fetcher.get_plugin()
+    if plugin.image_store is None:
+        raise click.UsageError("Configure the image_store of your plugin first.")
+    logger.info("Moving the images of the persons from the database to the image store.")
+    move_person_images.move_to_image_store(plugin.image_store)
+    if remove_unreferenced:
+        move_person_images.remove_unreferenced_images(plugin.image_store)
+
+
+@cli.command(name="compress-assets")
+@click.option(
+    "--directory",
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
+    default=Path(__file__).resolve().parent / "www" / "dist",
+    help="The directory with the built frontend.",
+)
+def compress_assets_command(directory: Path) -> None:
+    from duty_board.web_helpers import compress_assets
+
+    logger.info(f"Writing the precompressed variants of the assets in {directory}.")
+    compress_assets.compress_assets(directory)
+
+
 @cli.command(name="webserver", context_settings={"ignore_unknown_options": True, "allow_extra_args": True})
 @click.option("--host", default="0.0.0.0", help="The IP address range to listen for.")  # noqa: S104
 @click.option("--port", default="80", type=int, help="The port to listen for.")
@@ -38,7 +38,10 @@ class PersonAdmin(ModelView, model=Person):
     column_searchable_list = [Person.username, Person.email, Person.sync]
     column_sortable_list = [Person.uid, Person.username, Person.email, Person.last_update_utc, Person.sync]
     column_list = [Person.uid, Person.username, Person.email, Person.last_update_utc, Person.sync]
-    form_overrides: ClassVar[Dict[str, Field]] = {"last_update_utc": AppBuilderDateTimeAwareSelector}
+    form_overrides: ClassVar[Dict[str, Field]] = {
+        "last_update_utc": AppBuilderDateTimeAwareSelector,
+        "retry_after_utc": AppBuilderDateTimeAwareSelector,
+    }
 
 
 class CalendarAdmin(ModelView, model=Calendar):
@@ -63,9 +66,14 @@ class CalendarAdmin(ModelView, model=Calendar):
         Calendar.order,
         Calendar.error_msg,
         Calendar.last_update_utc,
+        Calendar.consecutive_failures,
+        Calendar.retry_after_utc,
         Calendar.sync,
     ]
-    form_overrides: ClassVar[Dict[str, Field]] = {"last_update_utc": AppBuilderDateTimeAwareSelector}
+    form_overrides: ClassVar[Dict[str, Field]] = {
+        "last_update_utc": AppBuilderDateTimeAwareSelector,
+        "retry_after_utc": AppBuilderDateTimeAwareSelector,
+    }
     form_include_pk = True
 
 
@@ -1,23 +1,35 @@
+import base64
 import datetime
 import json
-from collections import defaultdict
 from typing import Dict, Iterable, List, Optional, Set
 
 from pendulum.datetime import DateTime
 from pytz.tzinfo import BaseTzInfo
-from sqlalchemy import select
-from sqlalchemy.orm import Session as SASession
+from sqlalchemy import and_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 
 from duty_board.models.calendar import Calendar
 from duty_board.models.on_call_event import OnCallEvent
 from duty_board.models.person import Person
+from duty_board.models.person_image import PersonImage
+from duty_board.models.person_image_variant import PersonImageVariant
+from duty_board.plugin.helpers import image_helper
+from duty_board.plugin.helpers.image_store import ImageStore
+from duty_board.web_helpers.person_image_content import PersonImageContent
 from duty_board.web_helpers.response_types import (
     PersonResponse,
+    PersonsResponse,
     _Calendar,
+    _CompactCalendar,
     _Events,
     _ExtraInfoOnPerson,
     _PersonEssentials,
 )
+from duty_board.web_helpers.schedule_snapshot import ScheduleSnapshot, _SnapshotCalendar, _SnapshotEvent
+
+# Every browser that supports srcset supports WebP, and it is the smallest format we store.
+_THUMBNAIL_MEDIA_TYPE = "image/webp"
 
 
 def format_datetime_for_timezone(dt: datetime.datetime, timezone: BaseTzInfo) -> str:
@@ -25,59 +37,124 @@ def format_datetime_for_timezone(dt: datetime.datetime, timezone: BaseTzInfo) ->
     return dt_tz_aware.strftime("%Y-%m-%d %H:%M:%S %Z")
 
 
-def _get_events_ending_from_now_onwards(
-    session: SASession,
+async def get_schedule_snapshot(session: AsyncSession, version: int) -> ScheduleSnapshot:
+    """
+    Builds the snapshot from a single query over the calendars, their upcoming events and the persons of those events.
+    The rows are ordered per calendar and then by start, so they are streamed into the snapshot as they arrive.
+    """
+    stmt = (
+        select(
+            Calendar.uid,
+            Calendar.name,
+            Calendar.description,
+            Calendar.category,
+            Calendar.order,
+            Calendar.last_update_utc,
+            Calendar.error_msg,
+            Calendar.sync,
+            OnCallEvent.start_event_utc,
+            OnCallEvent.end_event_utc,
+            Person.uid,
+            Person.username,
+            Person.email,
+        )
+        .outerjoin(
+            OnCallEvent, and_(OnCallEvent.calendar_uid == Calendar.uid, OnCallEvent.end_event_utc >= DateTime.utcnow())
+        )
+        .outerjoin(Person, Person.uid == OnCallEvent.person_uid)
+        .order_by(Calendar.order, Calendar.uid, OnCallEvent.start_event_utc)
+    )
+    calendars: List[_SnapshotCalendar] = []
+    persons: Dict[int, _PersonEssentials] = {}
+    async for row in await session.stream(stmt):
+        calendar_uid, name, description, category, order, last_update_utc, error_msg, sync, *event = row
+        start_event_utc, end_event_utc, person_uid, username, email = event
+        if not calendars or calendars[-1].uid != calendar_uid:
+            calendars.append(
+                _SnapshotCalendar(
+                    uid=calendar_uid,
+                    name=name,
+                    description=description,
+                    category=category,
+                    order=order,
+                    last_update_utc=last_update_utc,
+                    error_msg=error_msg or "",
+                    sync=sync,
+                    events=[],
+                )
+            )
+        if person_uid is None:  # A calendar without upcoming events.
+            continue
+        calendars[-1].events.append(
+            _SnapshotEvent(start_event_utc=start_event_utc, end_event_utc=end_event_utc, person_uid=person_uid)
+        )
+        if person_uid not in persons:
+            persons[person_uid] = _PersonEssentials(uid=person_uid, username=username, email=email)
+    return ScheduleSnapshot(version=version, calendars=calendars, persons=persons)
+
+
+def get_calendars(
+    snapshot: ScheduleSnapshot,
     all_encountered_person_uids: Set[int],
     timezone: BaseTzInfo,
-) -> Dict[str, List[_Events]]:
-    stmt = select(OnCallEvent).where(OnCallEvent.end_event_utc >= DateTime.utcnow())
-    result: Iterable[OnCallEvent] = session.scalars(stmt).all()
-    mapped: Dict[str, List[_Events]] = defaultdict(list)
-    for calendar_event in result:
-        mapped[calendar_event.calendar_uid].append(
+) -> List[_Calendar]:
+    now = DateTime.utcnow()
+    calendars: List[_Calendar] = []
+    for single_calendar in snapshot.calendars:
+        events: List[_Events] = [
             _Events(
                 start_event=format_datetime_for_timezone(calendar_event.start_event_utc, timezone),
                 end_event=format_datetime_for_timezone(calendar_event.end_event_utc, timezone),
                 person_uid=calendar_event.person_uid,
+            )
+            for calendar_event in single_calendar.events
+            if calendar_event.end_event_utc >= now
+        ]
+        all_encountered_person_uids.update(event.person_uid for event in events)
+        calendars.append(
+            _Calendar(
+                uid=single_calendar.uid,
+                name=single_calendar.name,
+                description=single_calendar.description,
+                category=single_calendar.category,
+                order=single_calendar.order,
+                last_update=format_datetime_for_timezone(single_calendar.last_update_utc, timezone),
+                error_msg=single_calendar.error_msg,
+                sync=single_calendar.sync,
+                events=events,
             ),
         )
-        all_encountered_person_uids.add(calendar_event.person_uid)
-    return mapped
-
-
-def get_calendars(session: SASession, all_encountered_person_uids: Set[int], timezone: BaseTzInfo) -> List[_Calendar]:
-    events: Dict[str, List[_Events]] = _get_events_ending_from_now_onwards(
-        session=session,
-        all_encountered_person_uids=all_encountered_person_uids,
-        timezone=timezone,
-    )
-    result: Iterable[Calendar] = session.scalars(select(Calendar).order_by(Calendar.order)).all()
-    return [
-        _Calendar(
-            uid=single_calendar.uid,
-            name=single_calendar.name,
-            description=single_calendar.description,
-            category=single_calendar.category,
-            order=single_calendar.order,
-            last_update=format_datetime_for_timezone(single_calendar.last_update_utc, timezone),
-            error_msg=single_calendar.error_msg or "",
-            sync=single_calendar.sync,
-            events=sorted((events.get(single_calendar.uid) or []), key=lambda event: event.start_event),
-        )
-        for single_calendar in result
-    ]
+    return calendars
 
 
-def get_peoples_essentials(session: SASession, all_person_uids: Set[int]) -> Dict[int, _PersonEssentials]:
-    result: Iterable[Person] = session.scalars(select(Person).where(Person.uid.in_(all_person_uids))).all()
-    return {
-        a_person.uid: _PersonEssentials(
-            uid=a_person.uid,
-            username=a_person.username,
-            email=a_person.email,
+def get_compact_calendars(
+    snapshot: ScheduleSnapshot, person_idx_per_uid: Dict[int, int], now: datetime.datetime
+) -> List[_CompactCalendar]:
+    """
+    Returns the calendars with their events as columns. Every person of an event gets an index in person_idx_per_uid,
+    in the order in which they are encountered.
+    """
+    calendars: List[_CompactCalendar] = []
+    for single_calendar in snapshot.calendars:
+        events = [calendar_event for calendar_event in single_calendar.events if calendar_event.end_event_utc >= now]
+        calendars.append(
+            _CompactCalendar(
+                uid=single_calendar.uid,
+                name=single_calendar.name,
+                description=single_calendar.description,
+                category=single_calendar.category,
+                order=single_calendar.order,
+                last_update=int(single_calendar.last_update_utc.timestamp()),
+                error_msg=single_calendar.error_msg,
+                sync=single_calendar.sync,
+                starts=[int(event.start_event_utc.timestamp()) for event in events],
+                ends=[int(event.end_event_utc.timestamp()) for event in events],
+                person_idx=[
+                    person_idx_per_uid.setdefault(event.person_uid, len(person_idx_per_uid)) for event in events
+                ],
+            ),
         )
-        for a_person in result
-    }
+    return calendars
 
 
 def parse_extra_attributes(person_uid: int, extra_attributes_str: Optional[str]) -> List[_ExtraInfoOnPerson]:
@@ -106,20 +183,128 @@ def parse_extra_attributes(person_uid: int, extra_attributes_str: Optional[str])
     return result_list
 
 
-def get_person(session: SASession, person_uid: int, timezone: BaseTzInfo) -> PersonResponse:
-    person = session.scalars(select(Person).where(Person.uid == person_uid)).one_or_none()
-    if person is None:
-        raise ValueError(f"Invalid {person_uid=} passed.")
-
+def _to_person_response(person: Person, img_content_hash: Optional[str], timezone: BaseTzInfo) -> PersonResponse:
     return PersonResponse(
         uid=person.uid,
         username=person.username,
         email=person.email,
         img_filename=str(person.image_uid) if person.image_uid is not None else None,
+        img_content_hash=img_content_hash,
         img_width=person.img_width,
         img_height=person.img_height,
-        extra_attributes=parse_extra_attributes(person_uid, extra_attributes_str=person.extra_attributes_json),
+        extra_attributes=parse_extra_attributes(person.uid, extra_attributes_str=person.extra_attributes_json),
         last_update=format_datetime_for_timezone(person.last_update_utc, timezone),
         error_msg=person.error_msg or "",
         sync=person.sync,
     )
+
+
+async def get_person(session: AsyncSession, person_uid: int, timezone: BaseTzInfo) -> PersonResponse:
+    # We only need the hash of the image, so we don't load the image itself.
+    stmt = select(Person, PersonImage.content_hash).outerjoin(Person.image).where(Person.uid == person_uid)
+    result = (await session.execute(stmt)).one_or_none()
+    if result is None:
+        raise ValueError(f"Invalid {person_uid=} passed.")
+    person, img_content_hash = result
+    return _to_person_response(person, img_content_hash=img_content_hash, timezone=timezone)
+
+
+async def get_persons(
+    session: AsyncSession,
+    person_uids: Iterable[int],
+    timezone: BaseTzInfo,
+    thumbnail_size: Optional[int] = None,
+    image_store: Optional[ImageStore] = None,
+) -> PersonsResponse:
+    """
+    Returns the persons in a single query, skipping unknown uids. If a thumbnail_size is given, we include the smallest
+    WebP variant whose shortest side is at least that long as a data URI, so no separate request for it is needed.
+    """
+    stmt = select(Person, PersonImage.content_hash).outerjoin(Person.image).where(Person.uid.in_(set(person_uids)))
+    if thumbnail_size is not None:
+        thumbnail_uid = (
+            select(PersonImageVariant.uid)
+            .where(PersonImageVariant.person_image_uid == Person.image_uid)
+            .where(PersonImageVariant.media_type == _THUMBNAIL_MEDIA_TYPE)
+            .where(PersonImageVariant.size >= thumbnail_size)
+            .order_by(PersonImageVariant.size)
+            .limit(1)
+            .correlate(Person)
+            .scalar_subquery()
+        )
+        stmt = stmt.add_columns(PersonImageVariant.image_in_bytes, PersonImageVariant.storage_key).outerjoin(
+            PersonImageVariant, PersonImageVariant.uid == thumbnail_uid
+        )
+
+    persons: Dict[int, PersonResponse] = {}
+    thumbnails: Dict[int, bytes] = {}
+    storage_keys: Dict[int, str] = {}
+    for person, img_content_hash, *thumbnail in (await session.execute(stmt)).all():
+        persons[person.uid] = _to_person_response(person, img_content_hash=img_content_hash, timezone=timezone)
+        if thumbnail and thumbnail[0] is not None:
+            thumbnails[person.uid] = thumbnail[0]
+        elif thumbnail and thumbnail[1] is not None and image_store is not None:
+            storage_keys[person.uid] = thumbnail[1]
+    if storage_keys and image_store is not None:
+        # Reading the files blocks, so we don't do that on the event loop.
+        thumbnails.update(await run_in_threadpool(_read_from_image_store, image_store, storage_keys))
+    return PersonsResponse(
+        persons=persons,
+        thumbnails={
+            person_uid: f"data:{_THUMBNAIL_MEDIA_TYPE};base64,{base64.b64encode(content).decode()}"
+            for person_uid, content in thumbnails.items()
+        },
+    )
+
+
+def _read_from_image_store(image_store: ImageStore, storage_keys: Dict[int, str]) -> Dict[int, bytes]:
+    return {person_uid: image_store.get_path(key).read_bytes() for person_uid, key in storage_keys.items()}
+
+
+async def get_person_image(
+    session: AsyncSession, person_image_uid: int, size: Optional[int] = None, media_type: Optional[str] = None
+) -> PersonImageContent:
+    """
+    Returns the smallest variant of the image that is at least `size` in the requested media type. If there is no such
+    variant, or no size was requested, we return the original image. That one is at least as large as all variants.
+    """
+    if size is not None and media_type is not None:
+        variant_stmt = (
+            select(
+                PersonImageVariant.image_in_bytes,
+                PersonImageVariant.storage_key,
+                PersonImageVariant.media_type,
+                PersonImageVariant.content_hash,
+                PersonImage.content_hash,
+            )
+            .join(PersonImageVariant.person_image)
+            .where(PersonImageVariant.person_image_uid == person_image_uid)
+            .where(PersonImageVariant.media_type == media_type)
+            .where(PersonImageVariant.size >= size)
+            .order_by(PersonImageVariant.size)
+            .limit(1)
+        )
+        if (variant := (await session.execute(variant_stmt)).one_or_none()) is not None:
+            content, storage_key, variant_media_type, content_hash, image_content_hash = variant
+            return PersonImageContent(
+                content=content,
+                storage_key=storage_key,
+                media_type=variant_media_type,
+                content_hash=content_hash,
+                image_content_hash=image_content_hash,
+            )
+
+    image_stmt = select(
+        PersonImage.image_in_bytes, PersonImage.storage_key, PersonImage.media_type, PersonImage.content_hash
+    ).where(PersonImage.uid == person_image_uid)
+    content, storage_key, image_media_type, image_content_hash = (await session.execute(image_stmt)).one()
+    if image_content_hash is None:  # Moving an image to the ImageStore sets its hash, so it is in the database.
+        image_content_hash = image_helper.get_content_hash(content)
+    return PersonImageContent(
+        content=content,
+        storage_key=storage_key,
+        # Images that were not synced since we started to store the media type were all stored as JPEG.
+        media_type=image_media_type or "image/jpeg",
+        content_hash=image_content_hash,
+        image_content_hash=image_content_hash,
+    )
@@ -0,0 +1,214 @@
+"""
+A change feed on top of Postgres LISTEN/NOTIFY, so processes can react to changes instead of polling for them.
+
+Writers don't have to think about it. The session hooks below, and the bump of the data version, send a notification
+within the same transaction as the write. Postgres only delivers it once the transaction commits, and collapses
+identical notifications of a single transaction into one.
+
+Any process can subscribe with a ChangeFeedListener. Databases without LISTEN, like SQLite, degrade to polling: waiting
+for a topic then simply sleeps the timeout and reports that the topic might have changed.
+"""
+import asyncio
+import datetime
+import functools
+import logging
+import select as select_module
+import threading
+import time
+from typing import Any, Dict, Final, Iterable, List, Mapping, Optional, Set, Tuple
+
+from pendulum.datetime import DateTime
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session as SASession
+from sqlalchemy.orm import UOWTransaction
+
+from duty_board.alchemy import settings
+from duty_board.models.calendar import Calendar
+from duty_board.models.person import Person
+
+logger = logging.getLogger(__name__)
+
+CHANGE_FEED_CHANNEL: Final[str] = "duty_board_change_feed"
+# Sent when a calendar is added, or when it has to be refreshed sooner than planned, e.g. through the admin page.
+CALENDAR_TOPIC: Final[str] = "calendar"
+# Sent when a person is added, or when it has to be refreshed sooner than planned.
+PERSON_TOPIC: Final[str] = "person"
+_TOPIC_PER_MODEL: Final[Tuple[Tuple[Any, str], ...]] = ((Calendar, CALENDAR_TOPIC), (Person, PERSON_TOPIC))
+# Generations per topic. Every notification of a topic increments its generation.
+Generations = Dict[str, int]
+# The key of the number of times the listener (re)connected, which no topic can have as it is empty.
+_CONNECTS: Final[str] = ""
+
+
+def notify(session: SASession, topic: str) -> None:
+    """Notifies the listeners of the topic once the current transaction of the session commits."""
+    connection = session.connection()
+    if connection.dialect.name == "postgresql":
+        connection.execute(select(func.pg_notify(CHANGE_FEED_CHANNEL, topic)))
+
+
+def _is_moved_back(instance: Any, attribute_name: str) -> bool:
+    history = inspect(instance).attrs[attribute_name].history
+    if not history.added or not history.deleted:
+        return False
+    added, deleted = history.added[0], history.deleted[0]
+    return deleted is not None and (added is None or added < deleted)
+
+
+def _is_due_sooner(instance: Any) -> bool:
+    """Whether last_update_utc or retry_after_utc was moved back, so the refreshers should pick it up sooner."""
+    return _is_moved_back(instance, "last_update_utc") or _is_moved_back(instance, "retry_after_utc")
+
+
+@event.listens_for(SASession, "before_flush")
+def _notify_on_flush(session: SASession, flush_context: UOWTransaction, instances: Any) -> None:  # noqa: ARG001
+    topics: Set[str] = set()
+    for model, topic in _TOPIC_PER_MODEL:
+        if any(isinstance(instance, model) for instance in session.new):
+            topics.add(topic)
+        if any(isinstance(instance, model) and _is_due_sooner(instance) for instance in session.dirty):
+            topics.add(topic)
+    for topic in sorted(topics):
+        notify(session, topic)
+
+
+class ChangeFeedListener:
+    """
+    Listens for notifications in a background thread with a dedicated connection, and wakes up threads and coroutines
+    that wait for them. Use get_generations() before checking the database, and pass those to wait(). Then a notification
+    that arrives in between is not missed.
+
+    Every (re)connect counts as a change of every topic, as we might have missed notifications while not listening.
+    """
+
+    def __init__(self, engine: Engine, reconnect_interval: datetime.timedelta = datetime.timedelta(seconds=5)):
+        self.engine = engine
+        self.reconnect_interval = reconnect_interval
+        self._generations: Generations = {_CONNECTS: 0}
+        self._condition = threading.Condition()
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+        # Set to stop the thread that was started last. Every thread gets its own, so a restart never has to wait.
+        self._stopped = threading.Event()
+        self._stopped.set()
+        # The _stopped of the thread that is currently listening, if any.
+        self._listening_until: Optional[threading.Event] = None
+
+    @property
+    def is_listening(self) -> bool:
+        """Whether notifications are received. Otherwise, waiting for a notification degrades to polling."""
+        return self._listening_until is self._stopped and not self._stopped.is_set()
+
+    def start(self) -> "ChangeFeedListener":
+        if self.engine.dialect.name != "postgresql" or self.engine.dialect.driver != "psycopg2":
+            logger.info(f"{self.engine.dialect.name=} with {self.engine.dialect.driver=} has no LISTEN, so we poll.")
+            return self
+        if self._stopped.is_set():
+            self._stopped = threading.Event()
+            thread_name = "change_feed_listener"
+            threading.Thread(target=self._listen_loop, args=(self._stopped,), name=thread_name, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        """Stops listening. The thread finishes by itself within a second."""
+        self._stopped.set()
+
+    def get_generations(self) -> Generations:
+        with self._condition:
+            return dict(self._generations)
+
+    def get_generation(self, topic: str) -> int:
+        """Returns a number that changes whenever the topic might have changed."""
+        with self._condition:
+            return self._generations.get(topic, 0) + self._generations[_CONNECTS]
+
+    def _has_changed(self, topics: Iterable[str], since: Mapping[str, int]) -> bool:
+        return any(self._generations.get(topic, 0) != since.get(topic, 0) for topic in [_CONNECTS, *topics])
+
+    def wait(self, topics: Iterable[str], timeout: float, since: Optional[Mapping[str, int]] = None) -> bool:
+        """
+        Blocks until one of the topics is notified after `since`, or until the timeout passes. Returns whether one of the
+        topics might have changed. Without LISTEN, this sleeps the timeout and returns True.
+        """
+        topics = list(topics)
+        since = self.get_generations() if since is None else since
+        if not self.is_listening:
+            time.sleep(max(timeout, 0))
+            return True
+        with self._condition:
+            return self._condition.wait_for(lambda: self._has_changed(topics, since), timeout=max(timeout, 0))
+
+    async def wait_async(
+        self, topics: Iterable[str], timeout: float, since: Optional[Mapping[str, int]] = None
+    ) -> bool:
+        """The asyncio version of wait(), which does not occupy a thread while waiting."""
+        topics = list(topics)
+        since = self.get_generations() if since is None else since
+        if not self.is_listening:
+            await asyncio.sleep(max(timeout, 0))
+            return True
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        waiter = (loop, asyncio.Event())
+        with self._condition:
+            self._async_waiters.append(waiter)
+        try:
+            while True:
+                with self._condition:
+                    if self._has_changed(topics, since):
+                        return True
+                    waiter[1].clear()
+                try:
+                    await asyncio.wait_for(waiter[1].wait(), timeout=max(deadline - loop.time(), 0))
+                except asyncio.TimeoutError:
+                    return False
+        finally:
+            with self._condition:
+                self._async_waiters.remove(waiter)
+
+    def _mark_as_changed(self, topics: Iterable[str]) -> None:
+        with self._condition:
+            for topic in topics:
+                self._generations[topic] = self._generations.get(topic, 0) + 1
+            self._condition.notify_all()
+            for loop, async_event in self._async_waiters:
+                loop.call_soon_threadsafe(async_event.set)
+
+    def _listen_loop(self, stopped: threading.Event) -> None:
+        while not stopped.is_set():
+            try:
+                self._listen(stopped)
+            except Exception:
+                logger.exception(f"Lost the connection of the change feed, reconnecting in {self.reconnect_interval}.")
+                stopped.wait(self.reconnect_interval.total_seconds())
+
+    def _listen(self, stopped: threading.Event) -> None:
+        connection = self.engine.raw_connection()
+        try:
+            driver_connection: Any = connection.driver_connection
+            driver_connection.autocommit = True
+            with driver_connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {CHANGE_FEED_CHANNEL}")
+            logger.info(f"Listening for changes on {CHANGE_FEED_CHANNEL=} since {DateTime.utcnow()}.")
+            self._listening_until = stopped
+            self._mark_as_changed([_CONNECTS])
+            while not stopped.is_set():
+                # Wakes up every second to check whether we are stopped.
+                if select_module.select([driver_connection], [], [], 1.0) == ([], [], []):
+                    continue
+                driver_connection.poll()
+                topics = {notification.payload for notification in driver_connection.notifies}
+                driver_connection.notifies.clear()
+                if topics:
+                    logger.debug(f"Received notifications for {topics=}.")
+                    self._mark_as_changed(topics)
+        finally:
+            if self._listening_until is stopped:
+                self._listening_until = None
+            connection.invalidate()  # The connection is still listening, so we don't return it to the pool.
+
+
+@functools.lru_cache(maxsize=None)
+def get_listener() -> ChangeFeedListener:
+    """Returns the listener of this process, which is started on first use."""
+    return ChangeFeedListener(engine=settings.engine).start()
@@ -0,0 +1,102 @@
+"""
+Keeps track of a generation counter per data set, so readers can cheaply find out whether their cache is outdated.
+
+The counter is bumped by SQLAlchemy session hooks within the same transaction as the write itself. That way the
+workers, the sqladmin views and the CLI commands all bump the version without having to think about it, and readers
+never see a new version together with old data. The uid of the data version is also notified on the change feed.
+"""
+import logging
+from typing import Any, Final, Iterable, Tuple, Type
+
+from pendulum.datetime import DateTime
+from sqlalchemy import event, insert, inspect, select, update
+from sqlalchemy.orm import ORMExecuteState, UOWTransaction
+from sqlalchemy.orm import Session as SASession
+
+from duty_board.alchemy import change_feed
+from duty_board.models.calendar import Calendar
+from duty_board.models.data_version import DataVersion
+from duty_board.models.on_call_event import OnCallEvent
+from duty_board.models.person import Person
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_DATA_VERSION: Final[str] = "schedule"
+# Changes to these models invalidate everything that was derived from the schedule.
+_SCHEDULE_MODELS: Final[Tuple[Type[Any], ...]] = (Calendar, OnCallEvent, Person)
+# Only these Person attributes are part of the schedule. Other attributes are loaded on demand.
+_SCHEDULE_PERSON_ATTRIBUTES: Final[Tuple[str, ...]] = ("username", "email")
+# Only these Calendar attributes are part of the schedule. The others are bookkeeping of the calendar refreshers, which
+# change on every claim and sync. Hence, the last_update_utc in the schedule is only as recent as its latest change.
+_SCHEDULE_CALENDAR_ATTRIBUTES: Final[Tuple[str, ...]] = (
+    "name",
+    "description",
+    "category",
+    "order",
+    "error_msg",
+    "sync",
+    "events",
+)
+# Execution option for bulk statements that only touch rows which are not part of the schedule, e.g. events that ended
+# long ago. Those statements don't bump the data version, so the caches of the schedule are kept.
+SKIP_DATA_VERSION_BUMP: Final[str] = "skip_data_version_bump"
+
+
+def get_data_version(session: SASession, uid: str = SCHEDULE_DATA_VERSION) -> int:
+    version = session.scalar(select(DataVersion.version).where(DataVersion.uid == uid))
+    return version or 0
+
+
+def bump_data_version(session: SASession, uid: str = SCHEDULE_DATA_VERSION) -> None:
+    """Bump the version within the current transaction of the session. It becomes visible together with the data."""
+    connection = session.connection()
+    stmt = (
+        update(DataVersion)
+        .where(DataVersion.uid == uid)
+        .values(version=DataVersion.version + 1, last_update_utc=DateTime.utcnow())
+    )
+    if connection.execute(stmt).rowcount == 0:
+        logger.warning(f"No row for data version {uid=} was present. Inserting it now.")
+        connection.execute(insert(DataVersion).values(uid=uid, version=1, last_update_utc=DateTime.utcnow()))
+    change_feed.notify(session, topic=uid)
+
+
+def _is_schedule_change(session: SASession, instance: Any, deleted: bool) -> bool:
+    if not isinstance(instance, _SCHEDULE_MODELS):
+        return False
+    if isinstance(instance, OnCallEvent):
+        return deleted or session.is_modified(instance)
+    # A new person is only part of the schedule once an OnCallEvent refers to it, which is a change on its own.
+    if deleted:
+        return True
+    attributes = inspect(instance).attrs
+    attribute_names = _SCHEDULE_PERSON_ATTRIBUTES if isinstance(instance, Person) else _SCHEDULE_CALENDAR_ATTRIBUTES
+    return any(attributes[name].history.has_changes() for name in attribute_names)
+
+
+def _get_changed_instances(session: SASession) -> Iterable[Tuple[Any, bool]]:
+    for instance in session.new:
+        if not isinstance(instance, Person):
+            yield instance, False
+    for instance in session.dirty:
+        yield instance, False
+    for instance in session.deleted:
+        yield instance, True
+
+
+@event.listens_for(SASession, "before_flush")
+def _bump_on_flush(session: SASession, flush_context: UOWTransaction, instances: Any) -> None:  # noqa: ARG001
+    if any(_is_schedule_change(session, instance, deleted) for instance, deleted in _get_changed_instances(session)):
+        bump_data_version(session)
+
+
+@event.listens_for(SASession, "do_orm_execute")
+def _bump_on_bulk_statement(orm_execute_state: ORMExecuteState) -> None:
+    """Bulk INSERT/UPDATE/DELETE statements bypass the flush, so we catch them here."""
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    if orm_execute_state.execution_options.get(SKIP_DATA_VERSION_BUMP, False):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and issubclass(mapper.class_, _SCHEDULE_MODELS):
+        bump_data_version(orm_execute_state.session)
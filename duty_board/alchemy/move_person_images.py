@@ -0,0 +1,75 @@
+import logging
+import time
+from typing import Sequence, Set, Union
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session as SASession
+
+from duty_board.alchemy.session import create_session
+from duty_board.models.person_image import PersonImage
+from duty_board.models.person_image_variant import PersonImageVariant
+from duty_board.plugin.helpers import image_helper
+from duty_board.plugin.helpers.image_store import ImageStore
+
+logger = logging.getLogger(__name__)
+
+_BATCH_SIZE = 100
+
+
+def move_batch_to_image_store(session: SASession, image_store: ImageStore) -> int:
+    """
+    Moves at most _BATCH_SIZE images and _BATCH_SIZE variants that are still in the database to the image_store, and
+    returns how many were moved.
+    """
+    images: Sequence[Union[PersonImage, PersonImageVariant]] = [
+        *session.scalars(select(PersonImage).where(PersonImage.image_in_bytes.is_not(None)).limit(_BATCH_SIZE)),
+        *session.scalars(
+            select(PersonImageVariant).where(PersonImageVariant.image_in_bytes.is_not(None)).limit(_BATCH_SIZE)
+        ),
+    ]
+    for image in images:
+        content = image.image_in_bytes
+        if content is None:  # Already filtered out by the query, but this makes mypy happy.
+            continue
+        if image.content_hash is None:
+            image.content_hash = image_helper.get_content_hash(content)
+        image_helper.store_content(image, content, image_store=image_store)
+    return len(images)
+
+
+def move_to_image_store(image_store: ImageStore) -> int:
+    """
+    Moves all images and their variants from the database to the image_store, and returns how many were moved.
+    Every batch is committed separately, so we never hold all images in memory.
+    """
+    number_of_moved_images = 0
+    while True:
+        with create_session() as session:
+            number_of_moved_images_in_batch = move_batch_to_image_store(session, image_store=image_store)
+        number_of_moved_images += number_of_moved_images_in_batch
+        if number_of_moved_images_in_batch == 0:
+            break
+    logger.info(f"Moved {number_of_moved_images} images to the image store.")
+    return number_of_moved_images
+
+
+def remove_unreferenced_images(image_store: ImageStore, min_age_in_seconds: int = 3600) -> int:
+    """
+    Removes the files of the image_store that no image refers to anymore, e.g. because the person got a new image.
+    Only files older than min_age_in_seconds are removed, so we never remove a file of a sync that is not committed yet.
+    """
+    with create_session() as session:
+        referenced_keys: Set[str] = set(
+            session.scalars(select(PersonImage.storage_key).where(PersonImage.storage_key.is_not(None)))
+        )
+        referenced_keys.update(
+            session.scalars(select(PersonImageVariant.storage_key).where(PersonImageVariant.storage_key.is_not(None)))
+        )
+    created_before = time.time() - min_age_in_seconds
+    number_of_removed_images = 0
+    for key in list(image_store.iter_keys()):
+        if key not in referenced_keys and image_store.get_path(key).stat().st_mtime < created_before:
+            image_store.remove(key)
+            number_of_removed_images += 1
+    logger.info(f"Removed {number_of_removed_images} unreferenced images from the image store.")
+    return number_of_removed_images
@@ -0,0 +1,98 @@
+"""
+Decides when the refreshers sync a calendar or a person. A row is due once its last update is older than the update
+frequency of the plugin. Unless its latest syncs failed: then the next attempt backs off exponentially, so a single broken
+iCalendar or LDAP entry is not hammered and does not hold up the others.
+"""
+import datetime
+import logging
+from typing import Optional, Type, Union
+
+from pendulum.datetime import DateTime
+from sqlalchemy import ColumnElement, Interval, and_, func, literal, or_, select
+from sqlalchemy.orm import Session as SASession
+
+from duty_board.alchemy import change_feed
+from duty_board.alchemy.session import create_session
+from duty_board.alchemy.sqlalchemy_types import UtcDateTime
+from duty_board.models.calendar import Calendar
+from duty_board.models.person import Person
+
+logger = logging.getLogger(__name__)
+
+RefreshedModel = Union[Type[Calendar], Type[Person]]
+# A row that is due but not claimed was locked by another refresher, so we retry after this many seconds.
+_MIN_SLEEP_IN_SECONDS = 1.0
+# Limits the exponent, so the backoff can not overflow a timedelta.
+_MAX_BACKOFF_EXPONENT = 32
+
+
+def is_due(model: RefreshedModel, update_frequency: datetime.timedelta, now: DateTime) -> ColumnElement[bool]:
+    return and_(
+        model.last_update_utc <= now - update_frequency,
+        or_(model.retry_after_utc.is_(None), model.retry_after_utc <= now),
+    )
+
+
+def get_next_due_utc(
+    session: SASession, model: RefreshedModel, update_frequency: datetime.timedelta
+) -> Optional[DateTime]:
+    """Returns when the first row becomes due, which can be in the past, or None if there are no rows at all."""
+    # GREATEST ignores NULLs, so rows that did not fail are due after the update_frequency.
+    # The frequency is an explicit Interval, as UtcDateTime would try to bind it as a datetime.
+    due_utc = func.greatest(model.last_update_utc + literal(update_frequency, Interval()), model.retry_after_utc)
+    next_due_utc: Optional[DateTime] = session.scalar(select(func.min(due_utc, type_=UtcDateTime())))
+    return next_due_utc
+
+
+def get_retry_backoff(
+    consecutive_failures: int, update_frequency: datetime.timedelta, max_backoff: datetime.timedelta
+) -> datetime.timedelta:
+    """
+    The first failure is retried after the update_frequency, just like a success. Every next failure doubles that, up to
+    the max_backoff. Though we never retry sooner than the update_frequency.
+    """
+    exponent = min(max(consecutive_failures - 1, 0), _MAX_BACKOFF_EXPONENT)
+    backoff_in_seconds = min(update_frequency.total_seconds() * 2**exponent, max_backoff.total_seconds())
+    return max(datetime.timedelta(seconds=backoff_in_seconds), update_frequency)
+
+
+def record_sync_result(
+    instance: Union[Calendar, Person],
+    failed: bool,
+    update_frequency: datetime.timedelta,
+    max_backoff: datetime.timedelta,
+) -> None:
+    """Sets when the instance is synced next, by updating its last_update_utc and its backoff."""
+    instance.last_update_utc = DateTime.utcnow()
+    if failed:
+        instance.consecutive_failures = (instance.consecutive_failures or 0) + 1
+        backoff = get_retry_backoff(instance.consecutive_failures, update_frequency, max_backoff)
+        instance.retry_after_utc = instance.last_update_utc + backoff
+        logger.info(f"{instance} failed {instance.consecutive_failures} times in a row, so we retry it in {backoff}.")
+    else:
+        instance.consecutive_failures = 0
+        instance.retry_after_utc = None
+
+
+def wait_until_next_due(
+    model: RefreshedModel,
+    update_frequency: datetime.timedelta,
+    max_sleep: datetime.timedelta,
+    topic: str,
+    generations: change_feed.Generations,
+) -> None:
+    """
+    Sleeps until the next row is due, but at most max_sleep. The change feed wakes us up sooner when the topic is notified
+    after the generations were taken, e.g. because a row was added.
+    """
+    timeout = max_sleep.total_seconds()
+    try:
+        with create_session() as session:
+            next_due_utc = get_next_due_utc(session, model=model, update_frequency=update_frequency)
+        if next_due_utc is not None:
+            seconds_until_next_due = (next_due_utc - DateTime.utcnow()).total_seconds()
+            timeout = min(timeout, max(seconds_until_next_due, _MIN_SLEEP_IN_SECONDS))
+    except Exception:
+        logger.exception(f"Failed to find out when the next {model.__name__} is due. Retrying in {max_sleep}.")
+    logger.debug(f"Sleeping at most {timeout} seconds until the next {model.__name__} is due.")
+    change_feed.get_listener().wait([topic], timeout=timeout, since=generations)
@@ -15,11 +15,15 @@
 # specific language governing permissions and limitations
 # under the License.
 import contextlib
-from typing import Generator
+from typing import AsyncGenerator, Generator
 
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session as SASession
 
-from duty_board.alchemy import settings
+from duty_board.alchemy import change_feed, data_version, settings
+
+# Registers the session hooks that keep the data versions up-to-date and that notify the change feed.
+_ = (data_version, change_feed)
 
 
 @contextlib.contextmanager
@@ -36,3 +40,17 @@ def create_session() -> Generator[SASession, None, None]:
         raise
     finally:
         session.close()
+
+
+@contextlib.asynccontextmanager
+async def create_async_session() -> AsyncGenerator[AsyncSession, None]:
+    """Asynchronous contextmanager that will create and teardown a session. Used by the webserver."""
+    session = settings.get_async_session_maker()()
+    try:
+        yield session
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
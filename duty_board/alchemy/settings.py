@@ -1,14 +1,31 @@
+import functools
 import logging
 import os
-from typing import Callable
+from typing import Callable, Dict, Final, Optional
 
 from sqlalchemy import create_engine
-from sqlalchemy.engine import Engine
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, scoped_session, sessionmaker
 from sqlalchemy.orm import Session as SASession
 
 log = logging.getLogger(__name__)
+# Maps the database backend to the driver we use for the asyncio engine of the webserver.
+ASYNC_DRIVERS: Final[Dict[str, str]] = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+
+
+def _get_async_connection_string(connection_string: str) -> str:
+    url = make_url(connection_string)
+    if url.get_backend_name() not in ASYNC_DRIVERS:
+        raise ValueError(f"No asyncio driver known for {url.get_backend_name()=}. Set SQL_ALCHEMY_ASYNC_CONNECTION.")
+    return url.set(drivername=f"{url.get_backend_name()}+{ASYNC_DRIVERS[url.get_backend_name()]}").render_as_string(
+        hide_password=False
+    )
+
+
 SQL_ALCHEMY_CONN: str = os.environ["SQL_ALCHEMY_CONNECTION"]
+# Only required when the automatically derived connection string does not work, e.g. because of driver specific args.
+SQL_ALCHEMY_ASYNC_CONN: Optional[str] = os.environ.get("SQL_ALCHEMY_ASYNC_CONNECTION")
 engine: Engine = create_engine(
     SQL_ALCHEMY_CONN,
     connect_args={},
@@ -27,5 +44,25 @@ Session: Callable[..., SASession] = scoped_session(
 )
 
 
+@functools.lru_cache(maxsize=None)
+def get_async_engine() -> AsyncEngine:
+    """
+    Returns the engine of the webserver, so database round-trips don't block the event loop. It is created on first use,
+    so the workers, which only use the sync engine, never need an asyncio driver.
+    """
+    return create_async_engine(
+        SQL_ALCHEMY_ASYNC_CONN or _get_async_connection_string(SQL_ALCHEMY_CONN),
+        pool_size=10,
+        pool_recycle=1800,
+        pool_pre_ping=True,
+        max_overflow=10,
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_async_session_maker() -> Callable[..., AsyncSession]:
+    return async_sessionmaker(autoflush=False, bind=get_async_engine(), expire_on_commit=False)
+
+
 class Base(DeclarativeBase):
     pass
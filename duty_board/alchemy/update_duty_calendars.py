@@ -14,6 +14,15 @@ def _create_or_update_calendar(session: SASession, calendar: DutyCalendarConfig)
     calendar_db_instance = session.scalars(select(Calendar).where(Calendar.uid == calendar.uid)).one_or_none()
     extra_info_serialized: Union[None, str] = json.dumps(calendar.extra_info) if calendar.extra_info else None
     if calendar_db_instance is not None:
+        if (calendar_db_instance.icalendar_url, calendar_db_instance.event_prefix) != (
+            calendar.icalendar_url,
+            calendar.event_prefix,
+        ):
+            # The stored events no longer match the configuration, so the next sync should fetch and parse everything.
+            calendar_db_instance.icalendar_etag = None
+            calendar_db_instance.icalendar_last_modified = None
+            calendar_db_instance.icalendar_content_hash = None
+            calendar_db_instance.events_parsed_utc = None
         calendar_db_instance.name = calendar.name
         calendar_db_instance.description = calendar.description
         calendar_db_instance.category = calendar.category  # type: ignore[assignment]
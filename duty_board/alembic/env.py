@@ -6,8 +6,11 @@ from sqlalchemy import create_engine
 
 from duty_board.alchemy.settings import Base
 from duty_board.models.calendar import Calendar
+from duty_board.models.data_version import DataVersion
 from duty_board.models.on_call_event import OnCallEvent
+from duty_board.models.on_duty_state import OnDutyState
 from duty_board.models.person import Person
+from duty_board.models.person_image_variant import PersonImageVariant
 from duty_board.models.token import Token
 
 # This is the Alembic Config object, which provides access to the values within the .ini file in use.
@@ -18,7 +21,7 @@ if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
 # List all models
-_ = (Calendar, Person, OnCallEvent, Token)
+_ = (Calendar, Person, PersonImageVariant, OnCallEvent, OnDutyState, Token, DataVersion)
 # add your model's MetaData object here for 'autogenerate' support
 target_metadata = Base.metadata
 
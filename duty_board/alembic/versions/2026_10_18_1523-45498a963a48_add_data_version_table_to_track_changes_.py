@@ -0,0 +1,38 @@
+"""Add data version table to track changes of the schedule
+
+Revision ID: 45498a963a48
+Revises: 2e1f3badfabe
+Create Date: 2026-10-18 15:23:54.592666
+
+"""
+import datetime
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+from duty_board.alchemy.sqlalchemy_types import UtcDateTime
+
+# revision identifiers, used by Alembic.
+revision: str = "45498a963a48"
+down_revision: Union[str, None] = "2e1f3badfabe"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    data_version_table = op.create_table(
+        "data_version",
+        sa.Column("uid", sa.String(length=50), nullable=False),
+        sa.Column("version", sa.BigInteger(), nullable=False),
+        sa.Column("last_update_utc", UtcDateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("uid"),
+    )
+    op.bulk_insert(
+        data_version_table,
+        [{"uid": "schedule", "version": 0, "last_update_utc": datetime.datetime.now(tz=datetime.timezone.utc)}],
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("data_version")
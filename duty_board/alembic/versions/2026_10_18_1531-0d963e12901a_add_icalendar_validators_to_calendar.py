@@ -0,0 +1,65 @@
+"""Add iCalendar validators to calendar
+
+Revision ID: 0d963e12901a
+Revises: 45498a963a48
+Create Date: 2026-10-18 15:31:11.318245
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+from duty_board.alchemy.sqlalchemy_types import UtcDateTime
+
+# revision identifiers, used by Alembic.
+revision: str = "0d963e12901a"
+down_revision: Union[str, None] = "45498a963a48"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "calendar",
+        sa.Column(
+            "icalendar_etag",
+            sa.String(length=500),
+            nullable=True,
+            comment="The ETag header of the latest iCalendar response, used for conditional requests.",
+        ),
+    )
+    op.add_column(
+        "calendar",
+        sa.Column(
+            "icalendar_last_modified",
+            sa.String(length=100),
+            nullable=True,
+            comment="The Last-Modified header of the latest iCalendar response, used for conditional requests.",
+        ),
+    )
+    op.add_column(
+        "calendar",
+        sa.Column(
+            "icalendar_content_hash",
+            sa.String(length=64),
+            nullable=True,
+            comment="SHA-256 of the latest parsed iCalendar, to skip parsing when the content did not change.",
+        ),
+    )
+    op.add_column(
+        "calendar",
+        sa.Column(
+            "events_parsed_utc",
+            UtcDateTime(timezone=True),
+            nullable=True,
+            comment="When the events were last parsed from the iCalendar.",
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("calendar", "events_parsed_utc")
+    op.drop_column("calendar", "icalendar_content_hash")
+    op.drop_column("calendar", "icalendar_last_modified")
+    op.drop_column("calendar", "icalendar_etag")
@@ -0,0 +1,54 @@
+"""Add indexes for the hot predicates
+
+Revision ID: 867392dc9565
+Revises: 0d963e12901a
+Create Date: 2026-10-18 15:43:36.271946
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "867392dc9565"
+down_revision: Union[str, None] = "0d963e12901a"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_calendar_last_update_utc", "calendar", ["last_update_utc"], unique=False)
+    op.create_index(
+        "ix_on_call_event_end_event_utc_start_event_utc",
+        "on_call_event",
+        ["end_event_utc", "start_event_utc"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_on_call_event_calendar_uid_start_event_utc",
+        "on_call_event",
+        ["calendar_uid", "start_event_utc"],
+        unique=False,
+    )
+    op.create_index("ix_on_call_event_person_uid", "on_call_event", ["person_uid"], unique=False)
+    op.create_index("ix_person_last_update_utc", "person", ["last_update_utc"], unique=False)
+    op.create_index("ix_person_email", "person", ["email"], unique=False)
+    op.create_index(
+        "ix_person_failed_refresh",
+        "person",
+        ["uid"],
+        unique=False,
+        postgresql_where=sa.text("error_msg IS NOT NULL"),
+        sqlite_where=sa.text("error_msg IS NOT NULL"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_person_failed_refresh", table_name="person")
+    op.drop_index("ix_person_email", table_name="person")
+    op.drop_index("ix_person_last_update_utc", table_name="person")
+    op.drop_index("ix_on_call_event_person_uid", table_name="on_call_event")
+    op.drop_index("ix_on_call_event_calendar_uid_start_event_utc", table_name="on_call_event")
+    op.drop_index("ix_on_call_event_end_event_utc_start_event_utc", table_name="on_call_event")
+    op.drop_index("ix_calendar_last_update_utc", table_name="calendar")
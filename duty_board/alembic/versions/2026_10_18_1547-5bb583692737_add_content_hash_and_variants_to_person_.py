@@ -0,0 +1,49 @@
+"""Add content hash and variants to person images
+
+Revision ID: 5bb583692737
+Revises: 867392dc9565
+Create Date: 2026-10-18 15:47:52.105323
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "5bb583692737"
+down_revision: Union[str, None] = "867392dc9565"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The existing images get their content hash and variants the next time the person is synced.
+    op.add_column(
+        "person_image",
+        sa.Column(
+            "content_hash",
+            sa.String(length=64),
+            nullable=True,
+            comment="SHA-256 of image_in_bytes, used to cache the image. Empty until the person is synced again.",
+        ),
+    )
+    op.add_column("person_image", sa.Column("media_type", sa.String(length=50), nullable=True))
+    op.create_table(
+        "person_image_variant",
+        sa.Column("uid", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("person_image_uid", sa.Integer(), nullable=False),
+        sa.Column("size", sa.Integer(), nullable=False, comment="The length of the shortest side of the image."),
+        sa.Column("media_type", sa.String(length=50), nullable=False),
+        sa.Column("content_hash", sa.String(length=64), nullable=False, comment="SHA-256 of image_in_bytes."),
+        sa.Column("image_in_bytes", sa.LargeBinary(), nullable=False),
+        sa.ForeignKeyConstraint(["person_image_uid"], ["person_image.uid"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("uid"),
+        sa.UniqueConstraint("person_image_uid", "media_type", "size", name="person_image_variant_unique"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("person_image_variant")
+    op.drop_column("person_image", "media_type")
+    op.drop_column("person_image", "content_hash")
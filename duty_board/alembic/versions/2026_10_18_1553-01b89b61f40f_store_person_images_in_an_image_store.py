@@ -0,0 +1,35 @@
+"""Store person images in an image store
+
+Revision ID: 01b89b61f40f
+Revises: 5bb583692737
+Create Date: 2026-10-18 15:53:07.279359
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "01b89b61f40f"
+down_revision: Union[str, None] = "5bb583692737"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    for table_name in ("person_image", "person_image_variant"):
+        op.add_column(table_name, sa.Column("storage_key", sa.String(length=200), nullable=True))
+        op.alter_column(table_name, "image_in_bytes", existing_type=postgresql.BYTEA(), nullable=True)
+        op.create_check_constraint(
+            f"{table_name}_has_content", table_name, "image_in_bytes IS NOT NULL OR storage_key IS NOT NULL"
+        )
+
+
+def downgrade() -> None:
+    # This fails if images were moved to the image store, as those have no image_in_bytes.
+    for table_name in ("person_image_variant", "person_image"):
+        op.drop_constraint(f"{table_name}_has_content", table_name, type_="check")
+        op.alter_column(table_name, "image_in_bytes", existing_type=postgresql.BYTEA(), nullable=False)
+        op.drop_column(table_name, "storage_key")
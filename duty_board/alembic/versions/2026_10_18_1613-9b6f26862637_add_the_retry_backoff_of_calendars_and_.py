@@ -0,0 +1,48 @@
+"""Add the retry backoff of calendars and persons
+
+Revision ID: 9b6f26862637
+Revises: 01b89b61f40f
+Create Date: 2026-10-18 16:13:26.819572
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+from duty_board.alchemy.sqlalchemy_types import UtcDateTime
+
+# revision identifiers, used by Alembic.
+revision: str = "9b6f26862637"
+down_revision: Union[str, None] = "01b89b61f40f"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    for table_name in ("calendar", "person"):
+        op.add_column(
+            table_name,
+            sa.Column(
+                "consecutive_failures",
+                sa.Integer(),
+                server_default="0",
+                nullable=False,
+                comment="How many sync attempts failed in a row. The retries back off exponentially with it.",
+            ),
+        )
+        op.add_column(
+            table_name,
+            sa.Column(
+                "retry_after_utc",
+                UtcDateTime(timezone=True),
+                nullable=True,
+                comment="If the latest sync attempt failed, the next attempt is not made before this moment.",
+            ),
+        )
+
+
+def downgrade() -> None:
+    for table_name in ("person", "calendar"):
+        op.drop_column(table_name, "retry_after_utc")
+        op.drop_column(table_name, "consecutive_failures")
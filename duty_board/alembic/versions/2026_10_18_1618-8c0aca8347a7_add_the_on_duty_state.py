@@ -0,0 +1,39 @@
+"""Add the on duty state
+
+Revision ID: 8c0aca8347a7
+Revises: 9b6f26862637
+Create Date: 2026-10-18 16:18:25.806146
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+from duty_board.alchemy.sqlalchemy_types import UtcDateTime
+
+# revision identifiers, used by Alembic.
+revision: str = "8c0aca8347a7"
+down_revision: Union[str, None] = "9b6f26862637"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "on_duty_state",
+        sa.Column("calendar_uid", sa.String(length=50), nullable=False),
+        sa.Column(
+            "person_uids",
+            sa.ARRAY(sa.Integer()),
+            nullable=True,
+            comment="The sorted uids of the persons on duty at the latest handover. NULL if there was no handover yet.",
+        ),
+        sa.Column("last_handover_utc", UtcDateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(["calendar_uid"], ["calendar.uid"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("calendar_uid"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("on_duty_state")
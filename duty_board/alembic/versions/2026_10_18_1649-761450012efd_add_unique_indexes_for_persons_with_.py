@@ -0,0 +1,58 @@
+"""Add unique indexes for persons with only a username or email
+
+Revision ID: 761450012efd
+Revises: 8c0aca8347a7
+Create Date: 2026-10-18 16:49:52.619403
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "761450012efd"
+down_revision: Union[str, None] = "8c0aca8347a7"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# The column that identifies the person, and the column that is NULL, per index.
+_INDEXES = (
+    ("ix_person_unique_username_without_email", "username", "email"),
+    ("ix_person_unique_email_without_username", "email", "username"),
+)
+
+
+def upgrade() -> None:
+    for index_name, identifier, null_column in _INDEXES:
+        # Parallel calendar syncs could already have created duplicates. We keep the oldest and move the events over.
+        op.execute(
+            f"""
+            WITH duplicates AS (
+                SELECT uid, MIN(uid) OVER (PARTITION BY {identifier}) AS kept_uid
+                FROM person WHERE {null_column} IS NULL
+            )
+            UPDATE on_call_event SET person_uid = duplicates.kept_uid FROM duplicates
+            WHERE on_call_event.person_uid = duplicates.uid AND duplicates.uid <> duplicates.kept_uid
+            """,  # noqa: S608 - only our own column names are formatted in.
+        )
+        op.execute(
+            f"""
+            DELETE FROM person WHERE {null_column} IS NULL AND uid NOT IN (
+                SELECT MIN(uid) FROM person WHERE {null_column} IS NULL GROUP BY {identifier}
+            )
+            """,  # noqa: S608 - only our own column names are formatted in.
+        )
+        op.create_index(
+            index_name,
+            "person",
+            [identifier],
+            unique=True,
+            postgresql_where=sa.text(f"{null_column} IS NULL"),
+            sqlite_where=sa.text(f"{null_column} IS NULL"),
+        )
+
+
+def downgrade() -> None:
+    for index_name, _, _ in reversed(_INDEXES):
+        op.drop_index(index_name, table_name="person")
@@ -1,7 +1,7 @@
 from typing import TYPE_CHECKING, List, Optional
 
 from pendulum.datetime import DateTime
-from sqlalchemy import String, Text
+from sqlalchemy import Index, Integer, String, Text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from duty_board.alchemy.settings import Base
@@ -12,6 +12,7 @@ if TYPE_CHECKING:
 
 
 class Calendar(Base):
+    __table_args__ = (Index("ix_calendar_last_update_utc", "last_update_utc"),)  # To find the most outdated calendar.
     __tablename__ = "calendar"
     uid: Mapped[str] = mapped_column(String(50), primary_key=True, nullable=False)
     name: Mapped[str] = mapped_column(String(200), nullable=False)
@@ -27,6 +28,38 @@ class Calendar(Base):
         comment="If any, the error of the latest sync attempt.",
     )
     last_update_utc: Mapped[DateTime] = mapped_column(UtcDateTime(), nullable=False)
+    consecutive_failures: Mapped[int] = mapped_column(
+        Integer,
+        nullable=False,
+        default=0,
+        server_default="0",
+        comment="How many sync attempts failed in a row. The retries back off exponentially with it.",
+    )
+    retry_after_utc: Mapped[Optional[DateTime]] = mapped_column(
+        UtcDateTime(),
+        nullable=True,
+        comment="If the latest sync attempt failed, the next attempt is not made before this moment.",
+    )
+    icalendar_etag: Mapped[Optional[str]] = mapped_column(
+        String(500),
+        nullable=True,
+        comment="The ETag header of the latest iCalendar response, used for conditional requests.",
+    )
+    icalendar_last_modified: Mapped[Optional[str]] = mapped_column(
+        String(100),
+        nullable=True,
+        comment="The Last-Modified header of the latest iCalendar response, used for conditional requests.",
+    )
+    icalendar_content_hash: Mapped[Optional[str]] = mapped_column(
+        String(64),
+        nullable=True,
+        comment="SHA-256 of the latest parsed iCalendar, to skip parsing when the content did not change.",
+    )
+    events_parsed_utc: Mapped[Optional[DateTime]] = mapped_column(
+        UtcDateTime(),
+        nullable=True,
+        comment="When the events were last parsed from the iCalendar.",
+    )
     sync: Mapped[bool] = mapped_column(default=True)
     events: Mapped[List["OnCallEvent"]] = relationship(
         back_populates="calendar",
@@ -0,0 +1,22 @@
+from pendulum.datetime import DateTime
+from sqlalchemy import BigInteger, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from duty_board.alchemy.settings import Base
+from duty_board.alchemy.sqlalchemy_types import UtcDateTime
+
+
+class DataVersion(Base):
+    """
+    SQLAlchemy Model for generation counters. Every time data covered by a counter is written, its version is bumped
+    within the same transaction. Readers can cheaply compare the version with the one they cached to know whether their
+    cache is still up-to-date.
+    """
+
+    __tablename__ = "data_version"
+    uid: Mapped[str] = mapped_column(String(50), primary_key=True, nullable=False)
+    version: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    last_update_utc: Mapped[DateTime] = mapped_column(UtcDateTime(), nullable=False)
+
+    def __repr__(self) -> str:
+        return f"DataVersion(uid='{self.uid}', version='{self.version}')"
@@ -1,7 +1,7 @@
 from typing import TYPE_CHECKING
 
 from pendulum.datetime import DateTime
-from sqlalchemy import ForeignKey, Integer, String
+from sqlalchemy import ForeignKey, Index, Integer, String
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from duty_board.alchemy.settings import Base
@@ -20,6 +20,14 @@ class OnCallEvent(Base):
     a singular primary key.
     """
 
+    __table_args__ = (
+        # Upcoming and current events are filtered on the end and then on the start of the event.
+        Index("ix_on_call_event_end_event_utc_start_event_utc", "end_event_utc", "start_event_utc"),
+        # The events of a calendar are loaded when it is synced.
+        Index("ix_on_call_event_calendar_uid_start_event_utc", "calendar_uid", "start_event_utc"),
+        # Postgres does not index foreign keys, while persons are deleted and merged.
+        Index("ix_on_call_event_person_uid", "person_uid"),
+    )
     __tablename__ = "on_call_event"
     uid: Mapped[int] = mapped_column(primary_key=True, autoincrement=True, unique=True)
     start_event_utc: Mapped[DateTime] = mapped_column(UtcDateTime(), nullable=False)
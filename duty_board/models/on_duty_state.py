@@ -0,0 +1,30 @@
+from typing import List, Optional
+
+from pendulum.datetime import DateTime
+from sqlalchemy import ARRAY, ForeignKey, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from duty_board.alchemy.settings import Base
+from duty_board.alchemy.sqlalchemy_types import UtcDateTime
+
+
+class OnDutyState(Base):
+    """
+    SQLAlchemy Model for the persons on duty per calendar, as last handed over by the duty watcher.
+    It is stored in the database, so a restarted watcher or a second replica knows which handovers were done already.
+    The duty watcher locks the rows it hands over, so every handover is done by exactly one replica.
+    """
+
+    __tablename__ = "on_duty_state"
+    calendar_uid: Mapped[str] = mapped_column(
+        String(50), ForeignKey("calendar.uid", ondelete="CASCADE"), primary_key=True, nullable=False
+    )
+    person_uids: Mapped[Optional[List[int]]] = mapped_column(
+        ARRAY(Integer),
+        nullable=True,
+        comment="The sorted uids of the persons on duty at the latest handover. NULL if there was no handover yet.",
+    )
+    last_handover_utc: Mapped[Optional[DateTime]] = mapped_column(UtcDateTime(), nullable=True)
+
+    def __repr__(self) -> str:
+        return f"OnDutyState(calendar='{self.calendar_uid}', person_uids='{self.person_uids}')"
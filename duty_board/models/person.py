@@ -1,7 +1,7 @@
 from typing import TYPE_CHECKING, List, Optional
 
 from pendulum.datetime import DateTime
-from sqlalchemy import CheckConstraint, ForeignKey, String, UniqueConstraint
+from sqlalchemy import CheckConstraint, ForeignKey, Index, Integer, String, UniqueConstraint, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from duty_board.alchemy.settings import Base
@@ -17,6 +17,32 @@ class Person(Base):
         UniqueConstraint("image_uid", name="unique_image_uid"),  # To make sure it remains a one-to-one.
         UniqueConstraint("username", "email", name="username_email_unique"),
         CheckConstraint("NOT(username IS NULL AND email IS NULL)", name="user_email_not_both_none"),
+        Index("ix_person_last_update_utc", "last_update_utc"),  # To find the most outdated persons.
+        # Persons are looked up by username or email. The unique constraint already covers the username.
+        Index("ix_person_email", "email"),
+        # Persons from an iCalendar only have a username or an email. These make sure that parallel calendar syncs can't
+        # both create the same person, as the username_email_unique constraint considers NULLs to be distinct.
+        Index(
+            "ix_person_unique_username_without_email",
+            "username",
+            unique=True,
+            postgresql_where=text("email IS NULL"),
+            sqlite_where=text("email IS NULL"),
+        ),
+        Index(
+            "ix_person_unique_email_without_username",
+            "email",
+            unique=True,
+            postgresql_where=text("username IS NULL"),
+            sqlite_where=text("username IS NULL"),
+        ),
+        # To count the persons of which the last refresh failed.
+        Index(
+            "ix_person_failed_refresh",
+            "uid",
+            postgresql_where=text("error_msg IS NOT NULL"),
+            sqlite_where=text("error_msg IS NOT NULL"),
+        ),
     )  # To make sure it remains a one-to-one.
     __tablename__ = "person"
     uid: Mapped[int] = mapped_column(primary_key=True, autoincrement=True, unique=True)
@@ -43,6 +69,18 @@ class Person(Base):
         comment="If any, the error of the latest sync attempt.",
     )
     last_update_utc: Mapped[DateTime] = mapped_column(UtcDateTime(), nullable=False)
+    consecutive_failures: Mapped[int] = mapped_column(
+        Integer,
+        nullable=False,
+        default=0,
+        server_default="0",
+        comment="How many sync attempts failed in a row. The retries back off exponentially with it.",
+    )
+    retry_after_utc: Mapped[Optional[DateTime]] = mapped_column(
+        UtcDateTime(),
+        nullable=True,
+        comment="If the latest sync attempt failed, the next attempt is not made before this moment.",
+    )
     sync: Mapped[bool] = mapped_column(default=True)
 
     # We don't use this field, but still good to indicate this relationship exists
@@ -1,22 +1,40 @@
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, List, Optional
 
+from sqlalchemy import CheckConstraint, String
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from duty_board.alchemy.settings import Base
+from duty_board.models.person_image_variant import PersonImageVariant
 
 if TYPE_CHECKING:
     from duty_board.models.person import Person
 
 
 class PersonImage(Base):
+    __table_args__ = (
+        CheckConstraint("image_in_bytes IS NOT NULL OR storage_key IS NOT NULL", name="person_image_has_content"),
+    )
     __tablename__ = "person_image"
     uid: Mapped[int] = mapped_column(primary_key=True, autoincrement=True, unique=True)
-    image_in_bytes: Mapped[bytes] = mapped_column(nullable=False)  # LargeBinary
+    # Empty if the image is stored in the ImageStore of the plugin, under the storage_key.
+    image_in_bytes: Mapped[Optional[bytes]] = mapped_column(nullable=True)  # LargeBinary
+    storage_key: Mapped[Optional[str]] = mapped_column(String(200), nullable=True)
+    content_hash: Mapped[Optional[str]] = mapped_column(
+        String(64),
+        nullable=True,
+        comment="SHA-256 of image_in_bytes, used to cache the image. Empty until the person is synced again.",
+    )
+    media_type: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)
     person: Mapped["Person"] = relationship(
         back_populates="image",
         cascade="all, delete-orphan",
         passive_deletes=True,
     )
+    variants: Mapped[List[PersonImageVariant]] = relationship(
+        back_populates="person_image",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
 
     def __repr__(self) -> str:
         return f"PersonImage(uid='{self.uid}')"
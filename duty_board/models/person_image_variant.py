@@ -0,0 +1,34 @@
+from typing import TYPE_CHECKING, Optional
+
+from sqlalchemy import CheckConstraint, ForeignKey, String, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+
+from duty_board.alchemy.settings import Base
+
+if TYPE_CHECKING:
+    from duty_board.models.person_image import PersonImage
+
+
+class PersonImageVariant(Base):
+    """A resized and re-encoded version of a PersonImage, which is generated when the person is synced."""
+
+    __table_args__ = (
+        # Also used to look up the variant to serve.
+        UniqueConstraint("person_image_uid", "media_type", "size", name="person_image_variant_unique"),
+        CheckConstraint(
+            "image_in_bytes IS NOT NULL OR storage_key IS NOT NULL", name="person_image_variant_has_content"
+        ),
+    )
+    __tablename__ = "person_image_variant"
+    uid: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    person_image_uid: Mapped[int] = mapped_column(ForeignKey("person_image.uid", ondelete="CASCADE"), nullable=False)
+    person_image: Mapped["PersonImage"] = relationship(back_populates="variants")
+    size: Mapped[int] = mapped_column(nullable=False, comment="The length of the shortest side of the image.")
+    media_type: Mapped[str] = mapped_column(String(50), nullable=False)
+    content_hash: Mapped[str] = mapped_column(String(64), nullable=False, comment="SHA-256 of image_in_bytes.")
+    # Empty if the image is stored in the ImageStore of the plugin, under the storage_key.
+    image_in_bytes: Mapped[Optional[bytes]] = mapped_column(nullable=True)  # LargeBinary
+    storage_key: Mapped[Optional[str]] = mapped_column(String(200), nullable=True)
+
+    def __repr__(self) -> str:
+        return f"PersonImageVariant(person_image_uid='{self.person_image_uid}', {self.media_type}, {self.size})"
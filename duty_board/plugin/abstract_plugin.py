@@ -1,14 +1,16 @@
 import datetime
 import logging
+import traceback
 from abc import ABC, abstractmethod
 from pathlib import Path
-from typing import Any, ClassVar, List, Optional, Set
+from typing import Any, ClassVar, Dict, List, Optional, Set
 
 from sqlalchemy.orm import Session as SASession
 
 from duty_board.models.calendar import Calendar
 from duty_board.models.person import Person
 from duty_board.plugin.helpers.duty_calendar_config import DutyCalendarConfig
+from duty_board.plugin.helpers.image_store import ImageStore
 
 logger = logging.getLogger(__name__)
 
@@ -17,10 +19,34 @@ class AbstractPlugin(ABC):
     admin_session_length: ClassVar[datetime.timedelta] = datetime.timedelta(days=7)
     person_update_frequency: ClassVar[datetime.timedelta] = datetime.timedelta(hours=1)
     calendar_update_frequency: ClassVar[datetime.timedelta] = datetime.timedelta(days=1)
+    # How many persons the duty officer refresher syncs concurrently. Each thread uses its own LDAP connection.
+    person_refresher_pool_size: ClassVar[int] = 4
+    # How many persons a refresher thread claims and syncs at once through sync_persons().
+    person_refresher_batch_size: ClassVar[int] = 25
+    # How long a person is claimed by a refresher. If the sync did not finish by then, another refresher retries.
+    person_refresh_lease_duration: ClassVar[datetime.timedelta] = datetime.timedelta(minutes=10)
+    # Calendars and persons that fail to sync are retried after their update frequency, doubled for every next failure,
+    # up to this maximum.
+    max_refresh_retry_backoff: ClassVar[datetime.timedelta] = datetime.timedelta(days=1)
+    # The refreshers sleep until the next calendar or person is due, or until the change feed wakes them up. But at most
+    # this long, as the change feed only works on Postgres.
+    interval_refresher_max_sleep: ClassVar[datetime.timedelta] = datetime.timedelta(minutes=1)
+    # How many calendars the calendar refresher syncs concurrently, so a single slow iCalendar doesn't stall the rest.
+    calendar_refresher_pool_size: ClassVar[int] = 4
+    # Events that ended longer ago than this are deleted by `DutyBoard prune-events`.
+    event_retention_period: ClassVar[datetime.timedelta] = datetime.timedelta(days=90)
+    # How many events are deleted per transaction, to keep the locks on the events short.
+    event_pruner_batch_size: ClassVar[int] = 1000
+    # How often `DutyBoard prune-events --loop` prunes the events.
+    interval_event_pruner: ClassVar[datetime.timedelta] = datetime.timedelta(hours=1)
     background_color_hex: ClassVar[str] = "#3C9C2D"
     text_color_hex: ClassVar[str] = "white"
     absolute_path_to_favicon_ico: ClassVar[Path] = Path(__file__).resolve().parent / "example" / "favicon.ico"
     absolute_path_to_company_logo_png: ClassVar[Path] = Path(__file__).resolve().parent / "example" / "example_logo.png"
+    # Where to store the images of persons, e.g. FileSystemImageStore(Path("/shared/person_images")). The webserver
+    # serves those as files. When None, they are stored in the database. Use `DutyBoard move-images-to-store` after
+    # configuring a store to move the existing images.
+    image_store: ClassVar[Optional[ImageStore]] = None
     category_order: ClassVar[List[str]] = []
     duty_calendar_configurations: ClassVar[List[DutyCalendarConfig]] = []
     enable_admin_button: ClassVar[bool] = False
@@ -31,8 +57,20 @@ class AbstractPlugin(ABC):
     Cheers!
     """
     interval_worker_metrics_update: ClassVar[datetime.timedelta] = datetime.timedelta(seconds=30)
-    # How often to check whether a new person was assigned on Duty.
+    # The duty watcher wakes up at every shift boundary. In between, it checks this often whether the schedule changed.
     interval_worker_check_for_update_events: ClassVar[datetime.timedelta] = datetime.timedelta(minutes=1)
+    # How many handle_new_person_on_duty_event callbacks the duty watcher runs concurrently.
+    duty_watcher_callback_pool_size: ClassVar[int] = 8
+    # How long the duty watcher waits for a callback, from the moment it starts. Slower ones are counted as timed out.
+    duty_watcher_callback_timeout: ClassVar[datetime.timedelta] = datetime.timedelta(minutes=1)
+    # How often the webserver checks whether the schedule it keeps in memory is still up-to-date.
+    interval_schedule_cache_version_check: ClassVar[datetime.timedelta] = datetime.timedelta(seconds=1)
+    # How many serialized /schedule responses (one per timezone) the webserver keeps in memory.
+    schedule_response_cache_size: ClassVar[int] = 128
+    # How often a /schedule/stream connection sends a comment, so proxies don't close the idle connection.
+    interval_schedule_stream_heartbeat: ClassVar[datetime.timedelta] = datetime.timedelta(seconds=15)
+    # Responses smaller than this are not compressed, as the compression would save less than it costs.
+    response_compression_minimum_size: ClassVar[int] = 1024
 
     announcement_background_color_hex: ClassVar[str] = "#FF0000"
     announcement_text_color_hex: ClassVar[str] = "#FFFFFF"
@@ -47,6 +85,21 @@ class AbstractPlugin(ABC):
     def sync_person(self, person: Person, session: SASession) -> Person:
         pass
 
+    def sync_persons(self, persons: List[Person], session: SASession) -> Dict[int, Optional[str]]:
+        """
+        Synchronises a batch of persons. Returns the error message per person uid, which is None if the sync succeeded.
+        By default, this calls sync_person() for every person. Overwrite it if your source supports batched lookups.
+        """
+        error_messages: Dict[int, Optional[str]] = {}
+        for person in persons:
+            try:
+                self.sync_person(person=person, session=session)
+                error_messages[person.uid] = None
+            except Exception:
+                logger.exception(f"Failed to update {person=}.")
+                error_messages[person.uid] = traceback.format_exc()
+        return error_messages
+
     @abstractmethod
     def sync_calendar(self, calendar: Calendar, session: SASession) -> Calendar:
         pass
@@ -61,5 +114,7 @@ class AbstractPlugin(ABC):
         Any time a new person is on duty, this method will be called with the information of the calendar and the
         person. You can use this function to then update Access Control or Duty Groups in messaging apps.
         Note: When nobody is on Duty anymore, we will call this function with `persons=set()`.
+        Note: The callbacks of several calendars run concurrently, in duty_watcher_callback_pool_size threads. The
+        calendar and persons are detached from the database session, so their relationships can not be lazy loaded.
         """
         logger.info(f"New people of duty for {calendar=}; {persons=}.")
@@ -0,0 +1,126 @@
+import codecs
+import datetime
+import re
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# The timezone of a DTSTART/DTEND is not resolved while pre-filtering, so we widen the window by this margin.
+WINDOW_MARGIN = datetime.timedelta(days=2)
+_UNTIL_PATTERN = re.compile(r"UNTIL=(\d{8})", re.IGNORECASE)
+# Properties of VEVENTs that are part of recurring series. These are kept, as the parser needs the whole series.
+_RECURRENCE_PROPERTIES = ("RRULE", "RDATE", "RECURRENCE-ID")
+
+
+def iter_unfolded_lines(
+    chunks: Iterable[bytes], encoding: str, on_chunk: Optional[Callable[[bytes], None]] = None
+) -> Iterator[str]:
+    """
+    Decodes the chunks of a response into content lines, joining lines that were folded as described in RFC 5545.
+    on_chunk is called with every raw chunk, e.g. to compute a hash while streaming.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    remainder = ""
+    current_line: Optional[str] = None
+
+    def _unfold(raw_lines: List[str]) -> Iterator[str]:
+        nonlocal current_line
+        for raw_line in raw_lines:
+            line = raw_line.rstrip("\r")
+            if line[:1] in (" ", "\t") and current_line is not None:
+                current_line += line[1:]
+                continue
+            if current_line:
+                yield current_line
+            current_line = line
+
+    for chunk in chunks:
+        if on_chunk is not None:
+            on_chunk(chunk)
+        remainder += decoder.decode(chunk)
+        *complete_lines, remainder = remainder.split("\n")
+        yield from _unfold(complete_lines)
+    remainder += decoder.decode(b"", final=True)
+    yield from _unfold([remainder])
+    if current_line:
+        yield current_line
+
+
+def _get_property_name_and_value(line: str) -> Optional[Tuple[str, str]]:
+    """Splits `NAME;PARAM="a:b":value` into the name and the value, ignoring colons within quoted parameters."""
+    in_quotes = False
+    for i, character in enumerate(line):
+        if character == '"':
+            in_quotes = not in_quotes
+        elif character == ":" and not in_quotes:
+            return line[:i].split(";", 1)[0].upper(), line[i + 1 :]
+    return None
+
+
+def _parse_date(value: Optional[str]) -> Optional[datetime.date]:
+    """Parses the date part of DATE and DATE-TIME values like `20231128` and `20231128T020000Z`."""
+    if value is None or len(value) < 8 or not value[:8].isdigit():  # noqa: PLR2004
+        return None
+    try:
+        return datetime.date(int(value[:4]), int(value[4:6]), int(value[6:8]))
+    except ValueError:
+        return None
+
+
+def _unescape_text(value: str) -> str:
+    return value.replace("\\,", ",").replace("\\;", ";").replace("\\n", "\n").replace("\\N", "\n")
+
+
+def _may_be_relevant(
+    event_lines: List[str], window_start: datetime.date, window_end: datetime.date, event_prefix: str
+) -> bool:
+    properties: Dict[str, str] = {}
+    for line in event_lines[1:-1]:
+        if (name_and_value := _get_property_name_and_value(line)) is not None:
+            properties.setdefault(name_and_value[0], name_and_value[1])
+
+    if any(name in properties for name in _RECURRENCE_PROPERTIES):
+        # A series that ended before our window can be skipped. Changed occurrences are separate VEVENTs with a
+        # RECURRENCE-ID and are always kept, so dropping them never makes the parser fall back to the original one.
+        until = _UNTIL_PATTERN.search(properties.get("RRULE", ""))
+        until_date = _parse_date(until.group(1)) if until else None
+        return "RDATE" in properties or until_date is None or until_date >= window_start - WINDOW_MARGIN
+
+    summary = properties.get("SUMMARY")
+    if summary is not None and not (
+        summary.startswith(event_prefix) or _unescape_text(summary).startswith(event_prefix)
+    ):
+        return False
+    start = _parse_date(properties.get("DTSTART"))
+    if start is None:
+        return True
+    if start > window_end + WINDOW_MARGIN:
+        return False
+    end = _parse_date(properties.get("DTEND"))
+    if end is None and "DURATION" in properties:
+        return True  # We don't bother parsing durations.
+    return (end or start) >= window_start - WINDOW_MARGIN
+
+
+def prefilter_events(
+    lines: Iterable[str], window_start: datetime.date, window_end: datetime.date, event_prefix: str
+) -> Iterator[str]:
+    """
+    Yields all lines, except for those of VEVENTs that can't overlap with the window or whose SUMMARY does not start with
+    the event_prefix. Everything outside of VEVENTs, like VTIMEZONEs, is kept as is.
+    This is much cheaper than parsing years of history into a VCalendar. Hence, it is conservative: whenever we can't
+    cheaply tell whether a VEVENT is relevant, we keep it and leave the decision to the actual parser.
+    """
+    event_lines: Optional[List[str]] = None
+    for line in lines:
+        if event_lines is None:
+            if line.upper() == "BEGIN:VEVENT":
+                event_lines = [line]
+            else:
+                yield line
+            continue
+        event_lines.append(line)
+        if line.upper() == "END:VEVENT":
+            if _may_be_relevant(event_lines, window_start, window_end, event_prefix):
+                yield from event_lines
+            event_lines = None
+    if event_lines is not None:
+        yield from event_lines  # An incomplete VEVENT, we leave it to the parser to complain about it.
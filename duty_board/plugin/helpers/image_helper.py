@@ -0,0 +1,73 @@
+import hashlib
+import io
+from typing import Dict, Iterable, List, Optional, Union
+
+from PIL import Image, ImageOps
+
+from duty_board.models.person_image import PersonImage
+from duty_board.models.person_image_variant import PersonImageVariant
+from duty_board.plugin.helpers.image_store import ImageStore
+
+# The formats in which the variants of an image can be stored.
+PIL_FORMAT_PER_MEDIA_TYPE: Dict[str, str] = {"image/webp": "WEBP", "image/jpeg": "JPEG", "image/png": "PNG"}
+_QUALITY = 85
+
+
+def get_content_hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def get_media_type(image: Image.Image) -> str:
+    """Returns the media type of an opened image, falling back to JPEG which is what LDAP's jpegPhoto should contain."""
+    return Image.MIME.get(image.format or "", "image/jpeg")
+
+
+def store_content(
+    image: Union[PersonImage, PersonImageVariant], content: bytes, image_store: Optional[ImageStore]
+) -> None:
+    """Stores the content in the image_store, or in the database if there is no image_store."""
+    if image_store is None:
+        image.image_in_bytes = content
+        image.storage_key = None
+    else:
+        image.storage_key = image_store.store(content)
+        image.image_in_bytes = None
+
+
+def _encode(image: Image.Image, media_type: str) -> bytes:
+    pil_format = PIL_FORMAT_PER_MEDIA_TYPE[media_type]
+    if pil_format == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")  # JPEG has no alpha channel.
+    buffer = io.BytesIO()
+    image.save(buffer, format=pil_format, quality=_QUALITY)
+    return buffer.getvalue()
+
+
+def create_image_variants(
+    image_in_bytes: bytes,
+    sizes: Iterable[int],
+    media_types: Iterable[str],
+    image_store: Optional[ImageStore] = None,
+) -> List[PersonImageVariant]:
+    """
+    Resizes the image so its shortest side has the length of every size, and encodes each of those as every media type.
+    Sizes that are not smaller than the original image are skipped, as we never enlarge an image.
+    """
+    original: Image.Image = Image.open(io.BytesIO(image_in_bytes))
+    # Phones store the rotation in the EXIF data instead of the pixels.
+    original = ImageOps.exif_transpose(original) or original
+    variants: List[PersonImageVariant] = []
+    shortest_side = min(original.width, original.height)
+    for size in sorted(set(sizes)):
+        if size >= shortest_side:
+            continue
+        scale = size / shortest_side
+        resized = original.resize(
+            (round(original.width * scale), round(original.height * scale)), Image.Resampling.LANCZOS
+        )
+        for media_type in media_types:
+            content = _encode(resized, media_type)
+            variant = PersonImageVariant(size=size, media_type=media_type, content_hash=get_content_hash(content))
+            store_content(variant, content, image_store=image_store)
+            variants.append(variant)
+    return variants
@@ -0,0 +1,67 @@
+import hashlib
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Iterator
+
+
+class ImageStore(ABC):
+    """Stores the images of persons outside of the database, so the webserver can serve them as files."""
+
+    @abstractmethod
+    def store(self, content: bytes) -> str:
+        """Stores the content and returns the key under which it is stored."""
+
+    @abstractmethod
+    def get_path(self, key: str) -> Path:
+        """Returns the path of the file with the content of the key, which is served by the webserver."""
+
+    @abstractmethod
+    def iter_keys(self) -> Iterator[str]:
+        pass
+
+    @abstractmethod
+    def remove(self, key: str) -> None:
+        pass
+
+
+class FileSystemImageStore(ImageStore):
+    """
+    Stores every image as a file named after the SHA-256 of its content, like `<directory>/ab/abcdef...`.
+    Identical images are thus only stored once, and a file never changes once it is written.
+    The directory should be shared between the webserver and the workers that sync the persons.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+
+    def get_path(self, key: str) -> Path:
+        if len(key) != 64 or not all(character in "0123456789abcdef" for character in key):  # noqa: PLR2004
+            raise ValueError(f"Invalid {key=}.")
+        return self.directory / key[:2] / key
+
+    def store(self, content: bytes) -> str:
+        key = hashlib.sha256(content).hexdigest()
+        path = self.get_path(key)
+        if path.exists():
+            return key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # We write to a temporary file first, so the webserver never serves a partially written file.
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(file_descriptor, "wb") as file:
+                file.write(content)
+            Path(temporary_path).replace(path)
+        except BaseException:
+            Path(temporary_path).unlink(missing_ok=True)
+            raise
+        return key
+
+    def iter_keys(self) -> Iterator[str]:
+        for path in self.directory.glob("??/*"):
+            if not path.name.startswith(".tmp-"):
+                yield path.name
+
+    def remove(self, key: str) -> None:
+        self.get_path(key).unlink(missing_ok=True)
@@ -3,6 +3,7 @@ import sys
 from functools import wraps
 from typing import (
     Callable,
+    Dict,
     Final,
     List,
     Literal,
@@ -23,6 +24,8 @@ if sys.version_info[:2] >= (3, 10):
 else:
     from typing_extensions import ParamSpec
 
+LdapEntry = Tuple[str, Mapping[str, List[str]]]
+
 
 logger = logging.getLogger(__name__)
 P = ParamSpec("P")
@@ -69,6 +72,12 @@ class LDAPPersonSearch(BaseModel):
             return f"ou={self.organization_unit},{self.base_dn}"
         return self.base_dn
 
+    def is_match(self, dn: str, attributes: Mapping[str, List[str]]) -> bool:
+        """Whether the entry is one that search_filter would have found. Requires `mail` to be a returned attribute."""
+        if "@" in self.name:
+            return self.name.lower() in (mail.lower() for mail in attributes.get("mail", []))
+        return dn.lower().startswith(f"{self.account_attribute}={self.name},".lower())
+
 
 class LDAPGroupSearch(BaseModel):
     base_dn: str
@@ -212,23 +221,54 @@ class LDAPBaseClient:
                 user_list.append(dn)
         return user_list, group_list
 
-    def get_user(
-        self,
-        username: str,
-        attributes: Optional[List[str]] = None,
-    ) -> Optional[List[Tuple[str, Mapping[str, List[str]]]]]:
-        person_search: LDAPPersonSearch = LDAPPersonSearch(
+    def __get_person_search(self, username: str) -> LDAPPersonSearch:
+        return LDAPPersonSearch(
             base_dn=self.base_dn,
             account_attribute=self.account_attribute,
             organization_unit=self.user_organizational_unit,
             name=username,
         )
+
+    def get_user(
+        self,
+        username: str,
+        attributes: Optional[List[str]] = None,
+    ) -> Optional[List[LdapEntry]]:
+        person_search: LDAPPersonSearch = self.__get_person_search(username=username)
         return self._search(  # type: ignore[no-any-return]
             person_search.search_filter,
             person_search.person_dn,
             attributes or ["*"],
         )
 
+    def get_users(
+        self,
+        usernames: List[str],
+        attributes: List[str],
+        chunk_size: int = 50,
+    ) -> Dict[str, List[LdapEntry]]:
+        """
+        Looks up many users with a single OR-filter search per chunk, instead of one search per user.
+        Returns the found entries per requested username. `mail` is always requested, as we need it to map them back.
+        """
+        found_entries: Dict[str, List[LdapEntry]] = {username: [] for username in usernames}
+        person_searches: List[LDAPPersonSearch] = [self.__get_person_search(username) for username in found_entries]
+        for i in range(0, len(person_searches), chunk_size):
+            chunk = person_searches[i : i + chunk_size]
+            search_result: List[LdapEntry] = (
+                self._search(
+                    f"(|{''.join(person_search.search_filter for person_search in chunk)})",
+                    chunk[0].person_dn,
+                    sorted({"mail", *attributes}),
+                )
+                or []
+            )
+            for dn, entry_attributes in search_result:
+                for person_search in chunk:
+                    if person_search.is_match(dn, entry_attributes):
+                        found_entries[person_search.name].append((dn, entry_attributes))
+        return found_entries
+
     def is_existing_user(self, username: str) -> bool:
         return self.get_user(username) is not None
 
@@ -1,5 +1,9 @@
+import hashlib
 import logging
-from typing import List, Optional, Tuple
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, ClassVar, Dict, Iterable, List, Optional, Tuple
 
 import pytz
 import requests
@@ -10,30 +14,84 @@ from ical_library.ical_components.v_event import VEvent
 from ical_library.timeline import Timeline
 from pendulum.datetime import DateTime
 from pendulum.duration import Duration
-from sqlalchemy import Select, select
+from sqlalchemy import Select, or_, select
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session as SASession
 
-from duty_board.alchemy.session import create_session
+from duty_board.alchemy import change_feed
+from duty_board.alchemy.data_version import SKIP_DATA_VERSION_BUMP
 from duty_board.models.calendar import Calendar
 from duty_board.models.on_call_event import OnCallEvent
 from duty_board.models.person import Person
+from duty_board.plugin.helpers import ical_prefilter
 
 logger = logging.getLogger(__name__)
 
+# The key on which events are reconciled, the calendar_uid is implied as we only look at the events of one calendar.
+_EventKey = Tuple[datetime, datetime, Optional[int]]
+
 
 class ICalPluginMixin:
+    # We only store the events of the upcoming 4 weeks. Once that window moved by more than this interval, we re-parse
+    # the iCalendar, even if it did not change. Until then, the fetch is conditional and an unchanged iCalendar is not
+    # parsed. This is the margin the pre-filter adds to the window, and longer than the default calendar_update_frequency,
+    # so by default at least every other fetch can be answered with a '304 Not Modified'.
+    ICALENDAR_REPARSE_INTERVAL: ClassVar[timedelta] = ical_prefilter.WINDOW_MARGIN
+    # The size of the chunks in which we read the iCalendar response.
+    ICALENDAR_CHUNK_SIZE: ClassVar[int] = 64 * 1024
+    # The same persons appear in many rotations. Hence, the calendar refresher threads share which person uid belongs to
+    # an identifier for this long, after which it is looked up by email or username again.
+    ICALENDAR_PERSON_CACHE_TTL: ClassVar[timedelta] = timedelta(minutes=5)
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        self._person_uid_cache: Dict[str, Tuple[int, DateTime]] = {}
+        self._person_uid_cache_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
     @staticmethod
-    def _get_icalendar(icalendar_url: str) -> str:
-        response = requests.get(icalendar_url, timeout=30.0)  # For larger calendars, it might take quite some time.
+    def _get_icalendar(icalendar_url: str, headers: Optional[Dict[str, str]] = None) -> requests.Response:
+        """Returns a streamed response, so large calendars don't have to be kept in memory as a whole."""
+        # For larger calendars, it might take quite some time.
+        response = requests.get(icalendar_url, headers=headers, timeout=30.0, stream=True)
         response.raise_for_status()
-        return response.text
+        return response
+
+    @staticmethod
+    def _get_encoding(response: requests.Response) -> str:
+        # iCalendars are UTF-8 by default, while requests falls back to ISO-8859-1 for text/* without a charset.
+        if response.encoding is None or "charset" not in response.headers.get("Content-Type", "").lower():
+            return "utf-8"
+        return response.encoding
 
-    def _get_events_for_upcoming_month(self, icalendar_url: str, event_prefix: str, limit: int = 10) -> List[VEvent]:
-        """Gets the calendar events for the upcoming 4 weeks."""
-        logger.info(f"Loading {icalendar_url}, this might take some time.")
+    @staticmethod
+    def _get_upcoming_month() -> Tuple[DateTime, DateTime]:
         now = DateTime.now()
-        month_from_now = now + Duration(days=7 * 4)  # type: ignore[no-untyped-call]
-        calendar_txt: str = self._get_icalendar(icalendar_url=icalendar_url)
+        return now, now + Duration(days=7 * 4)  # type: ignore[no-untyped-call]
+
+    def _is_reparse_due(self, calendar: Calendar) -> bool:
+        return (
+            calendar.events_parsed_utc is None
+            or calendar.events_parsed_utc + self.ICALENDAR_REPARSE_INTERVAL < DateTime.utcnow()
+        )
+
+    @staticmethod
+    def _get_conditional_request_headers(calendar: Calendar) -> Dict[str, str]:
+        """Headers that let the server reply with a '304 Not Modified' if the iCalendar did not change."""
+        headers: Dict[str, str] = {}
+        if calendar.icalendar_etag is not None:
+            headers["If-None-Match"] = calendar.icalendar_etag
+        if calendar.icalendar_last_modified is not None:
+            headers["If-Modified-Since"] = calendar.icalendar_last_modified
+        return headers
+
+    def _get_events_for_upcoming_month(
+        self, calendar_txt: str, event_prefix: str, window: Tuple[DateTime, DateTime]
+    ) -> List[VEvent]:
+        """
+        Gets all calendar events for the upcoming 4 weeks, as returned by _get_upcoming_month.
+        As we only parse again every few days, a cap on the number of events would leave too few for short rotations.
+        """
+        now, month_from_now = window
         calendar: VCalendar = client.parse_lines_into_calendar(calendar_txt)
         # timeline is ordered by start date.
         timeline: Timeline = calendar.get_limited_timeline(now, month_from_now)
@@ -44,31 +102,124 @@ class ICalPluginMixin:
             and event.summary is not None
             and event.summary.value is not None
             and event.summary.value.startswith(event_prefix)
-        ][:limit]
-
-    def _get_or_create_person(self, value: str) -> Person:
-        """Returns a Person object if the person is not already in the database."""
-        session: SASession
-        with create_session() as session:
-            if "@" in value:
-                stmt: Select[Tuple[Person]] = select(Person).where(Person.email == value)
-            else:
-                stmt = select(Person).where(Person.username == value)
-            result: Optional[Person] = session.scalar(stmt)
-            if result:
-                return result
-            username = None if "@" in value else value
-            email = value if "@" in value else None
-            return Person(
-                username=username,
-                email=email,
-                image=None,
-                img_width=None,
-                img_height=None,
-                extra_attributes_json=None,
-                last_update_utc=DateTime(1970, 1, 1, 0, 0, 0, tzinfo=pytz.UTC),  # type: ignore[no-untyped-call]
-                sync=True,
+        ]
+
+    def _get_cached_person_uids(self, values: Iterable[str]) -> Dict[str, int]:
+        now = DateTime.utcnow()
+        with self._person_uid_cache_lock:
+            return {
+                value: self._person_uid_cache[value][0]
+                for value in values
+                if value in self._person_uid_cache and self._person_uid_cache[value][1] > now
+            }
+
+    def _cache_person_uids(self, persons: Dict[str, Person]) -> None:
+        now = DateTime.utcnow()
+        cached_until = now + self.ICALENDAR_PERSON_CACHE_TTL
+        with self._person_uid_cache_lock:
+            for value, (_, expiry) in list(self._person_uid_cache.items()):
+                if expiry <= now:
+                    del self._person_uid_cache[value]
+            for value, person in persons.items():
+                if person.uid is not None:  # Persons that are not in the database yet, don't have a uid.
+                    self._person_uid_cache[value] = person.uid, cached_until
+
+    @staticmethod
+    def _insert_persons(values: Iterable[str], session: SASession) -> None:
+        """
+        Inserts a Person per value, unless another thread or replica did so already. The unique indexes on persons with
+        only a username or an email make the insert wait for such a concurrent sync, after which the conflict is ignored.
+        The values are inserted in sorted order, so two syncs can never deadlock on each other.
+        """
+        new_persons = [
+            {
+                "username": None if "@" in value else value,
+                "email": value if "@" in value else None,
+                "last_update_utc": DateTime(1970, 1, 1, 0, 0, 0, tzinfo=pytz.UTC),  # type: ignore[no-untyped-call]
+                "sync": True,
+            }
+            for value in sorted(values)
+        ]
+        # A new person is only part of the schedule once an event refers to it, which bumps the data version by itself.
+        stmt = (
+            insert(Person)
+            .values(new_persons)
+            .on_conflict_do_nothing()
+            .execution_options(**{SKIP_DATA_VERSION_BUMP: True})
+        )
+        session.execute(stmt)
+        change_feed.notify(session, topic=change_feed.PERSON_TOPIC)  # So the person refreshers pick them up right away.
+
+    @staticmethod
+    def _get_persons_by_identifier(
+        session: SASession, emails: List[str], usernames: List[str], uids: Iterable[int] = ()
+    ) -> Tuple[Dict[int, Person], Dict[str, Person]]:
+        stmt: Select[Tuple[Person]] = select(Person).where(
+            or_(Person.uid.in_(uids), Person.email.in_(emails), Person.username.in_(usernames))
+        )
+        persons_by_uid: Dict[int, Person] = {}
+        persons_by_identifier: Dict[str, Person] = {}
+        for person in session.scalars(stmt):
+            persons_by_uid[person.uid] = person
+            if person.email in emails:
+                persons_by_identifier.setdefault(person.email, person)
+            if person.username in usernames:
+                persons_by_identifier.setdefault(person.username, person)
+        return persons_by_uid, persons_by_identifier
+
+    def _get_or_create_persons(self, values: Iterable[str], session: SASession) -> Dict[str, Person]:
+        """
+        Returns a Person object per value, creating the ones that are not already in the database.
+        The known values are resolved with a single query on the session of the calendar sync, so the lock on the
+        calendar row is kept until the sync is committed. New values cost an insert and another query.
+        """
+        values = set(values)
+        cached_uids = self._get_cached_person_uids(values)
+        emails = [value for value in values if "@" in value and value not in cached_uids]
+        usernames = [value for value in values if "@" not in value and value not in cached_uids]
+        persons_by_uid, persons_by_identifier = self._get_persons_by_identifier(
+            session, emails=emails, usernames=usernames, uids=cached_uids.values()
+        )
+        new_values = [value for value in [*emails, *usernames] if value not in persons_by_identifier]
+        if new_values:
+            self._insert_persons(new_values, session=session)
+            _, new_persons_by_identifier = self._get_persons_by_identifier(
+                session,
+                emails=[value for value in new_values if "@" in value],
+                usernames=[value for value in new_values if "@" not in value],
             )
+            persons_by_identifier.update(new_persons_by_identifier)
+
+        result: Dict[str, Person] = {}
+        outdated_values: List[str] = []
+        for value in values:
+            if value in cached_uids:
+                if cached_uids[value] in persons_by_uid:
+                    result[value] = persons_by_uid[cached_uids[value]]
+                else:
+                    outdated_values.append(value)  # E.g. the person was merged with a duplicate in the meantime.
+            else:
+                result[value] = persons_by_identifier[value]
+        if outdated_values:
+            with self._person_uid_cache_lock:
+                for value in outdated_values:
+                    self._person_uid_cache.pop(value, None)
+            result.update(self._get_or_create_persons(outdated_values, session=session))
+        self._cache_person_uids(result)
+        return result
+
+    @staticmethod
+    def _get_event_key(on_call_event: OnCallEvent) -> _EventKey:
+        return on_call_event.start_event_utc, on_call_event.end_event_utc, on_call_event.person_uid
+
+    @staticmethod
+    def _get_v_event_key(v_event: VEvent, person: Person) -> _EventKey:
+        # A person that is not yet in the database has no uid, and thus never matches an existing event.
+        return (
+            dt_utils.convert_time_object_to_aware_datetime(v_event.start),
+            dt_utils.convert_time_object_to_aware_datetime(v_event.end),
+            person.uid,
+        )
 
     def _create_on_call_event(self, calendar: Calendar, v_event: VEvent, person: Person) -> OnCallEvent:
         return OnCallEvent(
@@ -78,29 +229,82 @@ class ICalPluginMixin:
             person=person,
         )
 
-    def sync_calendar(self, calendar: Calendar, session: SASession) -> Calendar:  # noqa: ARG002
+    @staticmethod
+    def _get_person_identifier(event: VEvent, event_prefix: str) -> str:
+        # First attempt attendee. If that is not set, we look at the title/summary of the event.
+        if event.attendee is not None and any(event.attendee):
+            email = (event.attendee[0].value or "").replace("mailto:", "")
+            if email:
+                return email
+        if event.summary is None or event.summary.value is None:
+            raise TypeError(f"Unexpected value for {event.summary=}.")  # Make Mypy happy :)
+        if not event.summary.value:
+            raise ValueError(f"{event.summary.value=} should not be None.")
+        return event.summary.value[len(event_prefix) :]
+
+    def sync_calendar(self, calendar: Calendar, session: SASession) -> Calendar:
         # We first make sure we can actually fetch the calendar
+        logger.info(f"Loading {calendar.icalendar_url}, this might take some time.")
+        is_reparse_due = self._is_reparse_due(calendar)
+        # When a re-parse is due, we need the full iCalendar. Hence, we don't make the request conditional.
+        headers = {} if is_reparse_due else self._get_conditional_request_headers(calendar)
+        with self._get_icalendar(calendar.icalendar_url, headers=headers) as response:
+            if response.status_code == requests.codes.not_modified:
+                logger.info(f"{calendar=} was not modified since the last time it was fetched.")
+                return calendar
+
+            # While streaming the response, we hash it and only hold on to the lines of the relevant events.
+            content_hash = hashlib.sha256()
+            lines = ical_prefilter.iter_unfolded_lines(
+                response.iter_content(chunk_size=self.ICALENDAR_CHUNK_SIZE),
+                encoding=self._get_encoding(response),
+                on_chunk=content_hash.update,
+            )
+            now, month_from_now = self._get_upcoming_month()
+            relevant_lines: List[str] = list(
+                ical_prefilter.prefilter_events(
+                    lines,
+                    window_start=now.date(),  # type: ignore[no-untyped-call]
+                    window_end=month_from_now.date(),  # type: ignore[no-untyped-call]
+                    event_prefix=calendar.event_prefix or "",
+                )
+            )
+            calendar.icalendar_etag = response.headers.get("ETag")
+            calendar.icalendar_last_modified = response.headers.get("Last-Modified")
+        if not is_reparse_due and content_hash.hexdigest() == calendar.icalendar_content_hash:
+            logger.info(f"The content of {calendar=} did not change since the last time it was parsed.")
+            return calendar
+
         parsed_events: List[VEvent]
-        parsed_events = self._get_events_for_upcoming_month(calendar.icalendar_url, calendar.event_prefix or "")
-
-        # Only when it was successfully fetched, we wipe the records.
-        calendar.events = []
-        event: VEvent
-        for event in parsed_events:
-            # First attempt attendee. If that is not set, we look at the title/summary of the event.
-            person_unique_identifier: Optional[str] = None
-            if event.attendee is not None and any(event.attendee):
-                person_unique_identifier = (event.attendee[0].value or "").replace("mailto:", "") or None
-            if person_unique_identifier is None:
-                if event.summary is None or event.summary.value is None:
-                    raise TypeError(f"Unexpected value for {event.summary=}.")  # Make Mypy happy :)
-                person_unique_identifier = event.summary.value
-                if not person_unique_identifier:
-                    raise ValueError(f"{event.summary.value=} should not be None.")
-                person_information_str: str = person_unique_identifier[len(calendar.event_prefix or "") :]
-            else:
-                person_information_str = person_unique_identifier
-            person: Person = self._get_or_create_person(person_information_str)
-            on_call_event: OnCallEvent = self._create_on_call_event(calendar, event, person)
-            calendar.events.append(on_call_event)
+        parsed_events = self._get_events_for_upcoming_month(
+            "\n".join(relevant_lines), calendar.event_prefix or "", window=(now, month_from_now)
+        )
+        calendar.icalendar_content_hash = content_hash.hexdigest()
+        calendar.events_parsed_utc = DateTime.utcnow()
+
+        # Only when it was successfully fetched, we reconcile the records. Events that did not change are kept as is.
+        existing_events: Dict[_EventKey, List[OnCallEvent]] = defaultdict(list)
+        for on_call_event in calendar.events:
+            existing_events[self._get_event_key(on_call_event)].append(on_call_event)
+        person_identifiers = [
+            self._get_person_identifier(event, calendar.event_prefix or "") for event in parsed_events
+        ]
+        persons = self._get_or_create_persons(person_identifiers, session=session)
+        events: List[OnCallEvent] = []
+        for event, person_identifier in zip(parsed_events, person_identifiers):
+            person = persons[person_identifier]
+            matching_events = existing_events.get(self._get_v_event_key(event, person))
+            events.append(
+                matching_events.pop() if matching_events else self._create_on_call_event(calendar, event, person)
+            )
+        # Events that already ended are no longer part of the parsed window. We keep those as history, which is pruned
+        # once it passes the event_retention_period of the plugin.
+        history = [
+            on_call_event
+            for unmatched_events in existing_events.values()
+            for on_call_event in unmatched_events
+            if on_call_event.end_event_utc <= now
+        ]
+        # The delete-orphan cascade deletes the remaining events, while only the new events are inserted.
+        calendar.events = events + history
         return calendar
@@ -3,6 +3,8 @@ import io
 import json
 import logging
 import os
+import threading
+import traceback
 from typing import (
     Any,
     ClassVar,
@@ -20,6 +22,8 @@ from sqlalchemy.orm import Session as SASession
 
 from duty_board.models.person import Person
 from duty_board.models.person_image import PersonImage
+from duty_board.plugin.helpers import image_helper
+from duty_board.plugin.helpers.image_store import ImageStore
 from duty_board.plugin.helpers.ldap_helper import LDAPBaseClient
 
 logger = logging.getLogger(__name__)
@@ -33,6 +37,16 @@ class LDAPPluginMixin:
     LDAP_GROUP_OU: ClassVar[Optional[str]] = "Groups"
     LDAP_ACCOUNT_ATTRIBUTE: ClassVar[str] = "uid"
     LDAP_GROUP_ATTRIBUTE: ClassVar[str] = "cn"
+    # The attributes fetched for every person. Extend this when you overwrite _get_extra_attributes().
+    # Remove jpegPhoto if you don't want to show the pictures of people, as it is by far the largest attribute.
+    LDAP_PERSON_ATTRIBUTES: ClassVar[Tuple[str, ...]] = ("mail", "cn", "l", "jpegPhoto")
+    # The images are also stored resized to these lengths of their shortest side, in each of these media types.
+    # This way, browsers only download what they actually display.
+    LDAP_IMAGE_SIZES: ClassVar[Tuple[int, ...]] = (100, 200, 400)
+    LDAP_IMAGE_MEDIA_TYPES: ClassVar[Tuple[str, ...]] = ("image/webp", "image/jpeg")
+    image_store: ClassVar[Optional[ImageStore]]  # Set by the AbstractPlugin.
+    # How many persons are looked up with a single LDAP search in sync_persons().
+    LDAP_SEARCH_BATCH_SIZE: ClassVar[int] = 50
     # Group would be cn=a_group,ou=Group,dc=example,dc=com
     # With the above config you'd have:
     # - Users -> `uid=abc,ou=People,dc=example,dc=com` = f'{ACCOUNT_ATTRIBUTE}=abc,ou={LDAP_USER_OU},{LDAP_BASE_DN}'.
@@ -45,7 +59,8 @@ class LDAPPluginMixin:
     LDAP_ADMIN_GROUP_NAMES: ClassVar[Tuple[str, ...]] = ("admin-unique-interface",)
 
     def __init__(self, *args: Any, **kwargs: Any):
-        self.client: Optional[LDAPBaseClient] = None
+        # A ldap3 Connection can't be shared between threads. Hence, every refresher thread binds its own connection.
+        self._thread_local_clients = threading.local()
         super().__init__(*args, **kwargs)
 
     def _create_ldap_client(self, full_quantified_username: str, password: str) -> LDAPBaseClient:
@@ -63,26 +78,30 @@ class LDAPPluginMixin:
         )
 
     def get_client(self) -> LDAPBaseClient:
-        if self.client is not None:
-            return self.client
-        self.client = self._create_ldap_client(
+        client: Optional[LDAPBaseClient] = getattr(self._thread_local_clients, "client", None)
+        if client is not None:
+            return client
+        client = self._create_ldap_client(
             full_quantified_username=os.environ["LDAP_FULL_QUANTIFIED_USERNAME"],
             password=os.environ["LDAP_PASSWORD"],
         )
-        return self.client
+        self._thread_local_clients.client = client
+        return client
 
     @staticmethod
     def _get_jpeg_photo_from_person(
         person_attributes: Mapping[str, Union[str, List[str]]],
-    ) -> Optional[Tuple[bytes, int, int]]:
-        if "jpegPhoto" not in person_attributes:
+    ) -> Optional[Tuple[bytes, str, int, int]]:
+        if not person_attributes.get("jpegPhoto"):  # Explicitly requested attributes are returned as [] when not set.
             return None
         img_as_b64: bytes = person_attributes["jpegPhoto"][0]  # type: ignore
         image = Image.open(io.BytesIO(img_as_b64))
-        return img_as_b64, image.width, image.height
+        return img_as_b64, image_helper.get_media_type(image), image.width, image.height
 
-    def _extract_user_info(self, username: str) -> Tuple[str, Mapping[str, Union[str, List[str]]]]:
-        result = self.get_client().get_user(username)
+    @staticmethod
+    def _get_single_user_info(
+        username: str, result: Optional[List[Tuple[str, Mapping[str, List[str]]]]]
+    ) -> Tuple[str, Mapping[str, Union[str, List[str]]]]:
         if not result:
             raise ValueError(f"Could not find user {username}.")
         if len(result) > 1:
@@ -91,6 +110,18 @@ class LDAPPluginMixin:
         dn, attributes = person_ldap_details
         return dn, attributes
 
+    def _extract_user_info(self, username: str) -> Tuple[str, Mapping[str, Union[str, List[str]]]]:
+        result = self.get_client().get_user(username, attributes=list(self.LDAP_PERSON_ATTRIBUTES))
+        return self._get_single_user_info(username, result)
+
+    @staticmethod
+    def _get_filter_string(person: Person) -> str:
+        filter_string: Optional[str] = person.username or person.email
+        if filter_string is None:
+            error_msg = f"It's not allowed to have both {person.username=} and {person.email=} be None."
+            raise ValueError(error_msg)
+        return filter_string
+
     def _get_extra_attributes(
         self,
         username: str,  # noqa: ARG002
@@ -109,22 +140,58 @@ class LDAPPluginMixin:
         }
 
     def sync_person(self, person: Person, session: SASession) -> Person:  # noqa: ARG002
-        filter_string: Optional[str] = person.username or person.email
-        if filter_string is None:
-            error_msg = f"It's not allowed to have both {person.username=} and {person.email=} be None."
-            raise ValueError(error_msg)
-        dn, attributes = self._extract_user_info(filter_string)
+        dn, attributes = self._extract_user_info(self._get_filter_string(person))
+        return self._update_person(person, dn, attributes)
+
+    def sync_persons(self, persons: List[Person], session: SASession) -> Dict[int, Optional[str]]:  # noqa: ARG002
+        """Looks up all persons with one LDAP search per LDAP_SEARCH_BATCH_SIZE persons."""
+        error_messages: Dict[int, Optional[str]] = {}
+        filter_strings: Dict[int, str] = {}
+        for person in persons:
+            try:
+                filter_strings[person.uid] = self._get_filter_string(person)
+            except ValueError:
+                error_messages[person.uid] = traceback.format_exc()
+
+        found_entries = self.get_client().get_users(
+            sorted(set(filter_strings.values())),
+            attributes=list(self.LDAP_PERSON_ATTRIBUTES),
+            chunk_size=self.LDAP_SEARCH_BATCH_SIZE,
+        )
+        for person in persons:
+            if person.uid not in filter_strings:
+                continue
+            filter_string = filter_strings[person.uid]
+            try:
+                dn, attributes = self._get_single_user_info(filter_string, found_entries[filter_string])
+                self._update_person(person, dn, attributes)
+                error_messages[person.uid] = None
+            except Exception:
+                logger.exception(f"Failed to update {person=}.")
+                error_messages[person.uid] = traceback.format_exc()
+        return error_messages
+
+    def _update_person(self, person: Person, dn: str, attributes: Mapping[str, Union[str, List[str]]]) -> Person:
         person.username = dn.split("=")[1].split(",")[0]  # uid=abc,ou= -> extracts abc
         person.email = attributes["mail"][0]
         person.extra_attributes_json = json.dumps(self._get_extra_attributes(person.username, attributes))
 
         image_result = self._get_jpeg_photo_from_person(attributes)
         if image_result:
-            image_in_bytes, width, height = image_result
+            image_in_bytes, media_type, width, height = image_result
+            content_hash = image_helper.get_content_hash(image_in_bytes)
             if person.image is None:
-                person.image = PersonImage(image_in_bytes=image_in_bytes)
-            else:
-                person.image.image_in_bytes = image_in_bytes
+                person.image = PersonImage()
+            if person.image.content_hash != content_hash:  # Only an image that changed needs new variants.
+                image_helper.store_content(person.image, image_in_bytes, image_store=self.image_store)
+                person.image.content_hash = content_hash
+                person.image.media_type = media_type
+                person.image.variants = image_helper.create_image_variants(
+                    image_in_bytes,
+                    sizes=self.LDAP_IMAGE_SIZES,
+                    media_types=self.LDAP_IMAGE_MEDIA_TYPES,
+                    image_store=self.image_store,
+                )
             person.img_width = width
             person.img_height = height
         logger.debug(f"Updating references of {person}.")
@@ -1,31 +1,44 @@
 import logging
 import os
 import sys
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Dict, Final, List, Set
+from typing import AsyncGenerator, Dict, Final, List, Literal, Optional, Set, Tuple, Union
 
 import pytz
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from pendulum.datetime import DateTime
 from prometheus_client import Gauge
 from prometheus_fastapi_instrumentator import Instrumentator
 from pytz.exceptions import UnknownTimeZoneError
 from pytz.tzinfo import BaseTzInfo
 from sqladmin import Admin
-from sqlalchemy import select, text
-from sqlalchemy.orm.session import Session as SASession
+from sqlalchemy import text
 from starlette import status
 from starlette.middleware.cors import CORSMiddleware
-from starlette.responses import FileResponse, HTMLResponse, JSONResponse, Response
+from starlette.responses import FileResponse, HTMLResponse, JSONResponse, Response, StreamingResponse
 from starlette.staticfiles import StaticFiles
 from tzlocal import get_localzone
 
-from duty_board.alchemy import add_sqladmin, api_queries
-from duty_board.alchemy.session import create_session
-from duty_board.models.person_image import PersonImage
+from duty_board.alchemy import add_sqladmin, api_queries, settings
+from duty_board.alchemy.change_feed import ChangeFeedListener
+from duty_board.alchemy.session import create_async_session
 from duty_board.plugin.abstract_plugin import AbstractPlugin
 from duty_board.plugin.helpers import plugin_fetcher
+from duty_board.web_helpers import response_compression, schedule_stream
 from duty_board.web_helpers.gzip_static_files import GZIPStaticFiles
-from duty_board.web_helpers.response_types import CurrentSchedule, PersonResponse, _Calendar, _Config, _PersonEssentials
+from duty_board.web_helpers.http_caching import create_etag, is_etag_match, make_weak_etag
+from duty_board.web_helpers.response_types import (
+    CompactSchedule,
+    CurrentSchedule,
+    PersonResponse,
+    PersonsResponse,
+    _Calendar,
+    _Config,
+    _PersonEssentials,
+)
+from duty_board.web_helpers.schedule_cache import ScheduleCache, ScheduleResponseCache, SerializedSchedule
+from duty_board.web_helpers.schedule_snapshot import ScheduleSnapshot
 
 logging.basicConfig(
     stream=sys.stdout,
@@ -35,7 +48,17 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncGenerator[None, None]:
+    change_feed_listener.start()
+    yield
+    change_feed_listener.stop()
+    # The asyncio connections are bound to the event loop, so we close them before the loop is gone.
+    await settings.get_async_engine().dispose()
+
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -53,12 +76,25 @@ calendar_events_gauge = Gauge("duty_events_per_calendar", "Currently planned eve
 
 
 CURRENT_DIR: Final[Path] = Path(__file__).absolute().parent
+MAX_PERSONS_PER_REQUEST: Final[int] = 500
 logger.info(f"{CURRENT_DIR=}")
 
 plugin: AbstractPlugin = plugin_fetcher.get_plugin()
+app.add_middleware(response_compression.CompressionMiddleware, minimum_size=plugin.response_compression_minimum_size)
 app.mount("/assets", GZIPStaticFiles(directory=CURRENT_DIR / "www" / "dist" / "assets", check_dir=False), name="assets")
 app.mount("/static", StaticFiles(directory=CURRENT_DIR / "www" / "static"), name="static")
 admin: Admin = add_sqladmin.add_sqladmin(app=app, plugin=plugin)
+# Started by the lifespan. Until then, or on databases without LISTEN, the caches poll for changes.
+change_feed_listener = ChangeFeedListener(engine=settings.engine)
+schedule_cache = ScheduleCache(
+    version_check_interval=plugin.interval_schedule_cache_version_check, change_feed_listener=change_feed_listener
+)
+schedule_response_cache: ScheduleResponseCache[CurrentSchedule] = ScheduleResponseCache(
+    max_size=plugin.schedule_response_cache_size
+)
+compact_schedule_response_cache: ScheduleResponseCache[CompactSchedule] = ScheduleResponseCache(
+    max_size=plugin.schedule_response_cache_size
+)
 
 
 def _parse_timezone_str(timezone_str: str) -> BaseTzInfo:
@@ -88,38 +124,185 @@ def collect_calendar_metrics(calendars: List[_Calendar]) -> None:
         calendar_events_gauge.labels(calendar.name).set(len(calendar.events))
 
 
-@app.get("/schedule", response_model=CurrentSchedule)
-async def get_schedule(timezone: str) -> CurrentSchedule:
-    timezone_object = _parse_timezone_str(timezone)
+def _serialize_schedule(snapshot: ScheduleSnapshot, timezone_object: BaseTzInfo) -> SerializedSchedule[CurrentSchedule]:
+    now = DateTime.utcnow()
     config = _get_config_object(timezone_object)
-    with create_session() as session:
-        all_encountered_person_uids: Set[int] = set()
-        calendars: List[_Calendar] = api_queries.get_calendars(
-            session=session,
-            all_encountered_person_uids=all_encountered_person_uids,
-            timezone=timezone_object,
-        )
-        collect_calendar_metrics(calendars=calendars)
-        persons: Dict[int, _PersonEssentials] = api_queries.get_peoples_essentials(
-            session=session,
-            all_person_uids=all_encountered_person_uids,
-        )
-        return CurrentSchedule(config=config, calendars=calendars, persons=persons)
+    all_encountered_person_uids: Set[int] = set()
+    calendars: List[_Calendar] = api_queries.get_calendars(
+        snapshot=snapshot,
+        all_encountered_person_uids=all_encountered_person_uids,
+        timezone=timezone_object,
+    )
+    collect_calendar_metrics(calendars=calendars)
+    persons: Dict[int, _PersonEssentials] = snapshot.get_persons(all_encountered_person_uids)
+    schedule = CurrentSchedule(config=config, calendars=calendars, persons=persons)
+    body = schedule.model_dump_json().encode()
+    return SerializedSchedule(
+        version=snapshot.version,
+        schedule=schedule,
+        body=body,
+        etag=create_etag(body),
+        valid_until_utc=snapshot.get_next_expiry(now),
+    )
+
+
+def _serialize_compact_schedule(
+    snapshot: ScheduleSnapshot, timezone_object: BaseTzInfo
+) -> SerializedSchedule[CompactSchedule]:
+    now = DateTime.utcnow()
+    person_idx_per_uid: Dict[int, int] = {}
+    calendars = api_queries.get_compact_calendars(snapshot=snapshot, person_idx_per_uid=person_idx_per_uid, now=now)
+    persons = [
+        snapshot.persons.get(person_uid, _PersonEssentials(uid=person_uid, username=None, email=None))
+        for person_uid in person_idx_per_uid
+    ]
+    schedule = CompactSchedule(config=_get_config_object(timezone_object), calendars=calendars, persons=persons)
+    body = schedule.model_dump_json().encode()
+    return SerializedSchedule(
+        version=snapshot.version,
+        schedule=schedule,
+        body=body,
+        etag=create_etag(body),
+        valid_until_utc=snapshot.get_next_expiry(now),
+    )
+
+
+async def _get_serialized_schedule(timezone_object: BaseTzInfo) -> SerializedSchedule[CurrentSchedule]:
+    snapshot = await schedule_cache.get_snapshot()
+    timezone_str = str(timezone_object)
+    serialized_schedule = schedule_response_cache.get(timezone_str, version=snapshot.version, now=DateTime.utcnow())
+    if serialized_schedule is None:
+        serialized_schedule = _serialize_schedule(snapshot=snapshot, timezone_object=timezone_object)
+        schedule_response_cache.put(timezone_str, serialized_schedule)
+    return serialized_schedule
+
+
+async def _get_serialized_compact_schedule(timezone_object: BaseTzInfo) -> SerializedSchedule[CompactSchedule]:
+    snapshot = await schedule_cache.get_snapshot()
+    timezone_str = str(timezone_object)
+    serialized_schedule = compact_schedule_response_cache.get(
+        timezone_str, version=snapshot.version, now=DateTime.utcnow()
+    )
+    if serialized_schedule is None:
+        serialized_schedule = _serialize_compact_schedule(snapshot=snapshot, timezone_object=timezone_object)
+        compact_schedule_response_cache.put(timezone_str, serialized_schedule)
+    return serialized_schedule
+
+
+@app.get("/schedule", response_model=Union[CurrentSchedule, CompactSchedule])
+async def get_schedule(
+    timezone: str,
+    format: Literal["default", "compact"] = Query(
+        default="default", description="The compact format has epoch timestamps, which the client has to format."
+    ),
+    if_none_match: Optional[str] = Header(default=None),
+    accept_encoding: str = Header(default=""),
+) -> Response:
+    timezone_object = _parse_timezone_str(timezone)
+    serialized_schedule: Union[SerializedSchedule[CurrentSchedule], SerializedSchedule[CompactSchedule]]
+    if format == "compact":
+        serialized_schedule = await _get_serialized_compact_schedule(timezone_object)
+    else:
+        serialized_schedule = await _get_serialized_schedule(timezone_object)
+    # no-cache makes sure clients always revalidate, which is cheap thanks to the ETag.
+    headers = {"ETag": serialized_schedule.etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    body = serialized_schedule.body
+    encoding = response_compression.choose_encoding(accept_encoding)
+    if encoding is not None and len(body) >= plugin.response_compression_minimum_size:
+        # Compressed here instead of by the CompressionMiddleware, so we only compress once per data version.
+        body = serialized_schedule.get_compressed_body(encoding)
+        headers.update({"ETag": make_weak_etag(serialized_schedule.etag), "Content-Encoding": encoding})
+    if is_etag_match(if_none_match, serialized_schedule.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@app.get(
+    "/schedule/stream",
+    response_class=StreamingResponse,
+    responses={200: {"description": "A `snapshot` event with the CurrentSchedule followed by `delta` events."}},
+)
+async def stream_schedule(request: Request, timezone: str) -> StreamingResponse:
+    timezone_object = _parse_timezone_str(timezone)
+    events = schedule_stream.stream_schedule(
+        get_serialized_schedule=lambda: _get_serialized_schedule(timezone_object),
+        is_disconnected=request.is_disconnected,
+        poll_interval=plugin.interval_schedule_cache_version_check,
+        heartbeat_interval=plugin.interval_schedule_stream_heartbeat,
+        change_feed_listener=change_feed_listener,
+    )
+    # X-Accel-Buffering disables response buffering in Nginx, which would otherwise hold back our events.
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(events, media_type="text/event-stream", headers=headers)
 
 
 @app.get("/person", response_model=PersonResponse)
 async def get_person(person_uid: int, timezone: str) -> PersonResponse:
     timezone_object = _parse_timezone_str(timezone)
-    with create_session() as session:
-        return api_queries.get_person(session=session, person_uid=person_uid, timezone=timezone_object)
+    async with create_async_session() as session:
+        return await api_queries.get_person(session=session, person_uid=person_uid, timezone=timezone_object)
 
 
-@app.get("/person_img/{person_uid:int}", responses={200: {"content": {"image/png": {}}}}, response_class=Response)
-async def get_person_image(person_uid: int) -> Response:
-    session: SASession
-    with create_session() as session:
-        person_image: PersonImage = session.scalars(select(PersonImage).where(PersonImage.uid == person_uid)).one()
-        return Response(content=person_image.image_in_bytes, media_type="image/jpeg")
+@app.get("/persons", response_model=PersonsResponse)
+async def get_persons(
+    timezone: str,
+    person_uids: Tuple[int, ...] = Query(default=()),
+    thumbnail_size: Optional[int] = Query(
+        default=None, gt=0, description="Include thumbnails with at least this length as shortest side."
+    ),
+) -> PersonsResponse:
+    """Returns all requested persons at once, so the frontend can prefetch everyone on the schedule."""
+    if len(person_uids) > MAX_PERSONS_PER_REQUEST:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"At most {MAX_PERSONS_PER_REQUEST} persons can be requested at once.",
+        )
+    timezone_object = _parse_timezone_str(timezone)
+    async with create_async_session() as session:
+        return await api_queries.get_persons(
+            session=session,
+            person_uids=person_uids,
+            timezone=timezone_object,
+            thumbnail_size=thumbnail_size,
+            image_store=plugin.image_store,
+        )
+
+
+@app.get(
+    "/person_img/{person_uid:int}",
+    responses={200: {"content": {"image/jpeg": {}, "image/png": {}, "image/webp": {}}}, 304: {}},
+    response_class=Response,
+)
+async def get_person_image(
+    person_uid: int,
+    size: Optional[int] = Query(default=None, gt=0, description="The minimal length of the shortest side."),
+    format: Optional[Literal["webp", "jpeg"]] = Query(default=None, description="Only used together with size."),
+    v: Optional[str] = Query(default=None, description="The img_content_hash of the person, to version the URL."),
+    if_none_match: Optional[str] = Header(default=None),
+) -> Response:
+    async with create_async_session() as session:
+        person_image = await api_queries.get_person_image(
+            session=session,
+            person_image_uid=person_uid,
+            size=size,
+            media_type=f"image/{format or 'jpeg'}" if size is not None else None,
+        )
+    if v is not None and v == person_image.image_content_hash:
+        # A new image gets a new hash, and thus a new URL. So this URL always returns the same content.
+        cache_control = "public, max-age=31536000, immutable"
+    else:
+        cache_control = "no-cache"
+    etag = f'"{person_image.content_hash}"'
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if is_etag_match(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if person_image.storage_key is not None:
+        if plugin.image_store is None:
+            raise RuntimeError("The image is stored in an ImageStore, but the plugin has no image_store configured.")
+        # Served straight from disk, with sendfile if the server supports it.
+        path = plugin.image_store.get_path(person_image.storage_key)
+        return FileResponse(path, media_type=person_image.media_type, headers=headers)
+    return Response(content=person_image.content, media_type=person_image.media_type, headers=headers)
 
 
 @app.get(
@@ -153,10 +336,10 @@ def favicon_ico() -> FileResponse:
     status_code=status.HTTP_200_OK,
     response_model=None,
 )
-def get_health() -> JSONResponse:
+async def get_health() -> JSONResponse:
     try:
-        with create_session() as session:
-            session.execute(text("SELECT 1"))
+        async with create_async_session() as session:
+            await session.execute(text("SELECT 1"))
             return JSONResponse(content={"result": "OK", "error": None}, status_code=status.HTTP_200_OK)
     except Exception as exc:
         return JSONResponse(
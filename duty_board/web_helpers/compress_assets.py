@@ -0,0 +1,53 @@
+import gzip
+import logging
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Images and fonts are already compressed, so compressing those again only costs CPU.
+COMPRESSIBLE_SUFFIXES = {".js", ".mjs", ".css", ".html", ".svg", ".json", ".map", ".txt", ".xml", ".ico"}
+# Below this size, the headers of the response are larger than what compression saves.
+MIN_SIZE_IN_BYTES = 1024
+
+
+def _get_compressors() -> Dict[str, Callable[[bytes], bytes]]:
+    """Returns the compressor per suffix of the precompressed file. Brotli and zstd need the compression extra."""
+    compressors: Dict[str, Callable[[bytes], bytes]] = {".gz": lambda content: gzip.compress(content, mtime=0)}
+    try:
+        import brotli
+
+        compressors[".br"] = lambda content: brotli.compress(content, quality=11)
+    except ImportError:
+        logger.warning("Not creating .br files, as brotli is not installed. Install duty-board[compression].")
+    try:
+        import zstandard
+
+        compressors[".zst"] = zstandard.ZstdCompressor(level=19).compress
+    except ImportError:
+        logger.warning("Not creating .zst files, as zstandard is not installed. Install duty-board[compression].")
+    return compressors
+
+
+def compress_assets(directory: Path, compressors: Optional[Dict[str, Callable[[bytes], bytes]]] = None) -> List[Path]:
+    """
+    Writes a precompressed sibling of every compressible file in the directory, which GZIPStaticFiles serves to clients
+    that accept it. A sibling that would not be smaller than the original is not written. Returns the written files.
+    """
+    if compressors is None:
+        compressors = _get_compressors()
+    written: List[Path] = []
+    for path in sorted(directory.rglob("*")):
+        if not path.is_file() or path.suffix not in COMPRESSIBLE_SUFFIXES or path.stat().st_size < MIN_SIZE_IN_BYTES:
+            continue
+        content = path.read_bytes()
+        for suffix, compress in compressors.items():
+            compressed_path = path.with_name(path.name + suffix)
+            compressed = compress(content)
+            if len(compressed) >= len(content):
+                compressed_path.unlink(missing_ok=True)  # An outdated one should not be served either.
+                continue
+            compressed_path.write_bytes(compressed)
+            written.append(compressed_path)
+    logger.info(f"Wrote {len(written)} precompressed files in {directory}.")
+    return written
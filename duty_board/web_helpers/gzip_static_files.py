@@ -1,5 +1,9 @@
+import mimetypes
 import os
+import re
+import threading
 import typing
+from collections import OrderedDict
 from pathlib import Path
 
 from starlette.datastructures import Headers
@@ -9,9 +13,73 @@ from starlette.types import Scope
 
 PathLike = typing.Union[str, "os.PathLike[str]"]
 
+# The content-codings we serve precompressed siblings for, in order of preference, with the suffix of the sibling.
+PRECOMPRESSED_SUFFIX_PER_ENCODING: typing.Dict[str, str] = {"br": ".br", "zstd": ".zst", "gzip": ".gz"}
+# Vite adds a hash of the content to the name of every asset, like `index-4f3a2b1c.js`. So those never change.
+_HASHED_ASSET_NAME = re.compile(r"-[A-Za-z0-9_-]{8}\.[A-Za-z0-9]+$")
+_IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# The original file, its size and its modification time. If the original changes, so does the key.
+_StatCacheKey = typing.Tuple[str, int, int]
+_PRECOMPRESSED_ENCODINGS_CACHE_SIZE = 1024
+
+
+def get_accepted_encodings(accept_encoding: str) -> typing.Set[str]:
+    """Returns the content-codings of an Accept-Encoding header that are not refused with q=0."""
+    accepted: typing.Set[str] = set()
+    refused: typing.Set[str] = set()
+    for coding_with_params in accept_encoding.split(","):
+        coding, *params = (part.strip() for part in coding_with_params.split(";"))
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            (accepted if quality > 0 else refused).add(coding.lower())
+    if "*" in accepted:
+        accepted.update(encoding for encoding in PRECOMPRESSED_SUFFIX_PER_ENCODING if encoding not in refused)
+    return accepted
+
 
 class GZIPStaticFiles(StaticFiles):
-    """90% is inherited and copied from StaticFiles. We just overwrite this method for GZIP compatibility."""
+    """
+    90% is inherited and copied from StaticFiles. We overwrite file_response to serve the precompressed `.br`, `.zst` or
+    `.gz` sibling of a file, if the client accepts that encoding. Those are generated with `DutyBoard compress-assets`.
+    Which siblings exist is cached per version of the original file, so a hit only costs a stat of the file and of the
+    sibling that is served.
+    """
+
+    def __init__(self, *args: typing.Any, **kwargs: typing.Any):
+        super().__init__(*args, **kwargs)
+        self._precompressed_encodings_cache: "OrderedDict[_StatCacheKey, typing.Tuple[str, ...]]" = OrderedDict()
+        self._precompressed_encodings_cache_lock = threading.Lock()
+
+    def _get_precompressed_encodings(self, full_path: PathLike, stat_result: os.stat_result) -> typing.Tuple[str, ...]:
+        """Returns the encodings for which the file has a precompressed sibling, in order of preference."""
+        key: _StatCacheKey = (os.fspath(full_path), stat_result.st_size, stat_result.st_mtime_ns)
+        with self._precompressed_encodings_cache_lock:
+            if key in self._precompressed_encodings_cache:
+                self._precompressed_encodings_cache.move_to_end(key)
+                return self._precompressed_encodings_cache[key]
+        encodings = tuple(
+            encoding
+            for encoding, suffix in PRECOMPRESSED_SUFFIX_PER_ENCODING.items()
+            if Path(os.fspath(full_path) + suffix).is_file()
+        )
+        with self._precompressed_encodings_cache_lock:
+            self._precompressed_encodings_cache[key] = encodings
+            if len(self._precompressed_encodings_cache) > _PRECOMPRESSED_ENCODINGS_CACHE_SIZE:
+                self._precompressed_encodings_cache.popitem(last=False)
+        return encodings
+
+    def _forget_precompressed_encodings(self, full_path: PathLike, stat_result: os.stat_result) -> None:
+        key: _StatCacheKey = (os.fspath(full_path), stat_result.st_size, stat_result.st_mtime_ns)
+        with self._precompressed_encodings_cache_lock:
+            self._precompressed_encodings_cache.pop(key, None)
 
     def file_response(
         self,
@@ -23,19 +91,42 @@ class GZIPStaticFiles(StaticFiles):
         method = scope["method"]
         request_headers = Headers(scope=scope)
 
-        pathlib_path = Path(full_path)
-        pathlib_path_gz = pathlib_path.parent / f"{pathlib_path.name}.gz"
-        if pathlib_path_gz.exists():
-            gzip_headers = {"content-encoding": "gzip"}
+        headers: typing.Dict[str, str] = {}
+        if _HASHED_ASSET_NAME.search(Path(full_path).name):
+            headers["cache-control"] = _IMMUTABLE_CACHE_CONTROL
+        precompressed_encodings = self._get_precompressed_encodings(full_path, stat_result)
+        if precompressed_encodings:
+            headers["vary"] = "Accept-Encoding"
+        accepted_encodings = get_accepted_encodings(request_headers.get("accept-encoding", ""))
+        encoding: typing.Optional[str] = None
+        for precompressed_encoding in precompressed_encodings:
+            if precompressed_encoding not in accepted_encodings:
+                continue
+            try:
+                # Always a fresh stat, as `DutyBoard compress-assets` can rewrite the sibling of an unchanged file.
+                precompressed_stat_result = Path(
+                    os.fspath(full_path) + PRECOMPRESSED_SUFFIX_PER_ENCODING[precompressed_encoding]
+                ).stat()
+            except FileNotFoundError:
+                self._forget_precompressed_encodings(full_path, stat_result)
+                continue
+            encoding = precompressed_encoding
+            break
+        if encoding is not None:
+            headers["content-encoding"] = encoding
             response = FileResponse(
-                str(full_path) + ".gz",
+                os.fspath(full_path) + PRECOMPRESSED_SUFFIX_PER_ENCODING[encoding],
                 status_code=status_code,
-                stat_result=pathlib_path_gz.stat(),
+                stat_result=precompressed_stat_result,
                 method=method,
-                headers=gzip_headers,
+                headers=headers,
+                # The media type of the original file, not of the compressed one.
+                media_type=mimetypes.guess_type(os.fspath(full_path))[0] or "text/plain",
             )
         else:
-            response = FileResponse(full_path, status_code=status_code, stat_result=stat_result, method=method)
+            response = FileResponse(
+                full_path, status_code=status_code, stat_result=stat_result, method=method, headers=headers
+            )
         if self.is_not_modified(response.headers, request_headers):
             return NotModifiedResponse(response.headers)
         return response
@@ -0,0 +1,27 @@
+import hashlib
+from typing import Optional
+
+
+def create_etag(body: bytes) -> str:
+    """Creates a strong ETag based on the content of the response."""
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def make_weak_etag(etag: str) -> str:
+    """A compressed response is only semantically equivalent to the original, so it can only share a weak ETag."""
+    return etag if etag.startswith("W/") else f"W/{etag}"
+
+
+def _strip_weak_indicator(etag: str) -> str:
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def is_etag_match(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether the value of an `If-None-Match` header matches our ETag. Uses weak comparison as described in RFC 9110."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        _strip_weak_indicator(value.strip()) == _strip_weak_indicator(etag) for value in if_none_match.split(",")
+    )
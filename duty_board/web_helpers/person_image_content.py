@@ -0,0 +1,15 @@
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class PersonImageContent(BaseModel):
+    """The image or one of its variants that is served, with what is needed to cache it."""
+
+    # Either the content is in the database, or it is stored in the ImageStore of the plugin under the storage_key.
+    content: Optional[bytes]
+    storage_key: Optional[str]
+    media_type: str
+    content_hash: str
+    # The hash of the original image, which versions the URLs of the image and all its variants.
+    image_content_hash: Optional[str]
@@ -0,0 +1,99 @@
+import gzip
+import logging
+from typing import Callable, Dict, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from duty_board.web_helpers.gzip_static_files import get_accepted_encodings
+from duty_board.web_helpers.http_caching import make_weak_etag
+
+logger = logging.getLogger(__name__)
+
+# Event streams are flushed per event, and images are already compressed.
+_COMPRESSIBLE_MEDIA_TYPES = {"application/json", "application/javascript", "image/svg+xml"}
+
+
+def _get_compressors() -> Dict[str, Callable[[bytes], bytes]]:
+    """Returns the compressor per content-coding, in order of preference. Brotli needs the compression extra."""
+    compressors: Dict[str, Callable[[bytes], bytes]] = {}
+    try:
+        import brotli
+
+        # Responses are compressed while the client waits, so we prefer a fast quality over the smallest result.
+        compressors["br"] = lambda body: brotli.compress(body, quality=5)
+    except ImportError:
+        logger.info("Only compressing responses with gzip, as brotli is not installed.")
+    compressors["gzip"] = lambda body: gzip.compress(body, compresslevel=6, mtime=0)
+    return compressors
+
+
+COMPRESSOR_PER_ENCODING: Dict[str, Callable[[bytes], bytes]] = _get_compressors()
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Returns the content-coding we prefer of the ones the client accepts, or None to send the response as is."""
+    accepted_encodings = get_accepted_encodings(accept_encoding)
+    return next((encoding for encoding in COMPRESSOR_PER_ENCODING if encoding in accepted_encodings), None)
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    return COMPRESSOR_PER_ENCODING[encoding](body)
+
+
+def is_compressible(content_type: str) -> bool:
+    media_type = content_type.split(";")[0].strip().lower()
+    if media_type == "text/event-stream":
+        return False
+    return media_type.startswith("text/") or media_type in _COMPRESSIBLE_MEDIA_TYPES
+
+
+class CompressionMiddleware:
+    """
+    Compresses responses of at least minimum_size bytes with the best content-coding the client accepts.
+    Only responses that are sent in a single message are compressed, so streamed responses like the event stream of the
+    schedule pass through untouched. As do responses that already have a Content-Encoding, like the precompressed static
+    files and the /schedule response, which caches its compressed bodies itself.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        start_message: Optional[Message] = None
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message  # We can only decide on the headers once we have seen the body.
+                return
+            if start_message is None:  # The headers were sent already, so this is a next part of the body.
+                await send(message)
+                return
+            if message["type"] != "http.response.body":  # E.g. a file response that the server sends by itself.
+                await send(start_message)
+                start_message = None
+                await send(message)
+                return
+            headers = MutableHeaders(raw=start_message["headers"])
+            body: bytes = message.get("body", b"")
+            if "content-encoding" not in headers and is_compressible(headers.get("content-type", "")):
+                if "accept-encoding" not in headers.get("vary", "").lower():
+                    headers.add_vary_header("Accept-Encoding")
+                if encoding is not None and not message.get("more_body", False) and len(body) >= self.minimum_size:
+                    body = compress(body, encoding)
+                    headers["content-encoding"] = encoding
+                    headers["content-length"] = str(len(body))
+                    if "etag" in headers:  # The compressed body is another representation of the same content.
+                        headers["etag"] = make_weak_etag(headers["etag"])
+                    message = {**message, "body": body}
+            await send(start_message)
+            start_message = None
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
@@ -46,6 +46,38 @@ class CurrentSchedule(BaseModel):
     persons: Dict[int, _PersonEssentials]
 
 
+class _CompactCalendar(BaseModel):
+    uid: str
+    name: str
+    description: Optional[str]
+    category: str
+    order: int
+    # Seconds since the epoch, the browser formats those in its own timezone.
+    last_update: int
+    error_msg: str
+    sync: bool
+    # The events as columns, ordered by start. Event i is from starts[i] till ends[i], for persons[person_idx[i]].
+    starts: List[int]
+    ends: List[int]
+    person_idx: List[int]
+
+
+class CompactSchedule(BaseModel):
+    """The CurrentSchedule with epoch timestamps instead of formatted ones, and every person only listed once."""
+
+    config: _Config
+    calendars: List[_CompactCalendar]
+    persons: List[_PersonEssentials]
+
+
+class ScheduleDelta(BaseModel):
+    """The changes to a CurrentSchedule that was sent before. Calendars and persons are sent in full once changed."""
+
+    calendars: List[_Calendar]
+    removed_calendar_uids: List[str]
+    persons: Dict[int, _PersonEssentials]
+
+
 class _ExtraInfoOnPerson(BaseModel):
     information: str
     icon: str
@@ -58,9 +90,17 @@ class PersonResponse(BaseModel):
     username: Optional[str]
     email: Optional[str]
     img_filename: Optional[str]
+    # Versions the URL of the image, so it can be cached forever.
+    img_content_hash: Optional[str]
     img_width: Optional[int]
     img_height: Optional[int]
     extra_attributes: List[_ExtraInfoOnPerson]
     last_update: str
     error_msg: str
     sync: bool
+
+
+class PersonsResponse(BaseModel):
+    persons: Dict[int, PersonResponse]
+    # Data URIs of small thumbnails of the images of the persons, if these were requested.
+    thumbnails: Dict[int, str]
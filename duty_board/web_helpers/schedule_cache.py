@@ -0,0 +1,129 @@
+import asyncio
+import datetime
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Generic, Optional, Tuple, TypeVar
+
+from pydantic import BaseModel, Field
+
+from duty_board.alchemy import api_queries, data_version
+from duty_board.alchemy.change_feed import ChangeFeedListener
+from duty_board.alchemy.session import create_async_session
+from duty_board.web_helpers import response_compression
+from duty_board.web_helpers.schedule_snapshot import ScheduleSnapshot
+
+logger = logging.getLogger(__name__)
+
+# The model of the schedule in the response, e.g. the CurrentSchedule or the CompactSchedule.
+ScheduleT = TypeVar("ScheduleT", bound=BaseModel)
+
+
+class ScheduleCache:
+    """
+    Keeps the most recent ScheduleSnapshot in memory.
+    The snapshot is only rebuilt once the schedule data version in the database changes. To avoid a database round-trip
+    per request, the version itself is checked at most once per `version_check_interval`. Or, if the change_feed_listener
+    is listening, only once the schedule data version is notified.
+    """
+
+    def __init__(
+        self, version_check_interval: datetime.timedelta, change_feed_listener: Optional[ChangeFeedListener] = None
+    ):
+        self.version_check_interval: float = version_check_interval.total_seconds()
+        self.change_feed_listener = change_feed_listener
+        self._snapshot: Optional[ScheduleSnapshot] = None
+        self._last_version_check: float = 0.0
+        self._last_version_check_generation: Optional[int] = None
+        # Created within the event loop that uses it, as an asyncio.Lock is bound to a single event loop.
+        self._lock: Optional[asyncio.Lock] = None
+        self._lock_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock_loop is not loop:
+            self._lock, self._lock_loop = asyncio.Lock(), loop
+        return self._lock
+
+    def _get_generation(self) -> Optional[int]:
+        if self.change_feed_listener is None or not self.change_feed_listener.is_listening:
+            return None
+        return self.change_feed_listener.get_generation(data_version.SCHEDULE_DATA_VERSION)
+
+    def _is_fresh(self) -> bool:
+        if self._snapshot is None:
+            return False
+        generation = self._get_generation()
+        if generation is not None:  # The version can only have changed if it was notified.
+            return generation == self._last_version_check_generation
+        return time.monotonic() - self._last_version_check < self.version_check_interval
+
+    async def get_snapshot(self) -> ScheduleSnapshot:
+        snapshot = self._snapshot
+        if snapshot is not None and self._is_fresh():
+            return snapshot
+
+        async with self._get_lock():
+            if self._snapshot is not None and self._is_fresh():  # Another request might have refreshed it already.
+                return self._snapshot
+            generation = self._get_generation()  # Taken before the check, so we never miss a notification.
+            async with create_async_session() as session:
+                # The version must be read before the data. Otherwise, we could store old data under a new version.
+                version = await session.run_sync(data_version.get_data_version)
+                if self._snapshot is None or self._snapshot.version != version:
+                    logger.info(f"Building a new schedule snapshot for {version=}.")
+                    self._snapshot = await api_queries.get_schedule_snapshot(session=session, version=version)
+            self._last_version_check, self._last_version_check_generation = time.monotonic(), generation
+            return self._snapshot
+
+    def invalidate(self) -> None:
+        self._snapshot = None
+
+
+class SerializedSchedule(BaseModel, Generic[ScheduleT]):
+    version: int
+    schedule: ScheduleT
+    body: bytes
+    etag: str
+    # The rendered schedule filters out events that have ended. Hence, it is only valid until the next event ends.
+    valid_until_utc: Optional[datetime.datetime]
+    # The body compressed per content-coding, so every version is only compressed once per coding.
+    compressed_bodies: Dict[str, bytes] = Field(default_factory=dict)
+
+    def is_valid(self, version: int, now: datetime.datetime) -> bool:
+        return self.version == version and (self.valid_until_utc is None or now <= self.valid_until_utc)
+
+    def get_compressed_body(self, encoding: str) -> bytes:
+        # Two requests might compress it at the same time, but then both get the same result.
+        if encoding not in self.compressed_bodies:
+            self.compressed_bodies[encoding] = response_compression.compress(self.body, encoding)
+        return self.compressed_bodies[encoding]
+
+
+class ScheduleResponseCache(Generic[ScheduleT]):
+    """A bounded LRU of fully serialized /schedule responses, keyed by (timezone, data version)."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._responses: OrderedDict[Tuple[str, int], SerializedSchedule[ScheduleT]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, timezone: str, version: int, now: datetime.datetime) -> Optional[SerializedSchedule[ScheduleT]]:
+        key = (timezone, version)
+        with self._lock:
+            serialized_schedule = self._responses.get(key)
+            if serialized_schedule is None:
+                return None
+            if not serialized_schedule.is_valid(version=version, now=now):
+                del self._responses[key]
+                return None
+            self._responses.move_to_end(key)
+            return serialized_schedule
+
+    def put(self, timezone: str, serialized_schedule: SerializedSchedule[ScheduleT]) -> None:
+        with self._lock:
+            self._responses[(timezone, serialized_schedule.version)] = serialized_schedule
+            self._responses.move_to_end((timezone, serialized_schedule.version))
+            while len(self._responses) > self.max_size:
+                self._responses.popitem(last=False)
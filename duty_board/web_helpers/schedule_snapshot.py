@@ -0,0 +1,48 @@
+import datetime
+from typing import Dict, Iterable, List, Optional
+
+from pydantic import BaseModel
+
+from duty_board.web_helpers.response_types import _PersonEssentials
+
+
+class _SnapshotEvent(BaseModel):
+    start_event_utc: datetime.datetime
+    end_event_utc: datetime.datetime
+    person_uid: int
+
+
+class _SnapshotCalendar(BaseModel):
+    uid: str
+    name: str
+    description: Optional[str]
+    category: str
+    order: int
+    last_update_utc: datetime.datetime
+    error_msg: str
+    sync: bool
+    # Ordered by start_event_utc.
+    events: List[_SnapshotEvent]
+
+
+class ScheduleSnapshot(BaseModel):
+    """Everything required to render the schedule, stored in UTC so that it can be shared across all timezones."""
+
+    version: int
+    calendars: List[_SnapshotCalendar]
+    persons: Dict[int, _PersonEssentials]
+
+    def get_persons(self, person_uids: Iterable[int]) -> Dict[int, _PersonEssentials]:
+        return {uid: self.persons[uid] for uid in person_uids if uid in self.persons}
+
+    def get_next_expiry(self, now: datetime.datetime) -> Optional[datetime.datetime]:
+        """The first moment after which an event is no longer part of the schedule, and thus the rendering changes."""
+        return min(
+            (
+                event.end_event_utc
+                for calendar in self.calendars
+                for event in calendar.events
+                if event.end_event_utc >= now
+            ),
+            default=None,
+        )
@@ -0,0 +1,69 @@
+import asyncio
+import datetime
+import time
+from typing import AsyncGenerator, Awaitable, Callable, Optional
+
+from pendulum.datetime import DateTime
+
+from duty_board.alchemy.change_feed import ChangeFeedListener
+from duty_board.alchemy.data_version import SCHEDULE_DATA_VERSION
+from duty_board.web_helpers.response_types import CurrentSchedule, ScheduleDelta
+from duty_board.web_helpers.schedule_cache import SerializedSchedule
+
+
+def compute_schedule_delta(previous: CurrentSchedule, current: CurrentSchedule) -> Optional[ScheduleDelta]:
+    """Returns the calendars and persons that were added or changed, or None if nothing changed."""
+    previous_calendars = {calendar.uid: calendar for calendar in previous.calendars}
+    current_calendar_uids = {calendar.uid for calendar in current.calendars}
+    delta = ScheduleDelta(
+        calendars=[calendar for calendar in current.calendars if previous_calendars.get(calendar.uid) != calendar],
+        removed_calendar_uids=[uid for uid in previous_calendars if uid not in current_calendar_uids],
+        persons={uid: person for uid, person in current.persons.items() if previous.persons.get(uid) != person},
+    )
+    if not delta.calendars and not delta.removed_calendar_uids and not delta.persons:
+        return None
+    return delta
+
+
+def format_server_sent_event(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+async def stream_schedule(
+    get_serialized_schedule: Callable[[], Awaitable[SerializedSchedule[CurrentSchedule]]],
+    is_disconnected: Callable[[], Awaitable[bool]],
+    poll_interval: datetime.timedelta,
+    heartbeat_interval: datetime.timedelta,
+    change_feed_listener: Optional[ChangeFeedListener] = None,
+) -> AsyncGenerator[str, None]:
+    """
+    Sends the full schedule once, followed by a delta whenever the schedule changes.
+    Checking for changes is cheap, as get_serialized_schedule is served from memory until the data version changes.
+    If the change_feed_listener is listening, we don't poll but wait for a notification, a heartbeat or until the
+    schedule expires. Whichever comes first.
+    """
+    generations = change_feed_listener.get_generations() if change_feed_listener is not None else {}
+    serialized_schedule = await get_serialized_schedule()
+    yield format_server_sent_event("snapshot", serialized_schedule.body.decode())
+    last_sent = time.monotonic()
+    while not await is_disconnected():
+        if change_feed_listener is not None and change_feed_listener.is_listening:
+            timeout = heartbeat_interval.total_seconds() - (time.monotonic() - last_sent)
+            if serialized_schedule.valid_until_utc is not None:
+                timeout = min(timeout, (serialized_schedule.valid_until_utc - DateTime.utcnow()).total_seconds())
+            await change_feed_listener.wait_async([SCHEDULE_DATA_VERSION], timeout=timeout, since=generations)
+            generations = change_feed_listener.get_generations()
+        else:
+            await asyncio.sleep(poll_interval.total_seconds())
+        latest_serialized_schedule = await get_serialized_schedule()
+        if latest_serialized_schedule.etag != serialized_schedule.etag:
+            delta = compute_schedule_delta(serialized_schedule.schedule, latest_serialized_schedule.schedule)
+            serialized_schedule = latest_serialized_schedule
+            if delta is not None:
+                yield format_server_sent_event("delta", delta.model_dump_json())
+                last_sent = time.monotonic()
+                continue
+        if time.monotonic() - last_sent >= heartbeat_interval.total_seconds():
+            # Lines starting with a colon are comments, which are ignored by the EventSource in the browser.
+            yield ": heartbeat\n\n"
+            last_sent = time.monotonic()
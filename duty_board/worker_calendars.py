@@ -1,14 +1,15 @@
 import logging
-import time
 import traceback
+from concurrent.futures import FIRST_EXCEPTION, Future, ThreadPoolExecutor, wait
 from datetime import datetime, timezone
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple
 
 from pendulum.datetime import DateTime
 from prometheus_client import Counter, Gauge
 from sqlalchemy import Select, func, select
 from sqlalchemy.orm import Session as SASession
 
+from duty_board.alchemy import change_feed, refresh_schedule
 from duty_board.alchemy.session import create_session
 from duty_board.models.calendar import Calendar
 from duty_board.plugin.abstract_plugin import AbstractPlugin
@@ -31,27 +32,37 @@ calendar_refresh_failed = Gauge(
 
 
 def get_most_outdated_calendar(plugin: AbstractPlugin, session: SASession) -> Optional[Calendar]:
-    update_calendars_with_last_update_before: DateTime = DateTime.utcnow() - plugin.calendar_update_frequency
+    """
+    Claims the most outdated calendar by locking its row until the session ends.
+    Calendars that are locked by other threads or replicas are skipped, so a calendar is never refreshed twice.
+    """
     stmt: Select[Tuple[Calendar]] = (
         select(Calendar)
-        .where(Calendar.last_update_utc <= update_calendars_with_last_update_before)
+        .where(refresh_schedule.is_due(Calendar, plugin.calendar_update_frequency, now=DateTime.utcnow()))
         .order_by(Calendar.last_update_utc)
         .limit(1)
+        .with_for_update(skip_locked=True)
     )
     return session.scalar(stmt)
 
 
-def update_the_most_outdated_calendar(plugin: AbstractPlugin) -> None:
+def update_the_most_outdated_calendar(plugin: AbstractPlugin) -> bool:
+    """Refreshes the most outdated calendar that is due. Returns False if there was none, or the database failed."""
     calendar_refresh_run_counter.inc()
     failed: bool = False
+    # If the database fails, the outcome of the sync is rolled back as well. So we report that nothing was refreshed, or
+    # the caller would not wait and immediately claim the same rows again, for as long as the database fails.
+    database_failed: bool = False
+    calendar: Optional[Calendar] = None
+    calendar_name: Optional[str] = None
     try:
         with create_session() as session:
-            calendar: Optional[Calendar]
             if (calendar := get_most_outdated_calendar(plugin=plugin, session=session)) is None:
                 logger.debug("Nothing to update here :).")
-                time.sleep(1)  # Avoid overload on the database.
-                return
+                return False
 
+            # A failed commit expires the calendar, so we can't read its name afterwards.
+            calendar_name = calendar.name
             logger.info(f"Updating {calendar=}.")
             try:
                 calendar = plugin.sync_calendar(calendar=calendar, session=session)
@@ -62,44 +73,72 @@ def update_the_most_outdated_calendar(plugin: AbstractPlugin) -> None:
                 logger.exception(f"Failed to update {calendar=}.")
                 calendar.error_msg = traceback.format_exc()
             finally:
-                calendar.last_update_utc = DateTime.utcnow()
+                refresh_schedule.record_sync_result(
+                    calendar,
+                    failed=failed,
+                    update_frequency=plugin.calendar_update_frequency,
+                    max_backoff=plugin.max_refresh_retry_backoff,
+                )
                 session.merge(calendar)
         logger.info("Successfully updated the state of the calendar in the database.")
     except Exception:
-        failed = True
+        failed = database_failed = True
         logger.exception("Failed to update some calendar in the database. There is probably some database error.")
 
-    if calendar is not None:
-        calendar_refresh_failed.labels(calendar.name).set(int(failed))
+    if calendar_name is not None:
+        calendar_refresh_failed.labels(calendar_name).set(int(failed))
     if failed:
         calendar_refresh_run_failed_counter.inc()
     else:
         calendar_refresh_run_success_counter.inc()
+    return calendar_name is not None and not database_failed
 
 
 def collect_extra_metrics_calendar(plugin: AbstractPlugin) -> None:
     logger.info("Updating calender metrics.")
+    update_calendars_with_last_update_before: DateTime = DateTime.utcnow() - plugin.calendar_update_frequency
+    stmt = select(
+        func.count(Calendar.uid),
+        func.count(Calendar.uid).filter(Calendar.last_update_utc <= update_calendars_with_last_update_before),
+        func.count(Calendar.uid).filter(Calendar.error_msg.is_not(None)),
+    )
     with create_session() as session:
-        number_of_calendars: int = session.scalar(select(func.count(Calendar.uid)))  # type: ignore[assignment]
-        calendars_gauge.set(number_of_calendars)
+        number_of_calendars, number_of_out_dated_calendars, number_of_calendars_with_errors = session.execute(
+            stmt
+        ).one()
+    calendars_gauge.set(number_of_calendars)
+    calendars_outdated_gauge.set(number_of_out_dated_calendars)
+    calendars_errors_gauge.set(number_of_calendars_with_errors)
 
-        update_calendars_with_last_update_before: DateTime = DateTime.utcnow() - plugin.calendar_update_frequency
-        number_of_out_dated_calendars: int = session.scalar(  # type: ignore[assignment]
-            select(func.count(Calendar.uid)).where(Calendar.last_update_utc <= update_calendars_with_last_update_before)
-        )
-        calendars_outdated_gauge.set(number_of_out_dated_calendars)
 
-        number_of_calendars_with_errors: int = session.scalar(  # type: ignore[assignment]
-            select(func.count(Calendar.uid)).where(Calendar.error_msg != None)  # noqa: E711
-        )
-        calendars_errors_gauge.set(number_of_calendars_with_errors)
+def _enter_calendar_refresher_thread_loop(plugin: AbstractPlugin) -> None:
+    while True:
+        generations = change_feed.get_listener().get_generations()
+        if not update_the_most_outdated_calendar(plugin=plugin):
+            refresh_schedule.wait_until_next_due(
+                Calendar,
+                update_frequency=plugin.calendar_update_frequency,
+                max_sleep=plugin.interval_refresher_max_sleep,
+                topic=change_feed.CALENDAR_TOPIC,
+                generations=generations,
+            )
 
 
 def enter_calendar_refresher_loop(plugin: AbstractPlugin) -> None:
-    last_metrics_update = datetime.now(tz=timezone.utc) - plugin.interval_worker_metrics_update
-    while True:
-        if datetime.now(tz=timezone.utc) - last_metrics_update > plugin.interval_worker_metrics_update:
-            collect_extra_metrics_calendar(plugin=plugin)
+    logger.info(f"Starting {plugin.calendar_refresher_pool_size} calendar refresher threads.")
+    with ThreadPoolExecutor(
+        max_workers=plugin.calendar_refresher_pool_size, thread_name_prefix="calendar_refresher"
+    ) as executor:
+        futures: List[Future[None]] = [
+            executor.submit(_enter_calendar_refresher_thread_loop, plugin)
+            for _ in range(plugin.calendar_refresher_pool_size)
+        ]
+        while True:
             last_metrics_update = datetime.now(tz=timezone.utc)
-
-        update_the_most_outdated_calendar(plugin=plugin)
+            collect_extra_metrics_calendar(plugin=plugin)
+            time_until_next_update = (
+                last_metrics_update + plugin.interval_worker_metrics_update - datetime.now(tz=timezone.utc)
+            )
+            done, _ = wait(futures, timeout=time_until_next_update.total_seconds(), return_when=FIRST_EXCEPTION)
+            for future in done:
+                future.result()  # The threads never stop, unless they crashed. So we re-raise the exception.
@@ -1,14 +1,15 @@
 import logging
-import time
 import traceback
+from concurrent.futures import FIRST_EXCEPTION, Future, ThreadPoolExecutor, wait
 from datetime import datetime, timezone
-from typing import Optional, Sequence, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple
 
 from pendulum.datetime import DateTime
 from prometheus_client import Counter, Gauge
 from sqlalchemy import Select, Update, func, or_, select, update
 from sqlalchemy.orm import Session as SASession
 
+from duty_board.alchemy import change_feed, refresh_schedule
 from duty_board.alchemy.session import create_session
 from duty_board.models.on_call_event import OnCallEvent
 from duty_board.models.person import Person
@@ -31,15 +32,28 @@ persons_refresh_failed = Gauge(
 )
 
 
-def get_most_outdated_person(plugin: AbstractPlugin, session: SASession) -> Optional[Person]:
-    update_persons_with_last_update_before: DateTime = DateTime.utcnow() - plugin.person_update_frequency
+def get_most_outdated_persons(plugin: AbstractPlugin, session: SASession) -> Sequence[Person]:
     stmt = (
         select(Person)
-        .where(Person.last_update_utc <= update_persons_with_last_update_before)
+        .where(refresh_schedule.is_due(Person, plugin.person_update_frequency, now=DateTime.utcnow()))
         .order_by(Person.last_update_utc)
-        .limit(1)
+        .limit(plugin.person_refresher_batch_size)
+        .with_for_update(skip_locked=True)
     )
-    return session.scalar(stmt)
+    return session.scalars(stmt).all()
+
+
+def claim_most_outdated_persons(plugin: AbstractPlugin, session: SASession) -> List[int]:
+    """
+    Claims the most outdated persons with a lease, by moving their last_update_utc forward.
+    Other threads and replicas skip them until the lease expires. If our sync crashes, the persons are retried then.
+    """
+    persons = get_most_outdated_persons(plugin=plugin, session=session)
+    for person in persons:
+        person.last_update_utc = (
+            DateTime.utcnow() - plugin.person_update_frequency + plugin.person_refresh_lease_duration
+        )
+    return [person.uid for person in persons]
 
 
 def ensure_person_uniqueness(new_person: Person) -> Person:
@@ -51,7 +65,8 @@ def ensure_person_uniqueness(new_person: Person) -> Person:
     extra_session: SASession
     with create_session() as extra_session:
         # Required to expunge, otherwise the commit will also update new_person and will raise a DuplicateKeyIndexError.
-        extra_session.expunge(new_person)
+        if new_person in extra_session:
+            extra_session.expunge(new_person)
         query: Select[Tuple[Person]] = select(Person).where(Person.uid != new_person.uid)
         if new_person.username and new_person.email:
             query = query.where(or_(Person.username == new_person.username, Person.email == new_person.email))
@@ -78,66 +93,133 @@ def ensure_person_uniqueness(new_person: Person) -> Person:
     return new_person
 
 
-def update_the_most_outdated_person(plugin: AbstractPlugin) -> None:
+def _drop_duplicates_within_batch(persons: List[Person]) -> List[Person]:
+    """
+    Several persons in a batch can turn out to be the same person, e.g. one known by username and one by email.
+    We only keep the first one. ensure_person_uniqueness then removes the others from the database.
+    """
+    unique_persons: Dict[Tuple[Optional[str], Optional[str]], Person] = {}
+    for person in persons:
+        key = (person.username, person.email)
+        if key in unique_persons:
+            logger.info(f"{person.uid=} turned out to be the same as {unique_persons[key].uid=}.")
+        else:
+            unique_persons[key] = person
+    return list(unique_persons.values())
+
+
+def _store_synced_person(plugin: AbstractPlugin, person: Person, error_msg: Optional[str]) -> bool:
+    """Stores the result of the sync of a single person. Returns whether the person was updated successfully."""
+    with create_session() as session:
+        if session.get(Person, person.uid) is None:
+            logger.info(f"{person=} was deleted, probably in favor of another person in the same batch.")
+            return True
+        if error_msg is None:
+            try:
+                ensure_person_uniqueness(new_person=person)
+            except Exception:
+                logger.exception(f"Failed to update {person=}.")
+                error_msg = traceback.format_exc()
+        person.error_msg = error_msg
+        refresh_schedule.record_sync_result(
+            person,
+            failed=error_msg is not None,
+            update_frequency=plugin.person_update_frequency,
+            max_backoff=plugin.max_refresh_retry_backoff,
+        )
+        session.merge(person)
+    persons_refresh_failed.labels(person.username).set(int(error_msg is not None))
+    return error_msg is None
+
+
+def update_the_most_outdated_persons(plugin: AbstractPlugin) -> bool:
+    """Refreshes the most outdated persons that are due. Returns False if there were none, or the database failed."""
     persons_refresh_run_counter.inc()
     failed: bool = False
+    # If the database fails, the outcome of the sync is rolled back as well. So we report that nothing was refreshed, or
+    # the caller would not wait and immediately claim the same rows again, for as long as the database fails.
+    database_failed: bool = False
+    person_uids: List[int] = []
     try:
+        # The claim is committed right away, so we don't keep a transaction open while waiting for LDAP.
         with create_session() as session:
-            person: Optional[Person]
-            if (person := get_most_outdated_person(plugin=plugin, session=session)) is None:
-                logger.debug("Nothing to update here :).")
-                time.sleep(1)  # Avoid overload on the database.
-                return
+            person_uids = claim_most_outdated_persons(plugin=plugin, session=session)
+        if not person_uids:
+            logger.debug("Nothing to update here :).")
+            return False
 
-            logger.info(f"Updating {person=}.")
-            try:
-                person = plugin.sync_person(person=person, session=session)
-                logger.debug(f"Successfully executed plugins sync_person() for {person=}.")
-                person = ensure_person_uniqueness(new_person=person)
-                person.error_msg = None
-            except Exception:
-                failed = True
-                logger.exception(f"Failed to update {person=}.")
-                person.error_msg = traceback.format_exc()
-            finally:
-                person.last_update_utc = DateTime.utcnow()
-                session.merge(person)
-        logger.info("Successfully updated the state of the person in the database.")
+        with create_session() as session:
+            persons: List[Person] = list(
+                session.scalars(select(Person).where(Person.uid.in_(person_uids)).order_by(Person.uid)).all()
+            )
+            logger.info(f"Updating {persons=}.")
+            error_messages: Dict[int, Optional[str]] = plugin.sync_persons(persons=persons, session=session)
+            # Every person is stored in a separate transaction below. Otherwise, persons that turned out to be the
+            # same person would violate the unique constraints before ensure_person_uniqueness could merge them.
+            session.expunge_all()
+
+        successful_persons = [person for person in persons if error_messages.get(person.uid, "") is None]
+        unique_persons = _drop_duplicates_within_batch(persons=successful_persons)
+        for person in persons:
+            if person in successful_persons and person not in unique_persons:
+                continue  # Will be deleted by ensure_person_uniqueness of the person it turned out to be.
+            error_msg = error_messages.get(person.uid, f"{plugin.__class__.__name__}.sync_persons() skipped {person=}.")
+            failed = not _store_synced_person(plugin=plugin, person=person, error_msg=error_msg) or failed
+        logger.info("Successfully updated the state of the persons in the database.")
     except Exception:
-        failed = True
-        logger.exception("Failed to update a person in the database. There is probably some database error.")
+        failed = database_failed = True
+        logger.exception("Failed to update the persons in the database. There is probably some database error.")
 
-    if person is not None:
-        persons_refresh_failed.labels(person.username).set(int(failed))
     if failed:
         persons_refresh_run_failed_counter.inc()
     else:
         persons_refresh_run_success_counter.inc()
+    return bool(person_uids) and not database_failed
 
 
 def collect_extra_metrics_duty_officer(plugin: AbstractPlugin) -> None:
     logger.info("Updating duty officer metrics.")
+    update_persons_with_last_update_before: DateTime = DateTime.utcnow() - plugin.person_update_frequency
+    stmt = select(
+        func.count(Person.uid),
+        func.count(Person.uid).filter(Person.last_update_utc <= update_persons_with_last_update_before),
+        func.count(Person.uid).filter(Person.error_msg.is_not(None)),
+    )
     with create_session() as session:
-        number_of_persons: int = session.scalar(select(func.count(Person.uid)))  # type: ignore[assignment]
-        persons_gauge.set(number_of_persons)
+        number_of_persons, number_of_out_dated_persons, number_of_persons_with_errors = session.execute(stmt).one()
+    persons_gauge.set(number_of_persons)
+    persons_outdated_gauge.set(number_of_out_dated_persons)
+    persons_errors_gauge.set(number_of_persons_with_errors)
 
-        update_persons_with_last_update_before: DateTime = DateTime.utcnow() - plugin.person_update_frequency
-        number_of_out_dated_persons: int = session.scalar(  # type: ignore[assignment]
-            select(func.count(Person.uid)).where(Person.last_update_utc <= update_persons_with_last_update_before)
-        )
-        persons_outdated_gauge.set(number_of_out_dated_persons)
 
-        number_of_persons_with_errors: int = session.scalar(  # type: ignore[assignment]
-            select(func.count(Person.uid)).where(Person.error_msg != None)  # noqa: E711
-        )
-        persons_errors_gauge.set(number_of_persons_with_errors)
+def _enter_duty_officer_refresher_thread_loop(plugin: AbstractPlugin) -> None:
+    while True:
+        generations = change_feed.get_listener().get_generations()
+        if not update_the_most_outdated_persons(plugin=plugin):
+            refresh_schedule.wait_until_next_due(
+                Person,
+                update_frequency=plugin.person_update_frequency,
+                max_sleep=plugin.interval_refresher_max_sleep,
+                topic=change_feed.PERSON_TOPIC,
+                generations=generations,
+            )
 
 
 def enter_duty_officer_refresher_loop(plugin: AbstractPlugin) -> None:
-    last_metrics_update: datetime = datetime.now(tz=timezone.utc) - plugin.interval_worker_metrics_update
-    while True:
-        if datetime.now(tz=timezone.utc) - last_metrics_update > plugin.interval_worker_metrics_update:
+    logger.info(f"Starting {plugin.person_refresher_pool_size} duty officer refresher threads.")
+    with ThreadPoolExecutor(
+        max_workers=plugin.person_refresher_pool_size, thread_name_prefix="duty_officer_refresher"
+    ) as executor:
+        futures: List[Future[None]] = [
+            executor.submit(_enter_duty_officer_refresher_thread_loop, plugin)
+            for _ in range(plugin.person_refresher_pool_size)
+        ]
+        while True:
+            last_metrics_update: datetime = datetime.now(tz=timezone.utc)
             collect_extra_metrics_duty_officer(plugin=plugin)
-            last_metrics_update = datetime.now(tz=timezone.utc)
-
-        update_the_most_outdated_person(plugin=plugin)
+            time_until_next_update = (
+                last_metrics_update + plugin.interval_worker_metrics_update - datetime.now(tz=timezone.utc)
+            )
+            done, _ = wait(futures, timeout=time_until_next_update.total_seconds(), return_when=FIRST_EXCEPTION)
+            for future in done:
+                future.result()  # The threads never stop, unless they crashed. So we re-raise the exception.
@@ -1,115 +1,330 @@
+import datetime
+import functools
 import logging
-from collections import defaultdict
-from datetime import datetime, timezone
-from typing import Dict, Iterable, List, Set, Union
+import math
+import threading
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Set, Tuple
 
 from pendulum.datetime import DateTime
-from prometheus_client import Counter, Gauge
-from sqlalchemy import select
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import and_, case, distinct, exists, func, or_, select
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert
 from sqlalchemy.orm import Session as SASession
 
+from duty_board.alchemy import change_feed
+from duty_board.alchemy.data_version import SCHEDULE_DATA_VERSION, get_data_version
 from duty_board.alchemy.session import create_session
+from duty_board.alchemy.sqlalchemy_types import UtcDateTime
 from duty_board.models.calendar import Calendar
 from duty_board.models.on_call_event import OnCallEvent
+from duty_board.models.on_duty_state import OnDutyState
 from duty_board.models.person import Person
 from duty_board.plugin.abstract_plugin import AbstractPlugin
 
 logger = logging.getLogger(__name__)
 
 update_event_checker_run_counter = Counter(
-    "duty_calendars_refresh_counter", "Count the number of update event check runs."
+    "duty_watcher_check_counter", "Count the number of checks for calendars with new persons on duty."
 )
 update_event_callback_counter = Counter(
-    "update_event_callback_counter", "Count the number of callbacks executed for update events."
+    "duty_watcher_callback_counter", "Count the number of callbacks executed for update events."
 )
 update_event_callback_success_counter = Counter(
-    "duty_calendars_refresh_success_counter", "Count the number of callbacks for update events that succeed."
+    "duty_watcher_callback_success_counter", "Count the number of callbacks for update events that succeed."
 )
 update_event_callback_failed_counter = Counter(
-    "duty_calendars_refresh_failed_counter", "Count the number of callbacks for update events that fail."
+    "duty_watcher_callback_failed_counter", "Count the number of callbacks for update events that fail."
+)
+update_event_callback_timeout_counter = Counter(
+    "duty_watcher_callback_timeout_counter", "Count the number of callbacks for update events that time out."
+)
+update_event_callback_cancelled_counter = Counter(
+    "duty_watcher_callback_cancelled_counter",
+    "Count the number of callbacks for update events that were cancelled before they started.",
+)
+update_event_callback_duration = Histogram(
+    "duty_watcher_callback_duration_seconds", "How long the callbacks for update events take."
 )
 updated_event_callback_failed = Gauge(
-    "duty_calendars_last_refresh_failed", "Indicate whether the last callback failed", ["calendar_name"]
+    "duty_watcher_last_callback_failed", "Indicate whether the last callback failed", ["calendar_name"]
 )
 
 
-def run_callback_for_calendar_with_new_duty(plugin: AbstractPlugin, calendar: Calendar, persons: Set[Person]) -> None:
-    update_event_checker_run_counter.inc()
+def _handle_new_person_on_duty_event(
+    plugin: AbstractPlugin, calendar: Calendar, persons: Set[Person], callback_result: "Future[None]"
+) -> None:
+    try:
+        plugin.handle_new_person_on_duty_event(calendar=calendar, persons=persons)
+        callback_result.set_result(None)
+    except BaseException as e:
+        callback_result.set_exception(e)
+
+
+def _log_finished_after_timeout(calendar: Calendar, callback_result: "Future[None]") -> None:
+    logger.info(f"The callback for {calendar=} finished after it timed out, {callback_result.exception()=}.")
+
+
+def run_callback_for_calendar_with_new_duty(
+    plugin: AbstractPlugin, calendar: Calendar, persons: Set[Person], timeout: Optional[datetime.timedelta] = None
+) -> None:
+    """
+    Runs the callback and counts it as exactly one of succeeded, failed or timed out. With a timeout, the callback runs in
+    a separate daemon thread, as we can not stop a thread. So a callback that hangs does not keep a thread of the pool.
+    """
+    update_event_callback_counter.inc()
     failed: bool = False
+    timed_out: bool = False
     try:
         logger.info(f"Running callback 'handle_new_person_on_duty_event' for {calendar=}, {persons=}.")
-        plugin.handle_new_person_on_duty_event(calendar=calendar, persons=persons)
-        logger.info(f"Callback succeeded 'handle_new_person_on_duty_event' for {calendar=}, {persons=}.")
+        with update_event_callback_duration.time():
+            if timeout is None:
+                plugin.handle_new_person_on_duty_event(calendar=calendar, persons=persons)
+            else:
+                callback_result: "Future[None]" = Future()
+                threading.Thread(
+                    target=_handle_new_person_on_duty_event,
+                    args=(plugin, calendar, persons, callback_result),
+                    name=f"duty_watcher_callback_{calendar.uid}",
+                    daemon=True,
+                ).start()
+                done, _ = wait([callback_result], timeout=timeout.total_seconds())
+                if done:
+                    callback_result.result()
+                else:
+                    timed_out = True
+                    callback_result.add_done_callback(functools.partial(_log_finished_after_timeout, calendar))
+        if timed_out:
+            logger.error(f"Callback 'handle_new_person_on_duty_event' for {calendar=} did not finish within {timeout}.")
+        else:
+            logger.info(f"Callback succeeded 'handle_new_person_on_duty_event' for {calendar=}, {persons=}.")
     except Exception:
         failed = True
-        logger.exception("Failed to update some calendar in the database. There is probably some database error.")
+        logger.exception(f"Callback failed 'handle_new_person_on_duty_event' for {calendar=}, {persons=}.")
 
-    if calendar is not None:
-        updated_event_callback_failed.labels(calendar.name).set(int(failed))
-    if failed:
+    updated_event_callback_failed.labels(calendar.name).set(int(failed or timed_out))
+    if timed_out:
+        update_event_callback_timeout_counter.inc()
+    elif failed:
         update_event_callback_failed_counter.inc()
     else:
         update_event_callback_success_counter.inc()
 
 
-def get_all_person_uids_on_duty_per_calendar(session: SASession) -> Dict[str, Set[int]]:
-    stmt = (
-        select(OnCallEvent)
-        .where(OnCallEvent.start_event_utc <= DateTime.utcnow())
-        .where(OnCallEvent.end_event_utc > DateTime.utcnow())
-    )
-    result: Iterable[OnCallEvent] = session.scalars(stmt).all()
-    mapped: Dict[str, Set[int]] = defaultdict(set)
-    for calendar_event in result:
-        mapped[calendar_event.calendar_uid].add(calendar_event.person_uid)
-    return mapped
+def ensure_on_duty_states(session: SASession, calendar_uids: Optional[Set[str]] = None) -> None:
+    """
+    Adds an OnDutyState without a handover for every calendar that does not have one yet. Commit this before calling
+    get_calendars_with_new_duty(), as other replicas would otherwise wait for the new rows until that transaction ends.
+    """
+    calendar_stmt = select(Calendar.uid).where(~exists().where(OnDutyState.calendar_uid == Calendar.uid))
+    if calendar_uids is not None:
+        calendar_stmt = calendar_stmt.where(Calendar.uid.in_(calendar_uids))
+    # Another replica might add the same rows concurrently, so we ignore the ones that exist by now.
+    session.execute(insert(OnDutyState).from_select(["calendar_uid"], calendar_stmt).on_conflict_do_nothing())
 
 
 def get_calendars_with_new_duty(
-    session: SASession, last_calendar_uid_to_person_id: Dict[str, Union[Set[int], None]]
+    session: SASession, calendar_uids: Optional[Set[str]] = None, now: Optional[DateTime] = None
 ) -> Dict[str, Set[int]]:
-    updated_calendars: Dict[str, Set[int]] = {}
-    person_uids_on_duty_per_calendar: Dict[str, Set[int]] = get_all_person_uids_on_duty_per_calendar(session=session)
+    """
+    Returns the persons on duty per calendar, for the calendars of which that changed since the last handover. Defaults
+    to all calendars. The persons on duty are compared in SQL with the OnDutyState, which is updated right away.
+    Calendars without an OnDutyState are skipped, see ensure_on_duty_states().
 
-    all_calendars: Iterable[Calendar] = session.scalars(select(Calendar).order_by(Calendar.order)).all()
-    for calendar in all_calendars:
-        person_uids_on_duty = person_uids_on_duty_per_calendar[calendar.uid]
-        if person_uids_on_duty == last_calendar_uid_to_person_id[calendar.uid]:
-            logger.debug(f"{calendar=} had no update in terms of Duty.")
-        else:
-            last_calendar_uid_to_person_id[calendar.uid] = person_uids_on_duty
-            updated_calendars[calendar.uid] = person_uids_on_duty
-            logger.info(f"Found new people on Duty for {calendar=}, {person_uids_on_duty=}.")
+    The OnDutyStates that changed are locked until the session commits, and rows that are locked by another replica are
+    skipped. So every handover is returned to exactly one replica, which must commit before running the callbacks.
+    """
+    now = now or DateTime.utcnow()
+    # The sorted uids of the persons on duty, or an empty array if nobody is. Sorted, so it can be compared as a whole.
+    person_uids_on_duty = func.array_remove(
+        func.array_agg(aggregate_order_by(distinct(OnCallEvent.person_uid), OnCallEvent.person_uid)), None
+    )
+    on_duty_stmt = (
+        select(Calendar.uid, Calendar.order, person_uids_on_duty.label("person_uids"))
+        .outerjoin(
+            OnCallEvent,
+            and_(
+                OnCallEvent.calendar_uid == Calendar.uid,
+                OnCallEvent.start_event_utc <= now,
+                OnCallEvent.end_event_utc > now,
+            ),
+        )
+        .group_by(Calendar.uid)
+    )
+    if calendar_uids is not None:
+        on_duty_stmt = on_duty_stmt.where(Calendar.uid.in_(calendar_uids))
+    on_duty = on_duty_stmt.subquery()
+
+    changed_stmt = (
+        select(OnDutyState, on_duty.c.person_uids)
+        .join(on_duty, on_duty.c.uid == OnDutyState.calendar_uid)
+        .where(OnDutyState.person_uids.is_distinct_from(on_duty.c.person_uids))
+        .order_by(on_duty.c.order)
+        .with_for_update(of=OnDutyState, skip_locked=True)
+    )
+    updated_calendars: Dict[str, Set[int]] = {}
+    for on_duty_state, person_uids in session.execute(changed_stmt).tuples():
+        on_duty_state.person_uids = person_uids
+        on_duty_state.last_handover_utc = now
+        updated_calendars[on_duty_state.calendar_uid] = set(person_uids)
+        logger.info(f"Found new people on Duty for calendar_uid={on_duty_state.calendar_uid}, {person_uids=}.")
     return updated_calendars
 
 
+def get_next_shift_boundary(session: SASession, after: DateTime) -> Optional[DateTime]:
+    """Returns the first moment after `after` at which someone goes on or off duty, or None if that never happens."""
+    # An event starts before it ends, so the next boundary of an event that did not end yet is its start or its end.
+    next_boundary_of_event = case(
+        (OnCallEvent.start_event_utc > after, OnCallEvent.start_event_utc), else_=OnCallEvent.end_event_utc
+    )
+    stmt = select(func.min(next_boundary_of_event, type_=UtcDateTime())).where(OnCallEvent.end_event_utc > after)
+    next_shift_boundary: Optional[DateTime] = session.scalar(stmt)
+    return next_shift_boundary
+
+
+def get_calendar_uids_with_shift_boundary(session: SASession, after: DateTime, until: DateTime) -> Set[str]:
+    """Returns the calendars in which someone went on or off duty after `after`, up to and including `until`."""
+    stmt = (
+        select(OnCallEvent.calendar_uid)
+        .distinct()
+        .where(OnCallEvent.end_event_utc > after)
+        .where(
+            or_(
+                and_(OnCallEvent.start_event_utc > after, OnCallEvent.start_event_utc <= until),
+                OnCallEvent.end_event_utc <= until,
+            )
+        )
+    )
+    return set(session.scalars(stmt))
+
+
+def get_calendars_and_persons(
+    session: SASession, calendars_with_new_on_call: Dict[str, Set[int]]
+) -> List[Tuple[Calendar, Set[Person]]]:
+    """
+    Loads the calendars and their persons on duty in two queries. The callbacks run in other threads, so the instances are
+    expunged from the session. Calendars that were deleted in the meantime are skipped.
+    """
+    if not calendars_with_new_on_call:
+        return []
+    calendar_stmt = select(Calendar).where(Calendar.uid.in_(calendars_with_new_on_call))
+    calendars: Dict[str, Calendar] = {calendar.uid: calendar for calendar in session.scalars(calendar_stmt)}
+    all_person_uids: Set[int] = set().union(*calendars_with_new_on_call.values())
+    persons: Dict[int, Person] = {}
+    if all_person_uids:
+        persons = {
+            person.uid: person for person in session.scalars(select(Person).where(Person.uid.in_(all_person_uids)))
+        }
+    for instance in [*calendars.values(), *persons.values()]:
+        session.expunge(instance)
+
+    calendars_and_persons: List[Tuple[Calendar, Set[Person]]] = []
+    for calendar_uid, person_uids in calendars_with_new_on_call.items():
+        if calendar_uid not in calendars:
+            logger.warning(f"{calendar_uid=} was deleted before we could run its callback.")
+            continue
+        calendars_and_persons.append((calendars[calendar_uid], {persons[uid] for uid in person_uids if uid in persons}))
+    return calendars_and_persons
+
+
+def run_callbacks(
+    plugin: AbstractPlugin,
+    calendars_and_persons: List[Tuple[Calendar, Set[Person]]],
+    executor: Optional[Executor] = None,
+    timeout: Optional[datetime.timedelta] = None,
+) -> None:
+    """
+    Runs the callbacks in the executor, so a slow callback does not hold up the handover of the other calendars. Every
+    callback gets `timeout` from the moment it starts. The executor should have duty_watcher_callback_pool_size threads,
+    so we know how long all callbacks take at most. Callbacks that did not start by then are cancelled.
+    Without an executor, the callbacks run one by one in the current thread.
+    """
+    if executor is None:
+        for calendar, persons in calendars_and_persons:
+            run_callback_for_calendar_with_new_duty(plugin, calendar, persons, timeout=timeout)
+        return
+
+    futures: Dict["Future[None]", Calendar] = {
+        executor.submit(run_callback_for_calendar_with_new_duty, plugin, calendar, persons, timeout): calendar
+        for calendar, persons in calendars_and_persons
+    }
+    wait_timeout: Optional[float] = None
+    if timeout is not None:
+        # The callbacks run in waves of pool_size, and we allow one more wave of slack for the threads themselves.
+        number_of_waves = math.ceil(len(futures) / plugin.duty_watcher_callback_pool_size)
+        wait_timeout = (number_of_waves + 1) * timeout.total_seconds()
+    _, not_done = wait(futures, timeout=wait_timeout)
+    for future in not_done:
+        if future.cancel():
+            update_event_callback_cancelled_counter.inc()
+            logger.error(
+                f"The callback for {futures[future]} did not start within {wait_timeout} seconds. Cancelled it."
+            )
+
+
 def run_update_event_loop(
     session: SASession,
     plugin: AbstractPlugin,
     calendars_with_new_on_call: Dict[str, Set[int]],
+    executor: Optional[Executor] = None,
+    timeout: Optional[datetime.timedelta] = None,
 ) -> None:
-    for calendar_uid_with_new_duty, new_duty_uids in calendars_with_new_on_call.items():
-        calendar_stmt = select(Calendar).where(Calendar.uid == calendar_uid_with_new_duty)
-        result: List[Calendar] = list(session.scalars(calendar_stmt).all())
-        logger.debug(f"Fetching {calendar_uid_with_new_duty=} gave {result=}.")
-        calendar: Calendar = result[0]
+    calendars_and_persons = get_calendars_and_persons(session, calendars_with_new_on_call=calendars_with_new_on_call)
+    run_callbacks(plugin, calendars_and_persons=calendars_and_persons, executor=executor, timeout=timeout)
 
-        person_stmt = select(Person).where(Person.uid.in_(new_duty_uids))
-        persons: Set[Person] = set(session.scalars(person_stmt).all())
-        logger.debug(f"Fetching {new_duty_uids=} gave {persons=}.")
 
-        run_callback_for_calendar_with_new_duty(plugin, calendar, persons)
+def _sleep_until_next_check(
+    plugin: AbstractPlugin, next_shift_boundary: Optional[DateTime], generations: change_feed.Generations
+) -> None:
+    """
+    Sleeps until the next shift boundary, but at most interval_worker_check_for_update_events. We wake up earlier when
+    the schedule changed since the generations were taken, as a changed schedule could move the next shift boundary.
+    """
+    seconds_until_next_check = plugin.interval_worker_check_for_update_events.total_seconds()
+    if next_shift_boundary is not None:
+        seconds_until_next_shift_boundary = (next_shift_boundary - DateTime.utcnow()).total_seconds()
+        seconds_until_next_check = min(seconds_until_next_check, seconds_until_next_shift_boundary)
+    change_feed.get_listener().wait([SCHEDULE_DATA_VERSION], timeout=seconds_until_next_check, since=generations)
 
 
 def enter_update_events_loop(plugin: AbstractPlugin) -> None:
-    last_update_check = datetime.now(tz=timezone.utc) - plugin.interval_worker_check_for_update_events
-    last_calendar_uid_to_person_id: Dict[str, Union[Set[int], None]] = defaultdict(lambda: None)
+    """
+    Runs the callbacks for calendars that got new persons on duty. Instead of evaluating all calendars over and over, we
+    sleep until the next shift boundary and then only evaluate the calendars in which someone went on or off duty.
+    Only when the schedule changed, which the change feed notifies us about, all calendars are evaluated again.
+    The handovers are stored in the OnDutyState, so a restart only runs the callbacks of handovers that it missed. And
+    several replicas can run this loop, while every handover is run by exactly one of them.
+    """
+    last_data_version: Optional[int] = None
+    last_check: Optional[DateTime] = None
+    logger.info(f"Running the callbacks in {plugin.duty_watcher_callback_pool_size} threads.")
+    executor = ThreadPoolExecutor(
+        max_workers=plugin.duty_watcher_callback_pool_size, thread_name_prefix="duty_watcher_callback"
+    )
     while True:
-        if datetime.now(tz=timezone.utc) - last_update_check > plugin.interval_worker_check_for_update_events:
-            last_update_check = datetime.now(tz=timezone.utc)
-
-            with create_session() as session:
-                calendars_with_new_on_call = get_calendars_with_new_duty(session, last_calendar_uid_to_person_id)
-                run_update_event_loop(
-                    plugin=plugin, session=session, calendars_with_new_on_call=calendars_with_new_on_call
-                )
+        update_event_checker_run_counter.inc()
+        generations = change_feed.get_listener().get_generations()
+        calendars_and_persons: List[Tuple[Calendar, Set[Person]]] = []
+        with create_session() as session:
+            ensure_on_duty_states(session)
+        with create_session() as session:
+            now = DateTime.utcnow()
+            data_version = get_data_version(session)
+            calendar_uids: Optional[Set[str]] = None
+            if last_check is not None and data_version == last_data_version:
+                calendar_uids = get_calendar_uids_with_shift_boundary(session, after=last_check, until=now)
+            if calendar_uids is None or calendar_uids:
+                calendars_with_new_on_call = get_calendars_with_new_duty(session, calendar_uids=calendar_uids, now=now)
+                calendars_and_persons = get_calendars_and_persons(session, calendars_with_new_on_call)
+            last_data_version, last_check = data_version, now
+            next_shift_boundary = get_next_shift_boundary(session, after=now)
+        # The callbacks run after the transaction, so we don't keep it open while they call external systems. It also
+        # releases the OnDutyStates, and a handover is only stored once, so a restart does not run its callbacks again.
+        run_callbacks(
+            plugin,
+            calendars_and_persons=calendars_and_persons,
+            executor=executor,
+            timeout=plugin.duty_watcher_callback_timeout,
+        )
+        logger.debug(f"Sleeping until the next check, the next shift boundary is at {next_shift_boundary}.")
+        _sleep_until_next_check(plugin=plugin, next_shift_boundary=next_shift_boundary, generations=generations)
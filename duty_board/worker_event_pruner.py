@@ -0,0 +1,90 @@
+import json
+import logging
+import time
+from typing import Optional, TextIO
+
+from pendulum.datetime import DateTime
+from prometheus_client import Counter
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session as SASession
+
+from duty_board.alchemy.data_version import SKIP_DATA_VERSION_BUMP
+from duty_board.alchemy.session import create_session
+from duty_board.models.on_call_event import OnCallEvent
+from duty_board.plugin.abstract_plugin import AbstractPlugin
+
+logger = logging.getLogger(__name__)
+
+events_pruned_counter = Counter("duty_events_pruned_counter", "Count the number of on-call events that were pruned.")
+
+
+def prune_events_batch(
+    plugin: AbstractPlugin, session: SASession, ended_before: DateTime, archive_file: Optional[TextIO] = None
+) -> int:
+    """
+    Deletes at most event_pruner_batch_size events that ended before ended_before, and returns how many were deleted.
+    Events that are locked by a calendar sync are skipped, so a batch never waits on other transactions.
+    If an archive_file is given, the deleted events are appended to it as JSON lines.
+    """
+    events_to_prune = (
+        select(OnCallEvent.uid)
+        .where(OnCallEvent.end_event_utc < ended_before)
+        .limit(plugin.event_pruner_batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    stmt = (
+        delete(OnCallEvent)
+        .where(OnCallEvent.uid.in_(events_to_prune.scalar_subquery()))
+        .returning(
+            OnCallEvent.uid,
+            OnCallEvent.calendar_uid,
+            OnCallEvent.person_uid,
+            OnCallEvent.start_event_utc,
+            OnCallEvent.end_event_utc,
+        )
+        # Only events that ended long ago are pruned. Those are not part of the schedule, so its version stays the same.
+        .execution_options(**{SKIP_DATA_VERSION_BUMP: True})
+    )
+    pruned_events = session.execute(stmt).all()
+    if archive_file is not None:
+        for uid, calendar_uid, person_uid, start_event_utc, end_event_utc in pruned_events:
+            event = {
+                "uid": uid,
+                "calendar_uid": calendar_uid,
+                "person_uid": person_uid,
+                "start_event_utc": start_event_utc.isoformat(),
+                "end_event_utc": end_event_utc.isoformat(),
+            }
+            archive_file.write(json.dumps(event) + "\n")
+        archive_file.flush()  # Before the deletion is committed.
+    return len(pruned_events)
+
+
+def prune_events(plugin: AbstractPlugin, archive_file: Optional[TextIO] = None) -> int:
+    """
+    Deletes all events that ended more than event_retention_period ago, and returns how many were deleted.
+    Every batch is committed separately, so the locks on the on_call_event table are short-lived.
+    """
+    ended_before: DateTime = DateTime.utcnow() - plugin.event_retention_period
+    logger.info(f"Pruning the events that ended before {ended_before}.")
+    number_of_pruned_events = 0
+    while True:
+        with create_session() as session:
+            number_of_pruned_events_in_batch = prune_events_batch(
+                plugin=plugin, session=session, ended_before=ended_before, archive_file=archive_file
+            )
+        events_pruned_counter.inc(number_of_pruned_events_in_batch)
+        number_of_pruned_events += number_of_pruned_events_in_batch
+        if number_of_pruned_events_in_batch < plugin.event_pruner_batch_size:
+            break
+    logger.info(f"Pruned {number_of_pruned_events} events.")
+    return number_of_pruned_events
+
+
+def enter_event_pruner_loop(plugin: AbstractPlugin, archive_file: Optional[TextIO] = None) -> None:
+    while True:
+        try:
+            prune_events(plugin=plugin, archive_file=archive_file)
+        except Exception:
+            logger.exception("Failed to prune the events. There is probably some database error.")
+        time.sleep(plugin.interval_event_pruner.total_seconds())
@@ -9,6 +9,18 @@
  * ---------------------------------------------------------------
  */
 
+/**
+ * CompactSchedule
+ * The CurrentSchedule with epoch timestamps instead of formatted ones, and every person only listed once.
+ */
+export interface CompactSchedule {
+  config: Config;
+  /** Calendars */
+  calendars: CompactCalendar[];
+  /** Persons */
+  persons: PersonEssentials[];
+}
+
 /** CurrentSchedule */
 export interface CurrentSchedule {
   config: Config;
@@ -34,6 +46,8 @@ export interface PersonResponse {
   email: string | null;
   /** Img Filename */
   imgFilename: string | null;
+  /** Img Content Hash */
+  imgContentHash: string | null;
   /** Img Width */
   imgWidth: number | null;
   /** Img Height */
@@ -48,6 +62,24 @@ export interface PersonResponse {
   sync: boolean;
 }
 
+/** PersonsResponse */
+export interface PersonsResponse {
+  /** Persons */
+  persons: Record<string, PersonResponse>;
+  /** Thumbnails */
+  thumbnails: Record<string, string>;
+}
+
+/** ScheduleDelta */
+export interface ScheduleDelta {
+  /** Calendars */
+  calendars: Calendar[];
+  /** Removed Calendar Uids */
+  removedCalendarUids: string[];
+  /** Persons */
+  persons: Record<string, PersonEssentials>;
+}
+
 /** ValidationError */
 export interface ValidationError {
   /** Location */
@@ -80,6 +112,32 @@ export interface Calendar {
   events: Events[];
 }
 
+/** CompactCalendar */
+export interface CompactCalendar {
+  /** Uid */
+  uid: string;
+  /** Name */
+  name: string;
+  /** Description */
+  description: string | null;
+  /** Category */
+  category: string;
+  /** Order */
+  order: number;
+  /** Last Update */
+  lastUpdate: number;
+  /** Error Msg */
+  errorMsg: string;
+  /** Sync */
+  sync: boolean;
+  /** Starts */
+  starts: number[];
+  /** Ends */
+  ends: number[];
+  /** Person Idx */
+  personIdx: number[];
+}
+
 /** Config */
 export interface Config {
   /** Timezone */
@@ -15,6 +15,8 @@ const useGetPerson = ({ personUid }: { personUid: number }) => {
           params: params
         });
       },
+      // usePrefetchPersons fills this in for everyone on the schedule, so opening a person does not refetch it.
+      staleTime: 60 * 1000
     }
   );
 };
@@ -1,7 +1,9 @@
-import { useQuery } from "@tanstack/react-query";
+import { QueryClient, useQuery, useQueryClient } from "@tanstack/react-query";
 import axios, { AxiosResponse } from "axios";
+import camelcaseKeys from "camelcase-keys";
+import { useEffect, useState } from "react";
 
-import { CurrentSchedule } from "./api-generated-types";
+import { CurrentSchedule, ScheduleDelta } from "./api-generated-types";
 
 export const emptyScheduleData: CurrentSchedule = {
   config: {
@@ -20,8 +22,88 @@ export const emptyScheduleData: CurrentSchedule = {
   persons: {}
 };
 
+const applyScheduleDelta = (schedule: CurrentSchedule, delta: ScheduleDelta): CurrentSchedule => {
+  const calendars = new Map(schedule.calendars.map((calendar) => [calendar.uid, calendar]));
+  delta.removedCalendarUids.forEach((uid) => calendars.delete(uid));
+  delta.calendars.forEach((calendar) => calendars.set(calendar.uid, calendar));
+  return {
+    ...schedule,
+    calendars: Array.from(calendars.values()).sort((a, b) => a.order - b.order),
+    persons: { ...schedule.persons, ...delta.persons }
+  };
+};
+
+// Without an open stream, e.g. because a proxy does not allow it, we poll the schedule instead.
+const pollIntervalWithoutStreamMs = 60 * 1000;
+
+type ScheduleStream = {
+  eventSource: EventSource;
+  isOpen: boolean;
+  subscribers: Set<(isOpen: boolean) => void>;
+};
+
+// All components using the schedule share a single connection per timezone.
+const scheduleStreams = new Map<string, ScheduleStream>();
+
+const setStreamIsOpen = (stream: ScheduleStream, isOpen: boolean) => {
+  stream.isOpen = isOpen;
+  stream.subscribers.forEach((subscriber) => subscriber(isOpen));
+};
+
+const subscribeToScheduleStream = (
+  queryClient: QueryClient,
+  timezoneValue: string,
+  onIsOpenChange: (isOpen: boolean) => void
+) => {
+  let stream = scheduleStreams.get(timezoneValue);
+  if (stream === undefined) {
+    const url = `${import.meta.env.VITE_API_ADDRESS}schedule/stream?${new URLSearchParams({
+      timezone: timezoneValue
+    })}`;
+    const eventSource = new EventSource(url);
+    const newStream: ScheduleStream = { eventSource, isOpen: false, subscribers: new Set() };
+    const queryKey = ["useGetSchedule", timezoneValue];
+    // The EventSource reconnects by itself, after which the server starts with a new snapshot.
+    eventSource.addEventListener("open", () => setStreamIsOpen(newStream, true));
+    eventSource.addEventListener("error", () => setStreamIsOpen(newStream, false));
+    eventSource.addEventListener("snapshot", (event: MessageEvent<string>) => {
+      queryClient.setQueryData<CurrentSchedule>(
+        queryKey,
+        camelcaseKeys(JSON.parse(event.data), { deep: true })
+      );
+    });
+    eventSource.addEventListener("delta", (event: MessageEvent<string>) => {
+      const delta: ScheduleDelta = camelcaseKeys(JSON.parse(event.data), { deep: true });
+      queryClient.setQueryData<CurrentSchedule>(queryKey, (schedule) =>
+        schedule === undefined ? schedule : applyScheduleDelta(schedule, delta)
+      );
+    });
+    stream = newStream;
+    scheduleStreams.set(timezoneValue, stream);
+  }
+  stream.subscribers.add(onIsOpenChange);
+  onIsOpenChange(stream.isOpen);
+
+  return () => {
+    const currentStream = scheduleStreams.get(timezoneValue);
+    if (currentStream === undefined) return;
+    currentStream.subscribers.delete(onIsOpenChange);
+    if (currentStream.subscribers.size === 0) {
+      currentStream.eventSource.close();
+      scheduleStreams.delete(timezoneValue);
+    }
+  };
+};
+
 const useGetSchedule = () => {
   const timezoneValue = Intl.DateTimeFormat().resolvedOptions().timeZone;
+  const queryClient = useQueryClient();
+  const [isStreamOpen, setIsStreamOpen] = useState(false);
+
+  useEffect(
+    () => subscribeToScheduleStream(queryClient, timezoneValue, setIsStreamOpen),
+    [queryClient, timezoneValue]
+  );
 
   const query = useQuery(
     {
@@ -31,6 +113,10 @@ const useGetSchedule = () => {
           params: { timezone: timezoneValue }
         });
       },
+      // While the stream is open, it keeps the schedule up-to-date. Otherwise, we poll it.
+      staleTime: isStreamOpen ? Infinity : 0,
+      refetchInterval: isStreamOpen ? false : pollIntervalWithoutStreamMs,
+      refetchOnWindowFocus: !isStreamOpen
     }
   );
   return {
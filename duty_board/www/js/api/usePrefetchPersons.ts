@@ -0,0 +1,41 @@
+import { useQuery, useQueryClient } from "@tanstack/react-query";
+import axios, { AxiosResponse } from "axios";
+
+import { PersonsResponse } from "./api-generated-types";
+
+// The thumbnail is shown as a placeholder while the image itself loads.
+const thumbnailSize = 64;
+// The server refuses to return more persons at once.
+const maxPersonsPerRequest = 500;
+
+export const getThumbnailQueryKey = (personUid: number) => ["usePersonThumbnail", personUid];
+
+// Fetches the given persons in a single request, and fills the cache of useGetPerson with them.
+const usePrefetchPersons = ({ personUids }: { personUids: number[] }) => {
+  const timezoneValue = Intl.DateTimeFormat().resolvedOptions().timeZone;
+  const queryClient = useQueryClient();
+  const uniquePersonUids = Array.from(new Set(personUids)).sort((a, b) => a - b).slice(0, maxPersonsPerRequest);
+
+  return useQuery(
+    {
+      queryKey: ["usePrefetchPersons", timezoneValue, uniquePersonUids],
+      queryFn: async () => {
+        const params = new URLSearchParams({ timezone: timezoneValue, thumbnail_size: String(thumbnailSize) });
+        uniquePersonUids.forEach((personUid) => params.append("person_uids", String(personUid)));
+        const response = await axios.get<AxiosResponse, PersonsResponse>("/persons", { params: params });
+        Object.values(response.persons).forEach((person) =>
+          queryClient.setQueryData(["useGetPerson", person.uid], person)
+        );
+        Object.entries(response.thumbnails).forEach(([personUid, thumbnail]) =>
+          queryClient.setQueryData(getThumbnailQueryKey(Number(personUid)), thumbnail)
+        );
+        return response;
+      },
+      enabled: uniquePersonUids.length > 0,
+      staleTime: 60 * 1000,
+      refetchOnWindowFocus: false
+    }
+  );
+};
+
+export default usePrefetchPersons;
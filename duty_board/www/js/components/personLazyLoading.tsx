@@ -2,6 +2,8 @@ import {Box, PopoverBody, PopoverCloseButton, PopoverFooter, PopoverHeader, Text
 import DynamicFAIcon from "./dynamicFAIcon";
 import {ExtraInfoOnPerson, PersonResponse} from "../api/api-generated-types";
 import useGetPerson from "../api/useGetPerson";
+import { getThumbnailQueryKey } from "../api/usePrefetchPersons";
+import { useQueryClient } from "@tanstack/react-query";
 import * as React from "react";
 
 export interface DrawInfoOnPerson {
@@ -33,16 +35,30 @@ const URLExtraInfoComponent = ({ information, icon, iconColor, url }: ExtraInfoO
   );
 };
 
+// The image is shown as a circle of 200px, so we request the variant whose shortest side is at least that long.
+const imageSize = 200;
+
+const getImageUrl = (person: PersonResponse, size: number) => {
+  const params = new URLSearchParams({ size: String(size), format: "webp" });
+  if (person.imgContentHash) params.set("v", person.imgContentHash);
+  return `${import.meta.env.VITE_API_ADDRESS}person_img/${person.imgFilename}?${params}`;
+};
+
 const PersonImage = ({person}: {person: PersonResponse}) => {
   {/* Inspiration from https://www.webfx.com/blog/web-design/circular-images-css/. Thanks William Craig! */}
+  const src = getImageUrl(person, imageSize);
+  const srcSet = `${src} 1x, ${getImageUrl(person, imageSize * 2)} 2x`;
+  // The prefetched thumbnail is shown until the image itself is loaded.
+  const thumbnail = useQueryClient().getQueryData<string>(getThumbnailQueryKey(person.uid));
+  const placeholderStyle = thumbnail ? { backgroundImage: `url(${thumbnail})`, backgroundSize: "cover" } : {};
   return (
     <div>
       {person.imgHeight != null && person.imgWidth != null && person.imgWidth > person.imgHeight
-        ? <div className="circular--landscape">
-            <img src={import.meta.env.VITE_API_ADDRESS + "person_img/" + person.imgFilename} alt={person.username}/>
+        ? <div className="circular--landscape" style={placeholderStyle}>
+            <img src={src} srcSet={srcSet} alt={person.username}/>
           </div>
-        : <div className="circular--portrait">
-            <img src={import.meta.env.VITE_API_ADDRESS + "person_img/" + person.imgFilename} alt={person.username}/>
+        : <div className="circular--portrait" style={placeholderStyle}>
+            <img src={src} srcSet={srcSet} alt={person.username}/>
           </div>
       }
     </div>
@@ -1,6 +1,7 @@
 import { Box, Divider, Stack } from "@chakra-ui/react";
 import { useMatch } from "@tanstack/react-router";
 import { useGetSchedule } from "../api";
+import usePrefetchPersons from "../api/usePrefetchPersons";
 import { Calendar } from "../api/api-generated-types";
 import SingleCalendar from "./singleCalendar";
 
@@ -14,13 +15,17 @@ const Schedule = () => {
     : config.categories[0];
 
   const personsMap = new Map(Object.entries(persons));
+  const visibleCalendars = calendars.filter((calendar) => calendar.category == category);
+  // Everyone visible is fetched at once, so opening the details of a person needs no request.
+  usePrefetchPersons({
+    personUids: visibleCalendars.flatMap((calendar) => calendar.events.map((event) => event.personUid))
+  });
 
   // Design heavily influenced by https://chakra-templates.dev/page-sections/pricing
   return (
     <Box py={6} px={5} width={"100%"}>
       <Stack spacing={4} width={"100%"} direction={"column"}>
-        {calendars
-          .filter((calendar) => calendar.category == category)
+        {visibleCalendars
           .map((calendar: Calendar, index) => (
             <Box key={index}>
               <Divider />
@@ -1,8 +1,17 @@
 import json
+from datetime import timedelta
+from typing import Any, List
 
 import pytest
+from pendulum.datetime import DateTime
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session as SASession
 
-from duty_board.alchemy import api_queries
+from duty_board.alchemy import api_queries, settings
+from duty_board.alchemy.session import create_async_session, create_session
+from duty_board.models.calendar import Calendar
+from duty_board.models.on_call_event import OnCallEvent
+from duty_board.models.person import Person
 
 
 def test_parse_extra_attributes() -> None:
@@ -19,3 +28,45 @@ def test_parse_extra_attributes() -> None:
 
     value = {"nickname": {"information": "henkie"}}
     api_queries.parse_extra_attributes(123, json.dumps(value))
+
+
+@pytest.mark.asyncio()
+@pytest.mark.usefixtures("_get_fake_dataset", "_dispose_async_engine")
+async def test_get_schedule_snapshot() -> None:
+    session: SASession
+    with create_session() as session:
+        calendar = session.scalars(select(Calendar).where(Calendar.uid == "data_platform_duty")).one()
+        persons = session.scalars(select(Person).order_by(Person.uid)).all()
+        now = DateTime.utcnow()
+        # Added out of order, and one that already ended.
+        for days, person in [(2, persons[0]), (0, persons[1]), (1, persons[0]), (-3, persons[1])]:
+            start = now + timedelta(days=days)
+            session.add(
+                OnCallEvent(
+                    calendar=calendar, person=person, start_event_utc=start, end_event_utc=start + timedelta(days=1)
+                )
+            )
+
+    statements: List[str] = []
+
+    def count_statements(*args: Any) -> None:
+        statements.append(args[2])
+
+    event.listen(settings.get_async_engine().sync_engine, "before_cursor_execute", count_statements)
+    try:
+        async with create_async_session() as async_session:
+            snapshot = await api_queries.get_schedule_snapshot(async_session, version=1)
+    finally:
+        event.remove(settings.get_async_engine().sync_engine, "before_cursor_execute", count_statements)
+    assert len(statements) == 1
+    assert [calendar.order for calendar in snapshot.calendars] == sorted(
+        calendar.order for calendar in snapshot.calendars
+    )
+    events = snapshot.calendars[0].events
+    assert [snapshot_event.person_uid for snapshot_event in events] == [persons[1].uid, persons[0].uid, persons[0].uid]
+    assert [snapshot_event.start_event_utc for snapshot_event in events] == sorted(
+        snapshot_event.start_event_utc for snapshot_event in events
+    )
+    assert all(not calendar.events for calendar in snapshot.calendars[1:])
+    assert set(snapshot.persons) == {persons[0].uid, persons[1].uid}
+    assert snapshot.persons[persons[0].uid].username == persons[0].username
@@ -0,0 +1,63 @@
+import time
+from datetime import datetime
+
+import pytest
+from pendulum.tz.timezone import UTC
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm.session import Session as SASession
+
+from duty_board.alchemy import settings
+from duty_board.alchemy.change_feed import CALENDAR_TOPIC, PERSON_TOPIC, ChangeFeedListener
+from duty_board.alchemy.data_version import SCHEDULE_DATA_VERSION
+from duty_board.alchemy.session import create_session
+from duty_board.models.person import Person
+
+
+def _wait_until_listening(listener: ChangeFeedListener) -> None:
+    for _ in range(100):
+        if listener.is_listening:
+            return
+        time.sleep(0.05)
+    raise AssertionError("The listener did not start listening.")
+
+
+@pytest.mark.usefixtures("_wipe_database")
+def test_change_feed_listener() -> None:
+    listener = ChangeFeedListener(engine=settings.engine).start()
+    try:
+        _wait_until_listening(listener)
+
+        generations = listener.get_generations()
+        assert not listener.wait([PERSON_TOPIC], timeout=0.1, since=generations)
+
+        session: SASession
+        with create_session() as session:
+            session.add(Person(username="jan", email=None, last_update_utc=datetime(1970, 1, 1, tzinfo=UTC)))
+        assert listener.wait([PERSON_TOPIC], timeout=5, since=generations)
+        assert not listener.wait([CALENDAR_TOPIC], timeout=0.1, since=generations)
+
+        # Changing a person that is part of the schedule bumps the schedule data version, which is notified as well.
+        generations = listener.get_generations()
+        with create_session() as session:
+            person = session.scalars(select(Person)).one()
+            person.username = "henk"
+        assert listener.wait([SCHEDULE_DATA_VERSION], timeout=5, since=generations)
+        # The refreshers only care about persons that have to be refreshed sooner than planned.
+        assert not listener.wait([PERSON_TOPIC], timeout=0.1, since=generations)
+
+        with create_session() as session:
+            person = session.scalars(select(Person)).one()
+            person.last_update_utc = datetime(1960, 1, 1, tzinfo=UTC)
+        assert listener.wait([PERSON_TOPIC], timeout=5, since=generations)
+    finally:
+        listener.stop()
+    assert not listener.is_listening
+
+
+def test_change_feed_listener_without_listen_polls() -> None:
+    listener = ChangeFeedListener(engine=create_engine("sqlite://")).start()
+    assert not listener.is_listening
+    start = time.monotonic()
+    # Without notifications, every wait tells the caller to check for changes after the timeout.
+    assert listener.wait([CALENDAR_TOPIC], timeout=0.1)
+    assert time.monotonic() - start >= 0.1
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+
+import pytest
+from pendulum.datetime import DateTime
+from pendulum.tz.timezone import UTC
+from sqlalchemy import select
+from sqlalchemy.orm.session import Session as SASession
+
+from duty_board.alchemy import refresh_schedule
+from duty_board.alchemy.session import create_session
+from duty_board.models.calendar import Calendar
+
+
+def test_get_retry_backoff() -> None:
+    hour, day = timedelta(hours=1), timedelta(days=1)
+    backoffs = [refresh_schedule.get_retry_backoff(failures, hour, max_backoff=day) for failures in range(1, 8)]
+    assert backoffs == [hour, 2 * hour, 4 * hour, 8 * hour, 16 * hour, day, day]
+    # We never retry sooner than the update frequency, and a huge number of failures does not overflow.
+    assert refresh_schedule.get_retry_backoff(1, 2 * day, max_backoff=day) == 2 * day
+    assert refresh_schedule.get_retry_backoff(10**6, hour, max_backoff=day) == day
+
+
+def _create_calendar(uid: str, last_update_utc: datetime) -> Calendar:
+    return Calendar(
+        uid=uid,
+        name=uid,
+        icalendar_url="https://non-existing-url.com/icalendar.ics",
+        category="Big Data",
+        order=1,
+        last_update_utc=last_update_utc,
+    )
+
+
+@pytest.mark.usefixtures("_wipe_database")
+def test_failing_calendars_back_off() -> None:
+    frequency, max_backoff = timedelta(hours=1), timedelta(days=1)
+    session: SASession
+    with create_session() as session:
+        assert refresh_schedule.get_next_due_utc(session, Calendar, update_frequency=frequency) is None
+        session.add(_create_calendar("failing", last_update_utc=datetime(1970, 1, 1, tzinfo=UTC)))
+        session.add(_create_calendar("working", last_update_utc=DateTime.utcnow() - timedelta(minutes=30)))
+
+    with create_session() as session:
+        calendar = session.scalars(select(Calendar).where(Calendar.uid == "failing")).one()
+        for _ in range(3):
+            refresh_schedule.record_sync_result(
+                calendar, failed=True, update_frequency=frequency, max_backoff=max_backoff
+            )
+        assert calendar.consecutive_failures == 3
+        assert calendar.retry_after_utc == calendar.last_update_utc + 4 * frequency
+
+    with create_session() as session:
+        now = DateTime.utcnow()
+        # The failing calendar backs off, so the working calendar is due first.
+        next_due_utc = refresh_schedule.get_next_due_utc(session, Calendar, update_frequency=frequency)
+        assert next_due_utc is not None
+        assert now + timedelta(minutes=29) < next_due_utc < now + timedelta(minutes=31)
+        due_calendars = session.scalars(select(Calendar).where(refresh_schedule.is_due(Calendar, frequency, now=now)))
+        assert list(due_calendars) == []
+        later = now + 3 * frequency
+        due_calendars = session.scalars(select(Calendar).where(refresh_schedule.is_due(Calendar, frequency, now=later)))
+        assert [calendar.uid for calendar in due_calendars] == ["working"]
+
+        calendar = session.scalars(select(Calendar).where(Calendar.uid == "failing")).one()
+        refresh_schedule.record_sync_result(calendar, failed=False, update_frequency=frequency, max_backoff=max_backoff)
+        assert calendar.consecutive_failures == 0
+        assert calendar.retry_after_utc is None
@@ -0,0 +1,28 @@
+from pathlib import Path
+from typing import Generator
+
+import pytest
+
+from duty_board.alchemy import settings
+
+
+@pytest.fixture()
+def _reset_async_engine() -> Generator[None, None, None]:
+    settings.get_async_engine.cache_clear()
+    settings.get_async_session_maker.cache_clear()
+    yield
+    settings.get_async_engine.cache_clear()
+    settings.get_async_session_maker.cache_clear()
+
+
+@pytest.mark.usefixtures("_reset_async_engine")
+def test_async_connection_override_with_unsupported_backend(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    monkeypatch.setattr(settings, "SQL_ALCHEMY_CONN", "mssql+pyodbc://user@host/duty_board")
+    monkeypatch.setattr(settings, "SQL_ALCHEMY_ASYNC_CONN", None)
+    # Without the override, the async engine can't be derived. But only the webserver notices, once it uses the engine.
+    with pytest.raises(ValueError, match="SQL_ALCHEMY_ASYNC_CONNECTION"):
+        settings.get_async_engine()
+
+    monkeypatch.setattr(settings, "SQL_ALCHEMY_ASYNC_CONN", f"sqlite+aiosqlite:///{tmp_path / 'duty_board.db'}")
+    assert settings.get_async_engine().url.drivername == "sqlite+aiosqlite"
+    assert settings.get_async_session_maker().kw["bind"] is settings.get_async_engine()
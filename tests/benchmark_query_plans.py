@@ -0,0 +1,138 @@
+"""
+Shows how the indexes change the query plans of the hot queries on a large, seeded dataset.
+Only works with Postgres. Everything happens in a single transaction that is rolled back, so the database is untouched.
+
+Run it with: python -m tests.benchmark_query_plans --persons 20000 --calendars 200 --years 10
+"""
+import argparse
+import json
+from datetime import timedelta
+from typing import Any, Dict, Iterator, List, Tuple
+
+from pendulum.datetime import DateTime
+from sqlalchemy import Connection, Select, func, select, text
+
+from duty_board.alchemy import refresh_schedule, settings
+from duty_board.models.calendar import Calendar
+from duty_board.models.on_call_event import OnCallEvent
+from duty_board.models.person import Person
+
+
+def seed(connection: Connection, persons: int, calendars: int, years: int) -> None:
+    """Creates the persons and calendars, with a daily on-call event per calendar for the given number of years."""
+    connection.execute(
+        text(
+            """
+            INSERT INTO person (username, email, error_msg, last_update_utc, sync)
+            SELECT 'benchmark-' || i, 'benchmark-' || i || '@example.com',
+                CASE WHEN i % 100 = 0 THEN 'Failed to sync' END, now() - i * interval '1 second', true
+            FROM generate_series(1, :persons) AS i
+            """
+        ),
+        {"persons": persons},
+    )
+    connection.execute(
+        text(
+            """
+            INSERT INTO calendar (uid, name, category, "order", icalendar_url, last_update_utc, sync)
+            SELECT 'benchmark-' || i, 'Benchmark ' || i, 'Benchmark', i, 'https://example.com/' || i || '.ics',
+                now() - i * interval '1 minute', true
+            FROM generate_series(1, :calendars) AS i
+            """
+        ),
+        {"calendars": calendars},
+    )
+    # Most of the events are history, only the last month is upcoming.
+    connection.execute(
+        text(
+            """
+            INSERT INTO on_call_event (start_event_utc, end_event_utc, calendar_uid, person_uid)
+            WITH benchmark_person AS (SELECT array_agg(uid) AS uids FROM person WHERE username LIKE 'benchmark-%')
+            SELECT day, day + interval '1 day', calendar.uid,
+                benchmark_person.uids[1 + abs(hashtext(calendar.uid || day::text)) % :persons]
+            FROM benchmark_person, calendar, generate_series(
+                now() - make_interval(years => :years), now() + interval '28 days', interval '1 day'
+            ) AS day
+            WHERE calendar.uid LIKE 'benchmark-%'
+            """
+        ),
+        {"persons": persons, "years": years},
+    )
+    connection.execute(text("ANALYZE calendar, person, on_call_event"))
+
+
+def get_hot_queries() -> Dict[str, "Select[Any]"]:
+    now = DateTime.utcnow()
+    return {
+        "Upcoming events": select(OnCallEvent)
+        .where(OnCallEvent.end_event_utc >= now)
+        .order_by(OnCallEvent.start_event_utc),
+        "Current events": select(OnCallEvent)
+        .where(OnCallEvent.start_event_utc <= now)
+        .where(OnCallEvent.end_event_utc > now),
+        "Events of a calendar": select(OnCallEvent).where(OnCallEvent.calendar_uid == "benchmark-1"),
+        "Events of a person": select(OnCallEvent).where(
+            OnCallEvent.person_uid == select(func.min(Person.uid)).scalar_subquery()
+        ),
+        "Most outdated calendar": select(Calendar)
+        .where(refresh_schedule.is_due(Calendar, timedelta(0), now=now))
+        .order_by(Calendar.last_update_utc)
+        .limit(1),
+        "Most outdated persons": select(Person)
+        .where(refresh_schedule.is_due(Person, timedelta(0), now=now))
+        .order_by(Person.last_update_utc)
+        .limit(25),
+        "Persons by email": select(Person).where(
+            Person.email.in_([f"benchmark-{i}@example.com" for i in range(1, 11)])
+        ),
+        "Persons by username": select(Person).where(Person.username.in_([f"benchmark-{i}" for i in range(1, 11)])),
+        "Persons that failed to refresh": select(func.count(Person.uid)).where(Person.error_msg != None),  # noqa: E711
+    }
+
+
+def _iter_node_types(plan: Dict[str, Any]) -> Iterator[str]:
+    node_type: str = plan["Node Type"]
+    yield f"{node_type} on {plan['Index Name']}" if "Index Name" in plan else node_type
+    for sub_plan in plan.get("Plans", []):
+        yield from _iter_node_types(sub_plan)
+
+
+def explain(connection: Connection, stmt: "Select[Any]") -> Tuple[List[str], float]:
+    """Returns the node types of the plan and the execution time in milliseconds."""
+    compiled = stmt.compile(dialect=connection.dialect, compile_kwargs={"render_postcompile": True})
+    result = connection.exec_driver_sql(f"EXPLAIN (ANALYZE, FORMAT JSON) {compiled}", compiled.params).scalar_one()
+    explained = result if isinstance(result, list) else json.loads(result)
+    return list(_iter_node_types(explained[0]["Plan"])), explained[0]["Execution Time"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--persons", type=int, default=20_000)
+    parser.add_argument("--calendars", type=int, default=200)
+    parser.add_argument("--years", type=int, default=10)
+    args = parser.parse_args()
+
+    with settings.engine.connect() as connection:
+        if connection.dialect.name != "postgresql":
+            raise RuntimeError("The benchmark only supports Postgres.")
+        transaction = connection.begin()
+        try:
+            seed(connection, persons=args.persons, calendars=args.calendars, years=args.years)
+            with_indexes = {name: explain(connection, stmt) for name, stmt in get_hot_queries().items()}
+            # Postgres has transactional DDL, so dropping the indexes is rolled back as well.
+            for table in (Calendar.__table__, Person.__table__, OnCallEvent.__table__):
+                for index in table.indexes:  # type: ignore[attr-defined]
+                    connection.execute(text(f"DROP INDEX {index.name}"))
+            without_indexes = {name: explain(connection, stmt) for name, stmt in get_hot_queries().items()}
+        finally:
+            transaction.rollback()
+
+    for name, (plan, execution_time) in with_indexes.items():
+        plan_without_indexes, execution_time_without_indexes = without_indexes[name]
+        print(f"{name}:")
+        print(f"  without indexes: {execution_time_without_indexes:9.2f} ms  {' > '.join(plan_without_indexes)}")
+        print(f"  with indexes:    {execution_time:9.2f} ms  {' > '.join(plan)}")
+
+
+if __name__ == "__main__":
+    main()
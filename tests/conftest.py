@@ -5,9 +5,10 @@ import subprocess
 from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import Generator, List
+from typing import AsyncGenerator, Generator, List
 
 import pytest
+import pytest_asyncio
 from pendulum.tz.timezone import UTC
 from sqlalchemy import delete
 from sqlalchemy.orm.session import Session as SASession
@@ -29,7 +30,7 @@ os.environ["LDAP_PASSWORD"] = "adminpassword"  # noqa: S105
 @pytest.fixture(scope="session", autouse=True)
 def _auto_kill_docker_refreshers() -> None:
     # We kill the docker containers that would automatically refresh stuff in the background.
-    containers_to_kill: List[str] = ["duty_worker_calendar", "duty_worker_persons"]
+    containers_to_kill: List[str] = ["duty_worker_calendar", "duty_worker_persons", "duty_worker_event_pruner"]
     if docker_path := shutil.which("docker"):
         subprocess.run([docker_path, "stop", *containers_to_kill])  # noqa: PLW1510, S603
 
@@ -53,6 +54,13 @@ def get_loaded_ldap_plugin() -> Generator[ExamplePlugin, None, None]:
         yield ExamplePlugin()
 
 
+@pytest_asyncio.fixture()
+async def _dispose_async_engine() -> AsyncGenerator[None, None]:
+    # The asyncio connections are bound to the event loop of the test, so they can't be reused by the next test.
+    yield
+    await settings.get_async_engine().dispose()
+
+
 @pytest.fixture()
 def _wipe_database() -> None:
     session = settings.Session()
@@ -0,0 +1,63 @@
+import datetime
+import hashlib
+from typing import List
+
+from duty_board.plugin.helpers.ical_prefilter import iter_unfolded_lines, prefilter_events
+
+
+def test_iter_unfolded_lines() -> None:
+    content = "BEGIN:VCALENDAR\r\nSUMMARY:duty: a very\r\n  long summary with ü\r\nEND:VCALENDAR".encode()
+    # Split in the middle of lines and of the multibyte character.
+    chunks = [content[i : i + 7] for i in range(0, len(content), 7)]
+    content_hash = hashlib.sha256()
+    lines = list(iter_unfolded_lines(chunks, encoding="utf-8", on_chunk=content_hash.update))
+    assert lines == ["BEGIN:VCALENDAR", "SUMMARY:duty: a very long summary with ü", "END:VCALENDAR"]
+    assert content_hash.hexdigest() == hashlib.sha256(content).hexdigest()
+
+
+def _create_event(*properties: str) -> List[str]:
+    return ["BEGIN:VEVENT", *properties, "END:VEVENT"]
+
+
+def test_prefilter_events() -> None:
+    in_window = _create_event("DTSTART:20240110T020000Z", "DTEND:20240111T020000Z", "SUMMARY:duty: jan")
+    started_before_window = _create_event("DTSTART;VALUE=DATE:20231201", "DTEND;VALUE=DATE:20240107", "SUMMARY:duty: a")
+    without_prefix = _create_event("DTSTART:20240110T020000Z", "DTEND:20240111T020000Z", "SUMMARY:lunch")
+    in_the_past = _create_event("DTSTART:20231110T020000Z", "DTEND:20231111T020000Z", "SUMMARY:duty: henk")
+    in_the_future = _create_event("DTSTART:20240510T020000Z", "DTEND:20240511T020000Z", "SUMMARY:duty: henk")
+    ongoing_series = _create_event("DTSTART:20200101T020000Z", "RRULE:FREQ=WEEKLY", "SUMMARY:lunch")
+    ended_series = _create_event("DTSTART:20200101T020000Z", "RRULE:FREQ=WEEKLY;UNTIL=20210101T000000Z")
+    changed_occurrence = _create_event("DTSTART:20200108T020000Z", "RECURRENCE-ID:20200108T020000Z", "SUMMARY:x")
+    with_duration = _create_event("DTSTART:20231231T020000Z", "DURATION:P3D", "SUMMARY:duty: piet")
+    header = ["BEGIN:VCALENDAR", "BEGIN:VTIMEZONE", "TZID:Europe/Amsterdam", "END:VTIMEZONE"]
+    lines = [
+        *header,
+        *in_window,
+        *started_before_window,
+        *without_prefix,
+        *in_the_past,
+        *in_the_future,
+        *ongoing_series,
+        *ended_series,
+        *changed_occurrence,
+        *with_duration,
+        "END:VCALENDAR",
+    ]
+
+    result = list(
+        prefilter_events(
+            lines,
+            window_start=datetime.date(2024, 1, 5),
+            window_end=datetime.date(2024, 2, 2),
+            event_prefix="duty: ",
+        )
+    )
+    assert result == [
+        *header,
+        *in_window,
+        *started_before_window,
+        *ongoing_series,
+        *changed_occurrence,
+        *with_duration,
+        "END:VCALENDAR",
+    ]
@@ -0,0 +1,23 @@
+import hashlib
+from pathlib import Path
+
+import pytest
+
+from duty_board.plugin.helpers.image_store import FileSystemImageStore
+
+
+def test_file_system_image_store(tmp_path: Path) -> None:
+    image_store = FileSystemImageStore(tmp_path)
+    key = image_store.store(b"an image")
+    assert key == hashlib.sha256(b"an image").hexdigest()
+    assert image_store.get_path(key) == tmp_path / key[:2] / key
+    assert image_store.get_path(key).read_bytes() == b"an image"
+    # Identical content is stored once.
+    assert image_store.store(b"an image") == key
+    other_key = image_store.store(b"another image")
+    assert sorted(image_store.iter_keys()) == sorted([key, other_key])
+
+    image_store.remove(key)
+    assert list(image_store.iter_keys()) == [other_key]
+    with pytest.raises(ValueError, match="Invalid key"):
+        image_store.get_path("../../etc/passwd")
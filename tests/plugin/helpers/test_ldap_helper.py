@@ -1,6 +1,6 @@
 import pytest
 
-from duty_board.plugin.helpers.ldap_helper import LDAPBaseClient
+from duty_board.plugin.helpers.ldap_helper import LDAPBaseClient, LDAPPersonSearch
 
 
 @pytest.fixture()
@@ -56,6 +56,24 @@ def test_get_user(ldap_base_client: LDAPBaseClient) -> None:
     assert result is None
 
 
+def test_get_users(ldap_base_client: LDAPBaseClient) -> None:
+    result = ldap_base_client.get_users(["jan", "henk@tank.nl", "non-existing-jan"], attributes=["cn"], chunk_size=2)
+    assert [dn for dn, _ in result["jan"]] == ["uid=jan,ou=People,dc=DutyBoard,dc=com"]
+    assert sorted(result["jan"][0][1].keys()) == ["cn", "mail"]
+    assert [dn for dn, _ in result["henk@tank.nl"]] == ["uid=henk,ou=People,dc=DutyBoard,dc=com"]
+    assert result["non-existing-jan"] == []
+
+
+def test_person_search_is_match() -> None:
+    person_search = LDAPPersonSearch(base_dn="dc=DutyBoard,dc=com", account_attribute="uid", name="jan")
+    assert person_search.is_match("uid=jan,ou=People,dc=DutyBoard,dc=com", {}) is True
+    assert person_search.is_match("uid=janneke,ou=People,dc=DutyBoard,dc=com", {}) is False
+
+    person_search = LDAPPersonSearch(base_dn="dc=DutyBoard,dc=com", account_attribute="uid", name="Jan@Schoenmaker.nl")
+    assert person_search.is_match("uid=jan,ou=People,dc=DutyBoard,dc=com", {"mail": ["jan@schoenmaker.nl"]}) is True
+    assert person_search.is_match("uid=jan,ou=People,dc=DutyBoard,dc=com", {"mail": ["henk@tank.nl"]}) is False
+
+
 def test_is_existing_user(ldap_base_client: LDAPBaseClient) -> None:
     assert ldap_base_client.is_existing_user("jan") is True
     assert ldap_base_client.is_existing_user("henk") is True
@@ -1,11 +1,16 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
-from typing import List, Optional, Tuple
+from typing import Any, List, Optional, Tuple
+from unittest.mock import patch
 
 import requests_mock
 from pendulum.datetime import DateTime
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session as SASession
 
 from duty_board.alchemy import settings
 from duty_board.models.calendar import Calendar
+from duty_board.models.on_call_event import OnCallEvent
 from duty_board.models.person import Person
 from duty_board.plugin.example.example_plugin import ExamplePlugin
 from tests import ical_helper
@@ -56,3 +61,205 @@ def test_sync_calendar(set_up_persons: Person) -> None:
         assert calendar.events[3].person.email is None
         assert str(calendar.events[3].start_event_utc) == get_timestamp(timedelta(days=22))
         assert str(calendar.events[3].end_event_utc) == get_timestamp(timedelta(days=42))
+
+
+def test_sync_calendar_keeps_every_event_of_a_short_rotation(set_up_persons: Person) -> None:
+    calendar = Calendar(
+        uid="duty-board-test-calendar",
+        name="DutyBoard Test calendar",
+        description="We will mock this request anyway",
+        category="Big Data",
+        order=1,
+        icalendar_url="https://non-existing-url.com/icalendar.ics",
+    )
+    plugin: ExamplePlugin
+    with get_loaded_ldap_plugin() as plugin, requests_mock.Mocker() as m:
+        # A daily rotation has more events in the upcoming 4 weeks than we used to keep.
+        events: List[Tuple[Optional[str], Optional[str], timedelta, timedelta]] = [
+            ("jan" if day % 2 == 0 else "piet", None, timedelta(days=day), timedelta(days=1)) for day in range(35)
+        ]
+        m.get("https://non-existing-url.com/icalendar.ics", text=ical_helper.get_icalendar_response(events=events))
+        calendar = plugin.sync_calendar(calendar=calendar, session=settings.Session())
+        assert len(calendar.events) >= 28  # Depending on the time of day, the 29th day overlaps with the window.
+
+
+def test_sync_calendar_skips_unchanged_icalendar(set_up_persons: Person) -> None:
+    calendar = Calendar(
+        uid="duty-board-test-calendar",
+        name="DutyBoard Test calendar",
+        description="We will mock this request anyway",
+        category="Big Data",
+        order=1,
+        icalendar_url="https://non-existing-url.com/icalendar.ics",
+    )
+    url = "https://non-existing-url.com/icalendar.ics"
+    plugin: ExamplePlugin
+    with get_loaded_ldap_plugin() as plugin, requests_mock.Mocker() as m:
+        ical_response = ical_helper.get_icalendar_response(events=[("jan", None, timedelta(days=0), timedelta(days=1))])
+        m.get(url, text=ical_response, headers={"ETag": '"v1"', "Last-Modified": "Wed, 21 Oct 2015 07:28:00 GMT"})
+        calendar = plugin.sync_calendar(calendar=calendar, session=settings.Session())
+        assert "If-None-Match" not in m.last_request.headers
+        assert len(calendar.events) == 1
+        assert calendar.icalendar_etag == '"v1"'
+        assert calendar.icalendar_content_hash is not None
+        parsed_events = calendar.events
+
+        # The server tells us nothing changed.
+        m.get(url, status_code=304)
+        calendar = plugin.sync_calendar(calendar=calendar, session=settings.Session())
+        assert m.last_request.headers["If-None-Match"] == '"v1"'
+        assert m.last_request.headers["If-Modified-Since"] == "Wed, 21 Oct 2015 07:28:00 GMT"
+        assert calendar.events is parsed_events
+
+        # The server does not support conditional requests, but the content is the same.
+        m.get(url, text=ical_response)
+        calendar = plugin.sync_calendar(calendar=calendar, session=settings.Session())
+        assert calendar.events is parsed_events
+        assert calendar.icalendar_etag is None
+
+        # Once the window moved enough, we parse it again, even though nothing changed.
+        calendar.events_parsed_utc = DateTime.utcnow() - plugin.ICALENDAR_REPARSE_INTERVAL
+        calendar = plugin.sync_calendar(calendar=calendar, session=settings.Session())
+        assert calendar.events is not parsed_events
+        assert len(calendar.events) == 1
+
+
+def test_sync_calendar_skips_parsing_on_not_modified_with_default_frequencies(set_up_persons: Person) -> None:
+    url = "https://non-existing-url.com/icalendar.ics"
+    calendar = Calendar(
+        uid="duty-board-test-calendar",
+        name="DutyBoard Test calendar",
+        description="We will mock this request anyway",
+        category="Big Data",
+        order=1,
+        icalendar_url=url,
+    )
+    plugin: ExamplePlugin
+    with get_loaded_ldap_plugin() as plugin, requests_mock.Mocker() as m:
+        ical_response = ical_helper.get_icalendar_response(events=[("jan", None, timedelta(days=0), timedelta(days=1))])
+        m.get(url, text=ical_response, headers={"ETag": '"v1"'})
+        calendar = plugin.sync_calendar(calendar=calendar, session=settings.Session())
+        parsed_events = calendar.events
+
+        # The refresher only fetches the calendar again once the calendar_update_frequency passed.
+        assert calendar.events_parsed_utc is not None
+        calendar.events_parsed_utc -= plugin.calendar_update_frequency
+        m.get(url, status_code=304)
+        with patch.object(plugin, "_get_events_for_upcoming_month") as get_events_for_upcoming_month:
+            calendar = plugin.sync_calendar(calendar=calendar, session=settings.Session())
+        assert m.last_request.headers["If-None-Match"] == '"v1"'
+        get_events_for_upcoming_month.assert_not_called()
+        assert calendar.events is parsed_events
+
+
+def test_sync_calendar_reconciles_events(set_up_persons: Person) -> None:
+    url = "https://non-existing-url.com/icalendar.ics"
+    session = settings.Session()
+    calendar = Calendar(
+        uid="duty-board-test-calendar",
+        name="DutyBoard Test calendar",
+        description="We will mock this request anyway",
+        category="Big Data",
+        order=1,
+        icalendar_url=url,
+        last_update_utc=DateTime.utcnow(),
+    )
+    session.add(calendar)
+    plugin: ExamplePlugin
+    with get_loaded_ldap_plugin() as plugin, requests_mock.Mocker() as m:
+        m.get(
+            url, text=ical_helper.get_icalendar_response(events=[("jan", None, timedelta(days=0), timedelta(days=1))])
+        )
+        calendar = plugin.sync_calendar(calendar=calendar, session=session)
+        session.commit()
+        unchanged_event = calendar.events[0]
+        unchanged_event_uid = unchanged_event.uid
+        ended_event = OnCallEvent(
+            calendar_uid=calendar.uid,
+            start_event_utc=DateTime.utcnow() - timedelta(days=3),
+            end_event_utc=DateTime.utcnow() - timedelta(days=2),
+            person=unchanged_event.person,
+        )
+        calendar.events.append(ended_event)
+        session.commit()
+
+        events: List[Tuple[Optional[str], Optional[str], timedelta, timedelta]] = [
+            ("jan", None, timedelta(days=0), timedelta(days=1)),
+            ("henk", None, timedelta(days=1), timedelta(days=1)),
+            ("new-person", None, timedelta(days=2), timedelta(days=1)),
+            ("new-person", None, timedelta(days=3), timedelta(days=1)),
+        ]
+        calendar.events_parsed_utc = None
+        m.get(url, text=ical_helper.get_icalendar_response(events=events))
+        calendar = plugin.sync_calendar(calendar=calendar, session=session)
+        session.commit()
+        # The unchanged event keeps its identity, the new ones are inserted and the ended one is kept as history.
+        assert [on_call_event.person.username for on_call_event in calendar.events] == [
+            "jan",
+            "henk",
+            "new-person",
+            "new-person",
+            "jan",
+        ]
+        assert calendar.events[0] is unchanged_event
+        assert calendar.events[0].uid == unchanged_event_uid
+        assert calendar.events[-1] is ended_event
+        assert calendar.events[2].person is calendar.events[3].person
+
+        # Events that are no longer in the iCalendar are deleted.
+        calendar.events_parsed_utc = None
+        m.get(url, text=ical_helper.get_icalendar_response(events=events[1:2]))
+        calendar = plugin.sync_calendar(calendar=calendar, session=session)
+        session.commit()
+        remaining_uids = set(session.scalars(select(OnCallEvent.uid).where(OnCallEvent.calendar_uid == calendar.uid)))
+        assert remaining_uids == {calendar.events[0].uid, ended_event.uid}
+        assert unchanged_event_uid not in remaining_uids
+
+
+def test_get_or_create_persons(set_up_persons: Person) -> None:
+    session = settings.Session()
+    statements: List[str] = []
+
+    def count_statements(*args: Any) -> None:
+        statements.append(args[2])
+
+    plugin: ExamplePlugin
+    with get_loaded_ldap_plugin() as plugin:
+        event.listen(settings.engine, "before_cursor_execute", count_statements)
+        try:
+            persons = plugin._get_or_create_persons(["jan", "henk@tank.nl", "jan", "new-person"], session=session)
+        finally:
+            event.remove(settings.engine, "before_cursor_execute", count_statements)
+        assert len([statement for statement in statements if statement.startswith("INSERT")]) == 1
+        assert persons["jan"].email == "jan@schoenmaker.nl"
+        assert persons["henk@tank.nl"].username == "henk"
+        assert persons["new-person"].uid is not None
+        assert persons["new-person"].email is None
+        assert set(plugin._person_uid_cache) == {"jan", "henk@tank.nl", "new-person"}
+
+        # A cached uid that no longer exists, is looked up by username again.
+        plugin._person_uid_cache["jan"] = (-1, DateTime.utcnow() + timedelta(hours=1))
+        assert plugin._get_or_create_persons(["jan"], session=session)["jan"] is persons["jan"]
+        assert plugin._person_uid_cache["jan"][0] == persons["jan"].uid
+
+
+def test_get_or_create_persons_creates_a_new_person_once(set_up_persons: Person) -> None:
+    plugin: ExamplePlugin
+    with get_loaded_ldap_plugin() as plugin:
+        # The first sync holds on to its new persons until it commits, while the other sync tries to create them too.
+        first_session = SASession(settings.engine)
+        first_persons = plugin._get_or_create_persons(["new-person", "new@person.nl"], session=first_session)
+        plugin._person_uid_cache.clear()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            second_session = SASession(settings.engine)
+            future = executor.submit(plugin._get_or_create_persons, ["new@person.nl", "new-person"], second_session)
+            first_session.commit()
+            second_persons = future.result(timeout=10)
+            second_session.commit()
+
+        assert second_persons["new-person"].uid == first_persons["new-person"].uid
+        assert second_persons["new@person.nl"].uid == first_persons["new@person.nl"].uid
+        stmt = select(func.count()).where(Person.username.in_(["new-person"]) | Person.email.in_(["new@person.nl"]))
+        assert settings.Session().scalar(stmt) == 2
+        first_session.close()
+        second_session.close()
@@ -37,6 +37,22 @@ def test_sync_person() -> None:
         verify_jan_got_filled_correctly(person)
 
 
+def test_sync_persons() -> None:
+    plugin: ExamplePlugin
+    with get_loaded_ldap_plugin() as plugin:
+        persons = [
+            Person(uid=1, username="jan"),
+            Person(uid=2, email="jan@schoenmaker.nl"),
+            Person(uid=3, username="x"),
+        ]
+        error_messages = plugin.sync_persons(persons=persons, session=settings.Session())
+        assert error_messages[1] is None
+        assert error_messages[2] is None
+        assert "Could not find user x" in (error_messages[3] or "")
+        verify_jan_got_filled_correctly(persons[0])
+        verify_jan_got_filled_correctly(persons[1])
+
+
 @pytest.mark.asyncio()
 async def test_admin_login_attempt() -> None:
     with get_loaded_ldap_plugin() as plugin:
@@ -1,20 +1,40 @@
+import base64
+import datetime
+import io
 from pathlib import Path
+from typing import Generator
 
 import pytest
+import pytz
+from pendulum.datetime import DateTime
+from PIL import Image
 from sqlalchemy import select
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.orm.session import Session as SASession
 from starlette.testclient import TestClient
 
+from duty_board import server
+from duty_board.alchemy import api_queries, move_person_images
 from duty_board.alchemy.session import create_session
+from duty_board.models.calendar import Calendar
+from duty_board.models.on_call_event import OnCallEvent
 from duty_board.models.person import Person
 from duty_board.models.person_image import PersonImage
+from duty_board.models.person_image_variant import PersonImageVariant
+from duty_board.plugin.helpers import image_helper
+from duty_board.plugin.helpers.image_store import FileSystemImageStore
 from duty_board.server import app
 
 
+@pytest.fixture()
+def client() -> Generator[TestClient, None, None]:
+    # Running the lifespan makes sure the asyncio connections are closed before the event loop is closed.
+    with TestClient(app) as test_client:
+        yield test_client
+
+
 @pytest.mark.usefixtures("_get_fake_dataset")
-def test_get_schedule() -> None:
-    client = TestClient(app)
+def test_get_schedule(client: TestClient) -> None:
     result = client.get("/schedule", params={"timezone": "Europe/Amsterdam"})
     result_json = result.json()
     assert result_json["config"] == {
@@ -65,8 +85,95 @@ def test_get_schedule() -> None:
 
 
 @pytest.mark.usefixtures("_get_fake_dataset")
-def test_get_person() -> None:
-    client = TestClient(app)
+def test_get_schedule_not_modified(client: TestClient) -> None:
+    result = client.get("/schedule", params={"timezone": "Europe/Amsterdam"})
+    assert result.status_code == 200
+    etag = result.headers["etag"]
+    assert result.headers["cache-control"] == "no-cache"
+
+    result = client.get("/schedule", params={"timezone": "Europe/Amsterdam"}, headers={"If-None-Match": etag})
+    assert result.status_code == 304
+    assert result.content == b""
+    assert result.headers["etag"] == etag
+
+    # A different timezone leads to a different response.
+    result = client.get("/schedule", params={"timezone": "Asia/Tokyo"}, headers={"If-None-Match": etag})
+    assert result.status_code == 200
+    assert result.headers["etag"] != etag
+    assert result.json()["config"]["timezone"] == "Asia/Tokyo"
+
+
+@pytest.mark.usefixtures("_get_fake_dataset")
+def test_get_schedule_compact(client: TestClient) -> None:
+    session: SASession
+    with create_session() as session:
+        calendar = session.scalars(select(Calendar).where(Calendar.uid == "data_platform_duty")).one()
+        persons = session.scalars(select(Person).order_by(Person.uid)).all()
+        now = DateTime.utcnow()
+        for days, person in enumerate([persons[0], persons[1], persons[0]]):
+            start = now + datetime.timedelta(days=days)
+            session.add(
+                OnCallEvent(
+                    calendar=calendar,
+                    person=person,
+                    start_event_utc=start,
+                    end_event_utc=start + datetime.timedelta(days=1),
+                )
+            )
+    server.schedule_cache.invalidate()  # Otherwise, the snapshot of a previous test might still be fresh.
+
+    default = client.get("/schedule", params={"timezone": "Europe/Amsterdam"}).json()
+    result = client.get("/schedule", params={"timezone": "Europe/Amsterdam", "format": "compact"})
+    assert result.headers["etag"] != client.get("/schedule", params={"timezone": "Europe/Amsterdam"}).headers["etag"]
+    compact = result.json()
+    assert compact["config"] == default["config"]
+    assert sorted(compact["persons"], key=lambda person: person["uid"]) == sorted(
+        default["persons"].values(), key=lambda person: person["uid"]
+    )
+
+    amsterdam = pytz.timezone("Europe/Amsterdam")
+    for compact_calendar, calendar in zip(compact["calendars"], default["calendars"]):
+        assert compact_calendar["uid"] == calendar["uid"]
+        events = [
+            {
+                "start_event": api_queries.format_datetime_for_timezone(
+                    datetime.datetime.fromtimestamp(start, tz=datetime.timezone.utc), amsterdam
+                ),
+                "end_event": api_queries.format_datetime_for_timezone(
+                    datetime.datetime.fromtimestamp(end, tz=datetime.timezone.utc), amsterdam
+                ),
+                "person_uid": compact["persons"][person_idx]["uid"],
+            }
+            for start, end, person_idx in zip(
+                compact_calendar["starts"], compact_calendar["ends"], compact_calendar["person_idx"]
+            )
+        ]
+        assert events == calendar["events"]
+    assert [len(calendar["starts"]) for calendar in compact["calendars"]] == [3, 0, 0]
+    assert compact["calendars"][0]["person_idx"] == [0, 1, 0]
+
+
+@pytest.mark.usefixtures("_get_fake_dataset")
+def test_get_schedule_compressed(client: TestClient) -> None:
+    server.schedule_cache.invalidate()  # Otherwise, the snapshot of a previous test might still be fresh.
+    uncompressed = client.get("/schedule", params={"timezone": "Europe/Amsterdam"}, headers={"Accept-Encoding": ""})
+    assert "content-encoding" not in uncompressed.headers
+    assert uncompressed.headers["vary"] == "Accept-Encoding"
+
+    result = client.get("/schedule", params={"timezone": "Europe/Amsterdam"}, headers={"Accept-Encoding": "gzip"})
+    assert result.headers["content-encoding"] == "gzip"
+    assert result.headers["etag"] == f"W/{uncompressed.headers['etag']}"
+    assert result.content == uncompressed.content  # The test client decompresses it.
+    result = client.get(
+        "/schedule",
+        params={"timezone": "Europe/Amsterdam"},
+        headers={"Accept-Encoding": "gzip", "If-None-Match": result.headers["etag"]},
+    )
+    assert result.status_code == 304
+
+
+@pytest.mark.usefixtures("_get_fake_dataset")
+def test_get_person(client: TestClient) -> None:
     session: SASession
     with create_session() as session:
         person: Person = session.scalars(select(Person).where(Person.username == "bart")).one()
@@ -76,6 +183,7 @@ def test_get_person() -> None:
     assert result_json["username"] == "bart"
     assert result_json["email"] == "bart@gmail.com"
     assert result_json["img_filename"] is None
+    assert result_json["img_content_hash"] is None
     assert result_json["img_width"] is None
     assert result_json["img_height"] is None
     assert result_json["extra_attributes"] == [
@@ -91,16 +199,44 @@ def test_get_person() -> None:
     assert result_json["sync"] is False
 
 
+@pytest.mark.usefixtures("_get_fake_dataset")
+def test_get_persons(client: TestClient) -> None:
+    image_in_bytes = (Path(__file__).parent / "data" / "openldap_ldifs" / "jan.jpeg").read_bytes()
+    session: SASession
+    with create_session() as session:
+        persons = {person.username: person for person in session.scalars(select(Person))}
+        persons["bart"].image = PersonImage(
+            image_in_bytes=image_in_bytes,
+            variants=image_helper.create_image_variants(
+                image_in_bytes, sizes=[50, 100, 200], media_types=["image/webp", "image/jpeg"]
+            ),
+        )
+
+    person_uids = [persons["bart"].uid, persons["jorrick"].uid, 999999999]
+    params = {"person_uids": person_uids, "timezone": "Europe/Amsterdam", "thumbnail_size": 64}
+    result_json = client.get("/persons", params=params).json()
+    assert sorted(result_json["persons"]) == sorted(str(uid) for uid in person_uids[:2])
+    bart = result_json["persons"][str(persons["bart"].uid)]
+    assert (
+        bart == client.get("/person", params={"person_uid": persons["bart"].uid, "timezone": "Europe/Amsterdam"}).json()
+    )
+    assert list(result_json["thumbnails"]) == [str(persons["bart"].uid)]
+    media_type, content = result_json["thumbnails"][str(persons["bart"].uid)].split(",")
+    assert media_type == "data:image/webp;base64"
+    assert Image.open(io.BytesIO(base64.b64decode(content))).width == 100
+
+    result_json = client.get("/persons", params={"person_uids": person_uids, "timezone": "Europe/Amsterdam"}).json()
+    assert result_json["thumbnails"] == {}
+
+
 @pytest.mark.usefixtures("_wipe_database")
-def test_empty_persons_table() -> None:
-    client = TestClient(app)
+def test_empty_persons_table(client: TestClient) -> None:
     with pytest.raises(ValueError, match="Invalid person_uid=0 passed."):
         client.get("/person", params={"person_uid": 0, "timezone": "Europe/Amsterdam"})
 
 
 @pytest.mark.usefixtures("_wipe_database")
-def test_get_person_image() -> None:
-    client = TestClient(app)
+def test_get_person_image(client: TestClient) -> None:
     session: SASession
     with create_session() as session:
         person_image = PersonImage(
@@ -113,4 +249,70 @@ def test_get_person_image() -> None:
 
     response = client.get(f"/person_img/{person_image.uid}")
     assert response.headers["content-type"] == "image/jpeg"
+    assert response.headers["cache-control"] == "no-cache"
     assert response.content == person_image.image_in_bytes
+    response = client.get(f"/person_img/{person_image.uid}", headers={"If-None-Match": response.headers["etag"]})
+    assert response.status_code == 304
+
+
+@pytest.mark.usefixtures("_wipe_database")
+def test_get_person_image_variant(client: TestClient) -> None:
+    image_in_bytes = (Path(__file__).parent / "data" / "openldap_ldifs" / "jan.jpeg").read_bytes()
+    session: SASession
+    with create_session() as session:
+        person_image = PersonImage(
+            image_in_bytes=image_in_bytes,
+            content_hash=image_helper.get_content_hash(image_in_bytes),
+            media_type="image/jpeg",
+            variants=image_helper.create_image_variants(
+                image_in_bytes, sizes=[100, 200], media_types=["image/webp", "image/jpeg"]
+            ),
+        )
+        session.add(person_image)
+
+    url = f"/person_img/{person_image.uid}"
+    response = client.get(url, params={"size": 150, "format": "webp", "v": person_image.content_hash})
+    assert response.headers["content-type"] == "image/webp"
+    assert response.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert Image.open(io.BytesIO(response.content)).width == 200  # The image is in portrait mode.
+    # An outdated version of the URL is not cached for long.
+    response = client.get(url, params={"size": 150, "format": "webp", "v": "outdated"})
+    assert response.headers["cache-control"] == "no-cache"
+    response = client.get(url, params={"size": 50})
+    assert response.headers["content-type"] == "image/jpeg"
+    assert Image.open(io.BytesIO(response.content)).width == 100
+    # There is no variant this large, so we get the original image.
+    response = client.get(url, params={"size": 2000, "format": "webp"})
+    assert response.content == image_in_bytes
+
+
+@pytest.mark.usefixtures("_wipe_database")
+def test_get_person_image_from_image_store(client: TestClient, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    image_in_bytes = (Path(__file__).parent / "data" / "openldap_ldifs" / "jan.jpeg").read_bytes()
+    session: SASession
+    with create_session() as session:
+        person_image = PersonImage(
+            image_in_bytes=image_in_bytes,
+            variants=image_helper.create_image_variants(image_in_bytes, sizes=[100], media_types=["image/webp"]),
+        )
+        session.add(person_image)
+
+    image_store = FileSystemImageStore(tmp_path)
+    monkeypatch.setattr(server.plugin, "image_store", image_store)
+    assert move_person_images.move_to_image_store(image_store) == 2
+    with create_session() as session:
+        assert session.scalars(select(PersonImage.image_in_bytes)).all() == [None]
+        assert session.scalars(select(PersonImageVariant.image_in_bytes)).all() == [None]
+        assert session.scalars(select(PersonImage.content_hash)).one() == image_helper.get_content_hash(image_in_bytes)
+
+    response = client.get(f"/person_img/{person_image.uid}")
+    assert response.headers["content-type"] == "image/jpeg"
+    assert response.headers["etag"] == f'"{image_helper.get_content_hash(image_in_bytes)}"'
+    assert response.content == image_in_bytes
+    response = client.get(f"/person_img/{person_image.uid}", params={"size": 50, "format": "webp"})
+    assert Image.open(io.BytesIO(response.content)).width == 100
+
+    (tmp_path / "ab").mkdir()
+    (tmp_path / "ab" / ("ab" * 32)).write_bytes(b"unreferenced")
+    assert move_person_images.remove_unreferenced_images(image_store, min_age_in_seconds=0) == 1
+    assert len(list(image_store.iter_keys())) == 2
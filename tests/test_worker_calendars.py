@@ -1,13 +1,17 @@
 from datetime import datetime, timedelta
-from typing import List, Optional, Tuple
+from typing import Any, List, Optional, Tuple
+from unittest.mock import patch
 
 import pytest
 import requests_mock
 from pendulum.tz.timezone import UTC
 from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm.session import Session as SASession
 
 from duty_board import worker_calendars
+from duty_board.alchemy import settings
+from duty_board.alchemy.data_version import get_data_version
 from duty_board.alchemy.session import create_session
 from duty_board.models.calendar import Calendar
 from duty_board.models.on_call_event import OnCallEvent
@@ -61,3 +65,104 @@ def test_update_the_most_outdated_calendar() -> None:
 
         assert on_call_events[2].person.username is None
         assert on_call_events[2].person.email == "henk@tank.nl"
+
+
+@pytest.mark.usefixtures("_wipe_database")
+def test_get_most_outdated_calendar_skips_claimed_calendars() -> None:
+    with create_session() as session:
+        for order, uid in enumerate(["first_calendar", "second_calendar"]):
+            session.add(
+                Calendar(
+                    uid=uid,
+                    name=uid,
+                    icalendar_url="https://non-existing-url.com/icalendar.ics",
+                    category="Big Data",
+                    order=order,
+                    last_update_utc=datetime(1970, 1, 1, 0, 0, order, tzinfo=UTC),
+                )
+            )
+
+    # Separate sessions, just like the parallel refresher threads or another replica would have.
+    with get_loaded_ldap_plugin() as example_plugin, SASession(settings.engine) as first, SASession(
+        settings.engine
+    ) as second, SASession(settings.engine) as third:
+        first_calendar = worker_calendars.get_most_outdated_calendar(plugin=example_plugin, session=first)
+        assert first_calendar is not None
+        assert first_calendar.uid == "first_calendar"
+        second_calendar = worker_calendars.get_most_outdated_calendar(plugin=example_plugin, session=second)
+        assert second_calendar is not None
+        assert second_calendar.uid == "second_calendar"
+        assert worker_calendars.get_most_outdated_calendar(plugin=example_plugin, session=third) is None
+
+        # Once the claim is released, the calendar can be picked up again.
+        first.rollback()
+        third_calendar = worker_calendars.get_most_outdated_calendar(plugin=example_plugin, session=third)
+        assert third_calendar is not None
+        assert third_calendar.uid == "first_calendar"
+
+
+class _StopLoopError(Exception):
+    pass
+
+
+@pytest.mark.usefixtures("_wipe_database")
+def test_refresher_waits_when_the_database_fails() -> None:
+    with create_session() as session:
+        session.add(
+            Calendar(
+                uid="data_platform_duty",
+                name="Data Platform Duty",
+                icalendar_url="https://non-existing-url.com/icalendar.ics",
+                category="Big Data",
+                order=1,
+                last_update_utc=datetime(1970, 1, 1, 0, 0, 2, tzinfo=UTC),
+            )
+        )
+
+    synced_calendars: List[str] = []
+
+    def sync_calendar(calendar: Calendar, session: SASession) -> Calendar:
+        synced_calendars.append(calendar.uid)
+        return calendar
+
+    def fail_commit(*args: Any, **kwargs: Any) -> None:
+        raise OperationalError("COMMIT", {}, Exception("The database is gone."))
+
+    # The failed commit rolls back the backoff, so the calendar is still due. We must wait instead of claiming it again.
+    with get_loaded_ldap_plugin() as example_plugin, patch.object(
+        example_plugin, "sync_calendar", side_effect=sync_calendar
+    ), patch.object(SASession, "commit", fail_commit), patch.object(
+        worker_calendars.refresh_schedule, "wait_until_next_due", side_effect=_StopLoopError
+    ) as wait_until_next_due, pytest.raises(_StopLoopError):
+        worker_calendars._enter_calendar_refresher_thread_loop(example_plugin)
+    assert wait_until_next_due.call_count == 1
+    assert synced_calendars == ["data_platform_duty"]
+
+
+@pytest.mark.usefixtures("_wipe_database")
+def test_unchanged_calendar_sync_keeps_the_data_version() -> None:
+    url = "https://non-existing-url.com/icalendar.ics"
+    with create_session() as session:
+        session.add(
+            Calendar(
+                uid="data_platform_duty",
+                name="Data Platform Duty",
+                icalendar_url=url,
+                category="Big Data",
+                order=1,
+                last_update_utc=datetime(1970, 1, 1, 0, 0, 2, tzinfo=UTC),
+                icalendar_etag='"v1"',
+            )
+        )
+    with create_session() as session:
+        data_version = get_data_version(session)
+
+    # The claim and the bookkeeping of the sync are no changes of the schedule.
+    with get_loaded_ldap_plugin() as example_plugin, requests_mock.Mocker() as m:
+        m.get(url, status_code=304)
+        assert worker_calendars.update_the_most_outdated_calendar(example_plugin)
+
+    with create_session() as session:
+        calendar = session.scalars(select(Calendar)).one()
+        assert calendar.last_update_utc > datetime(1970, 1, 1, 0, 0, 2, tzinfo=UTC)
+        assert get_data_version(session) == data_version
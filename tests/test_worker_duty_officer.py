@@ -8,7 +8,7 @@ from sqlalchemy import select
 from sqlalchemy.orm.session import Session as SASession
 
 from duty_board import worker_duty_officer
-from duty_board.alchemy import update_duty_calendars
+from duty_board.alchemy import settings, update_duty_calendars
 from duty_board.alchemy.session import create_session
 from duty_board.models.calendar import Calendar
 from duty_board.models.on_call_event import OnCallEvent
@@ -17,7 +17,7 @@ from tests.conftest import get_loaded_ldap_plugin
 
 
 @pytest.mark.usefixtures("_wipe_database")
-def test_update_the_most_outdated_person() -> None:
+def test_update_the_most_outdated_persons() -> None:
     # Ingest the calendars
     with get_loaded_ldap_plugin() as example_plugin:
         session: SASession
@@ -26,7 +26,7 @@ def test_update_the_most_outdated_person() -> None:
                 session=session, duty_calendar_configurations=example_plugin.duty_calendar_configurations
             )
         # First run is when there is nothing to update yet :)
-        worker_duty_officer.update_the_most_outdated_person(example_plugin)
+        worker_duty_officer.update_the_most_outdated_persons(example_plugin)
 
     # Ingest the Persons & OnCallEvents
     with create_session() as session:
@@ -76,11 +76,9 @@ def test_update_the_most_outdated_person() -> None:
         on_call_events = list(session.scalars(select(OnCallEvent).order_by(OnCallEvent.start_event_utc)).all())
         assert on_call_events[1].person_uid != on_call_events[2].person_uid
 
-    # We proceed to do our three runs to update all three persons
+    # We proceed to do a single run to update all three persons in one batch
     with get_loaded_ldap_plugin() as example_plugin:
-        worker_duty_officer.update_the_most_outdated_person(example_plugin)
-        worker_duty_officer.update_the_most_outdated_person(example_plugin)
-        worker_duty_officer.update_the_most_outdated_person(example_plugin)
+        worker_duty_officer.update_the_most_outdated_persons(example_plugin)
 
     # Here we verify that the users were filled in and user 1 and 2 were combined.
     with create_session() as session:
@@ -91,3 +89,31 @@ def test_update_the_most_outdated_person() -> None:
 
         on_call_events = list(session.scalars(select(OnCallEvent).order_by(OnCallEvent.start_event_utc)).all())
         assert on_call_events[1].person_uid == on_call_events[2].person_uid
+
+
+@pytest.mark.usefixtures("set_up_persons")
+def test_claim_most_outdated_persons(monkeypatch: pytest.MonkeyPatch) -> None:
+    with get_loaded_ldap_plugin() as example_plugin:
+        monkeypatch.setattr(example_plugin, "person_refresher_batch_size", 1)
+        with SASession(settings.engine) as first, SASession(settings.engine) as second:
+            (first_person_uid,) = worker_duty_officer.claim_most_outdated_persons(plugin=example_plugin, session=first)
+            # While the claim is not committed yet, the row is locked and thus skipped.
+            (second_person_uid,) = worker_duty_officer.claim_most_outdated_persons(
+                plugin=example_plugin, session=second
+            )
+            assert first_person_uid != second_person_uid
+            first.commit()
+            second.commit()
+
+        # Both persons are leased, so there is nothing left to claim.
+        with create_session() as session:
+            assert worker_duty_officer.claim_most_outdated_persons(plugin=example_plugin, session=session) == []
+
+        # Once the lease expired, the person is claimed again.
+        with create_session() as session:
+            person = session.get(Person, first_person_uid)
+            assert person is not None
+            person.last_update_utc = DateTime.utcnow() - example_plugin.person_update_frequency
+        with create_session() as session:
+            claimed = worker_duty_officer.claim_most_outdated_persons(plugin=example_plugin, session=session)
+            assert claimed == [first_person_uid]
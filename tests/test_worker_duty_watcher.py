@@ -1,11 +1,14 @@
-from collections import defaultdict
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Any, Dict, List, Mapping, Set, Union
+from typing import Any, Dict, List, Mapping, Set
 from unittest.mock import patch
 
 import pytest
 from pendulum.datetime import DateTime
 from pendulum.tz.timezone import UTC
+from prometheus_client import REGISTRY
 from sqlalchemy import select
 from sqlalchemy.orm.session import Session as SASession
 
@@ -14,6 +17,7 @@ from duty_board.alchemy import update_duty_calendars
 from duty_board.alchemy.session import create_session
 from duty_board.models.calendar import Calendar
 from duty_board.models.on_call_event import OnCallEvent
+from duty_board.models.on_duty_state import OnDutyState
 from duty_board.models.person import Person
 from tests.conftest import get_loaded_ldap_plugin
 
@@ -30,7 +34,7 @@ def test_get_calendars_with_new_duty() -> None:
 
     # Ingest the Persons & OnCallEvents
     with create_session() as session:
-        calendars: List[Calendar] = list(session.scalars(select(Calendar)).all())
+        calendars: List[Calendar] = list(session.scalars(select(Calendar).order_by(Calendar.order)).all())
         persons: List[Person] = [
             Person(
                 username="jan",
@@ -71,41 +75,97 @@ def test_get_calendars_with_new_duty() -> None:
         ]
         session.add_all(events)
 
-    last_calendar_uid_to_person_id: Dict[str, Union[Set[int], None]] = defaultdict(lambda: None)
+    with create_session() as session:
+        worker_duty_watcher.ensure_on_duty_states(session)
     with create_session() as session:
         # We verify the first run lists all the calendars.
-        result = worker_duty_watcher.get_calendars_with_new_duty(session, last_calendar_uid_to_person_id)
+        result = worker_duty_watcher.get_calendars_with_new_duty(session)
         assert result == {
             "data_platform_duty": {persons[0].uid},
             "infrastructure_duty": {persons[2].uid},
             "machine_learning": set(),
         }
 
-        # We verify in the second run that nothing actually changed.
-        result = worker_duty_watcher.get_calendars_with_new_duty(session, last_calendar_uid_to_person_id)
-        assert result == {}
+    # We verify in the second run, like after a restart, that nothing actually changed.
+    with create_session() as session:
+        assert worker_duty_watcher.get_calendars_with_new_duty(session) == {}
 
     with create_session() as session:
         events[1].start_event_utc = DateTime.utcnow() - timedelta(days=1)
         session.merge(events[1])
 
-    result = worker_duty_watcher.get_calendars_with_new_duty(session, last_calendar_uid_to_person_id)
+    with create_session() as session:
+        result = worker_duty_watcher.get_calendars_with_new_duty(session)
     assert result == {"data_platform_duty": {persons[0].uid, persons[1].uid}}
 
     with create_session() as session:
         events[0].start_event_utc = DateTime.utcnow() + timedelta(hours=1)
         session.merge(events[0])
 
-    result = worker_duty_watcher.get_calendars_with_new_duty(session, last_calendar_uid_to_person_id)
+    with create_session() as session:
+        result = worker_duty_watcher.get_calendars_with_new_duty(session)
     assert result == {"data_platform_duty": {persons[1].uid}}
 
     with create_session() as session:
         events[1].start_event_utc = DateTime.utcnow() + timedelta(hours=1)
         session.merge(events[1])
 
-    result = worker_duty_watcher.get_calendars_with_new_duty(session, last_calendar_uid_to_person_id)
+    with create_session() as session:
+        result = worker_duty_watcher.get_calendars_with_new_duty(session)
     assert result == {"data_platform_duty": set()}
 
+    with create_session() as session:
+        on_duty_state = session.get(OnDutyState, "data_platform_duty")
+        assert on_duty_state is not None
+        assert on_duty_state.person_uids == []
+        assert on_duty_state.last_handover_utc is not None
+
+
+@pytest.mark.usefixtures("_wipe_database")
+def test_get_calendars_with_new_duty_hands_over_once_across_replicas() -> None:
+    with get_loaded_ldap_plugin() as example_plugin:
+        session: SASession
+        with create_session() as session:
+            update_duty_calendars.sync_duty_calendar_configurations_to_postgres(
+                session=session, duty_calendar_configurations=example_plugin.duty_calendar_configurations
+            )
+
+    with create_session() as session:
+        calendar = session.scalars(select(Calendar).where(Calendar.uid == "data_platform_duty")).one()
+        person = Person(username="jan", email=None, last_update_utc=datetime(1970, 1, 1, 0, 0, 0, tzinfo=UTC))
+        session.add(
+            OnCallEvent(
+                start_event_utc=DateTime.utcnow() - timedelta(hours=1),
+                end_event_utc=DateTime.utcnow() + timedelta(hours=1),
+                calendar=calendar,
+                person=person,
+            )
+        )
+
+    with create_session() as session:
+        worker_duty_watcher.ensure_on_duty_states(session)
+        # Ensuring them again, like another replica would, is a no-op.
+        worker_duty_watcher.ensure_on_duty_states(session)
+
+    def run_other_replica() -> Dict[str, Set[int]]:
+        # The sessions are scoped per thread, so another thread acts like another replica.
+        other_replica: SASession
+        with create_session() as other_replica:
+            return worker_duty_watcher.get_calendars_with_new_duty(other_replica)
+
+    with create_session() as session:
+        result = worker_duty_watcher.get_calendars_with_new_duty(session)
+        assert result["data_platform_duty"] == {person.uid}
+        # We hold the locks until we commit, so the other replica skips those handovers.
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            assert executor.submit(run_other_replica).result() == {}
+
+    # Once committed, the handovers are done. Neither another replica nor a restarted one runs them again.
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        assert executor.submit(run_other_replica).result() == {}
+    with create_session() as session:
+        assert worker_duty_watcher.get_calendars_with_new_duty(session) == {}
+
 
 @pytest.mark.usefixtures("_wipe_database")
 def test_run_update_event_loop() -> None:
@@ -164,3 +224,148 @@ def test_run_update_event_loop() -> None:
 
         assert kwarg_calendar.uid == "infrastructure_duty"
         assert {person.uid for person in kwarg_persons} == {persons[2].uid}
+
+
+@pytest.mark.usefixtures("_wipe_database")
+def test_get_next_shift_boundary_and_calendars_with_shift_boundary() -> None:
+    with get_loaded_ldap_plugin() as example_plugin:
+        session: SASession
+        with create_session() as session:
+            update_duty_calendars.sync_duty_calendar_configurations_to_postgres(
+                session=session, duty_calendar_configurations=example_plugin.duty_calendar_configurations
+            )
+
+    now = DateTime.utcnow()
+    with create_session() as session:
+        calendars: List[Calendar] = list(session.scalars(select(Calendar).order_by(Calendar.uid)).all())
+        person = Person(username="jan", email=None, last_update_utc=datetime(1970, 1, 1, 0, 0, 0, tzinfo=UTC))
+        session.add(person)
+        session.add_all(
+            [
+                OnCallEvent(
+                    start_event_utc=now - timedelta(days=2),
+                    end_event_utc=now - timedelta(days=1),
+                    calendar=calendars[0],
+                    person=person,
+                ),
+                OnCallEvent(
+                    start_event_utc=now - timedelta(hours=1),
+                    end_event_utc=now + timedelta(hours=2),
+                    calendar=calendars[0],
+                    person=person,
+                ),
+                OnCallEvent(
+                    start_event_utc=now + timedelta(hours=1),
+                    end_event_utc=now + timedelta(hours=3),
+                    calendar=calendars[1],
+                    person=person,
+                ),
+            ]
+        )
+
+    with create_session() as session:
+        # The event of the second calendar starts before the current event of the first calendar ends.
+        assert worker_duty_watcher.get_next_shift_boundary(session, after=now) == now + timedelta(hours=1)
+        assert worker_duty_watcher.get_next_shift_boundary(session, after=now + timedelta(hours=1)) == now + timedelta(
+            hours=2
+        )
+        assert worker_duty_watcher.get_next_shift_boundary(session, after=now + timedelta(hours=3)) is None
+
+        assert (
+            worker_duty_watcher.get_calendar_uids_with_shift_boundary(
+                session, after=now, until=now + timedelta(minutes=30)
+            )
+            == set()
+        )
+        assert worker_duty_watcher.get_calendar_uids_with_shift_boundary(
+            session, after=now, until=now + timedelta(hours=1)
+        ) == {calendars[1].uid}
+        assert worker_duty_watcher.get_calendar_uids_with_shift_boundary(
+            session, after=now + timedelta(hours=1), until=now + timedelta(hours=2)
+        ) == {calendars[0].uid}
+        assert worker_duty_watcher.get_calendar_uids_with_shift_boundary(
+            session, after=now - timedelta(days=3), until=now
+        ) == {calendars[0].uid}
+
+        # Only the given calendars are evaluated.
+        worker_duty_watcher.ensure_on_duty_states(session)
+        result = worker_duty_watcher.get_calendars_with_new_duty(
+            session, calendar_uids={calendars[1].uid}, now=now + timedelta(hours=1)
+        )
+        assert result == {calendars[1].uid: {person.uid}}
+
+
+def _get_callback_counts() -> Dict[str, float]:
+    return {
+        outcome: REGISTRY.get_sample_value(f"duty_watcher_callback_{outcome}_counter_total") or 0.0
+        for outcome in ["success", "failed", "timeout", "cancelled"]
+    }
+
+
+class _SlowPlugin:
+    duty_watcher_callback_pool_size = 2
+
+    def __init__(self) -> None:
+        self.release_slow_callbacks = threading.Event()
+        self.finished_calendar_uids: List[str] = []
+
+    def handle_new_person_on_duty_event(self, calendar: Calendar, persons: Set[Person]) -> None:  # noqa: ARG002
+        if calendar.uid.startswith("slow"):
+            self.release_slow_callbacks.wait(timeout=5)
+        else:
+            time.sleep(0.2)
+        self.finished_calendar_uids.append(calendar.uid)
+
+
+def test_run_callbacks_concurrently_with_timeout() -> None:
+    plugin = _SlowPlugin()
+    # More callbacks than threads, so most of them have to wait for a thread before they start.
+    calendar_uids = ["slow", "fast_1", "fast_2", "fast_3", "fast_4", "fast_5"]
+    calendars_and_persons = [(Calendar(uid=uid, name=uid), set()) for uid in calendar_uids]
+    counts_before = _get_callback_counts()
+    with ThreadPoolExecutor(max_workers=plugin.duty_watcher_callback_pool_size) as executor:
+        start = time.monotonic()
+        worker_duty_watcher.run_callbacks(
+            plugin,  # type: ignore[arg-type]
+            calendars_and_persons=calendars_and_persons,  # type: ignore[arg-type]
+            executor=executor,
+            timeout=timedelta(seconds=0.5),
+        )
+        # The slow callback only held its thread for the timeout, and the queued callbacks got their full timeout.
+        assert time.monotonic() - start < 1.5
+        assert sorted(plugin.finished_calendar_uids) == ["fast_1", "fast_2", "fast_3", "fast_4", "fast_5"]
+        plugin.release_slow_callbacks.set()
+    for _ in range(100):
+        if "slow" in plugin.finished_calendar_uids:
+            break
+        time.sleep(0.01)
+    assert "slow" in plugin.finished_calendar_uids
+    # Every callback is counted exactly once, also the one that finished after its timeout.
+    counts_after = _get_callback_counts()
+    assert {outcome: counts_after[outcome] - counts_before[outcome] for outcome in counts_after} == {
+        "success": 5,
+        "failed": 0,
+        "timeout": 1,
+        "cancelled": 0,
+    }
+
+
+def test_run_callbacks_cancels_callbacks_that_did_not_start(monkeypatch: pytest.MonkeyPatch) -> None:
+    plugin = _SlowPlugin()
+    # The executor has fewer threads than the plugin promises, so not all callbacks can start in time.
+    monkeypatch.setattr(plugin, "duty_watcher_callback_pool_size", 10)
+    calendars_and_persons = [(Calendar(uid=f"slow_{index}", name=f"slow_{index}"), set()) for index in range(5)]
+    counts_before = _get_callback_counts()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        worker_duty_watcher.run_callbacks(
+            plugin,  # type: ignore[arg-type]
+            calendars_and_persons=calendars_and_persons,  # type: ignore[arg-type]
+            executor=executor,
+            timeout=timedelta(seconds=0.2),
+        )
+    plugin.release_slow_callbacks.set()
+    counts_after = _get_callback_counts()
+    counts = {outcome: counts_after[outcome] - counts_before[outcome] for outcome in counts_after}
+    assert counts["cancelled"] >= 2
+    assert counts["timeout"] + counts["cancelled"] == 5
+    assert counts["success"] == counts["failed"] == 0
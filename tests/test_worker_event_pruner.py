@@ -0,0 +1,71 @@
+import io
+import json
+from datetime import timedelta
+from typing import List
+
+import pytest
+from pendulum.datetime import DateTime
+from sqlalchemy import select
+from sqlalchemy.orm.session import Session as SASession
+
+from duty_board import worker_event_pruner
+from duty_board.alchemy.data_version import get_data_version
+from duty_board.alchemy.session import create_session
+from duty_board.models.calendar import Calendar
+from duty_board.models.on_call_event import OnCallEvent
+from duty_board.models.person import Person
+from tests.conftest import get_loaded_ldap_plugin
+
+
+def test_prune_events(set_up_persons: List[Person], monkeypatch: pytest.MonkeyPatch) -> None:
+    now = DateTime.utcnow()
+    session: SASession
+    with create_session() as session:
+        calendar = Calendar(
+            uid="data_platform_duty",
+            name="Data Platform Duty",
+            icalendar_url="https://non-existing-url.com/icalendar.ics",
+            category="Big Data",
+            order=1,
+            last_update_utc=now,
+            sync=False,
+        )
+        # One event per week, of which the last three are within the retention period.
+        calendar.events = [
+            OnCallEvent(
+                start_event_utc=now - timedelta(weeks=weeks_ago + 1),
+                end_event_utc=now - timedelta(weeks=weeks_ago),
+                person_uid=set_up_persons[weeks_ago % 2].uid,
+            )
+            for weeks_ago in range(-1, 10)
+        ]
+        session.add(calendar)
+
+    archive_file = io.StringIO()
+    with get_loaded_ldap_plugin() as example_plugin:
+        monkeypatch.setattr(example_plugin, "event_retention_period", timedelta(weeks=1, days=1))
+        monkeypatch.setattr(example_plugin, "event_pruner_batch_size", 3)
+        assert worker_event_pruner.prune_events(example_plugin, archive_file=archive_file) == 8
+        assert worker_event_pruner.prune_events(example_plugin) == 0
+
+    with create_session() as session:
+        end_of_remaining_events = session.scalars(
+            select(OnCallEvent.end_event_utc).order_by(OnCallEvent.end_event_utc)
+        ).all()
+        assert end_of_remaining_events == [now - timedelta(weeks=1), now, now + timedelta(weeks=1)]
+
+    archived_events = [json.loads(line) for line in archive_file.getvalue().splitlines()]
+    assert len(archived_events) == 8
+    assert {event["calendar_uid"] for event in archived_events} == {"data_platform_duty"}
+    assert min(event["end_event_utc"] for event in archived_events) == (now - timedelta(weeks=9)).isoformat()
+
+
+@pytest.mark.usefixtures("_wipe_database")
+def test_prune_events_keeps_the_data_version() -> None:
+    session: SASession
+    with create_session() as session:
+        data_version = get_data_version(session)
+    with get_loaded_ldap_plugin() as example_plugin:
+        assert worker_event_pruner.prune_events(example_plugin) == 0
+    with create_session() as session:
+        assert get_data_version(session) == data_version
@@ -1,8 +1,11 @@
+import gzip
 from pathlib import Path
 from unittest.mock import patch
 
+from starlette.responses import FileResponse, Response
 from starlette.types import Scope
 
+from duty_board.web_helpers import compress_assets
 from duty_board.web_helpers.gzip_static_files import GZIPStaticFiles
 
 
@@ -36,6 +39,7 @@ def test_gzip_static_files(tmp_path: Path) -> None:
     )
     assert result.status_code == 200
     assert result.headers["content-encoding"] == "gzip"
+    assert result.headers["vary"] == "Accept-Encoding"
 
     # Now we make a request for which we don't have to fetch the most recent file because it has no updated.
     (tmp_path / "main.js.gz").write_bytes(b"HalloGZ")
@@ -44,4 +48,68 @@ def test_gzip_static_files(tmp_path: Path) -> None:
             full_path=tmp_path / "main.js", stat_result=(tmp_path / "main.js").stat(), scope=scope, status_code=200
         )
         assert result.status_code == 304
-        assert set(result.headers.keys()) == {"etag"}
+        assert set(result.headers.keys()) == {"etag", "vary"}
+
+
+def _get_scope(accept_encoding: bytes) -> Scope:
+    return {"method": "GET", "headers": [(b"host", b"testserver"), (b"accept-encoding", accept_encoding)]}
+
+
+def test_precompressed_encoding_negotiation(tmp_path: Path) -> None:
+    static_files = GZIPStaticFiles(directory=tmp_path, check_dir=False)
+    path = tmp_path / "index-4f3a2b1c.js"
+    path.write_bytes(b"Hallo")
+    for suffix in (".br", ".zst", ".gz"):
+        path.with_name(path.name + suffix).write_bytes(b"Hallo" + suffix.encode())
+
+    def get_response(accept_encoding: bytes) -> Response:
+        return static_files.file_response(full_path=path, stat_result=path.stat(), scope=_get_scope(accept_encoding))
+
+    result = get_response(b"gzip, deflate, br, zstd")
+    assert result.headers["content-encoding"] == "br"
+    assert isinstance(result, FileResponse)
+    assert result.path == f"{path}.br"
+    assert result.headers["content-type"] == get_response(b"").headers["content-type"]
+    assert result.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert get_response(b"gzip, zstd").headers["content-encoding"] == "zstd"
+    assert get_response(b"gzip, br;q=0").headers["content-encoding"] == "gzip"
+    assert get_response(b"*, br;q=0").headers["content-encoding"] == "zstd"
+    assert "content-encoding" not in get_response(b"identity").headers
+
+    # A sibling that is compressed again, is served with its new size.
+    path.with_name(path.name + ".br").write_bytes(b"Hallo again.br")
+    assert get_response(b"br").headers["content-length"] == str(len(b"Hallo again.br"))
+    # A sibling that is removed, is no longer served.
+    path.with_name(path.name + ".br").unlink()
+    assert get_response(b"br, gzip").headers["content-encoding"] == "gzip"
+    assert "content-encoding" not in get_response(b"br").headers
+
+    # The cache of which siblings exist is bounded.
+    with patch("duty_board.web_helpers.gzip_static_files._PRECOMPRESSED_ENCODINGS_CACHE_SIZE", 2):
+        for index in range(3):
+            (tmp_path / f"{index}.js").write_bytes(b"Hallo")
+            static_files.file_response(
+                full_path=tmp_path / f"{index}.js", stat_result=(tmp_path / f"{index}.js").stat(), scope=_get_scope(b"")
+            )
+    assert len(static_files._precompressed_encodings_cache) == 2
+
+    # An asset without a hash in its name can change, so it is not cached forever.
+    (tmp_path / "favicon.ico").write_bytes(b"Icon")
+    result = static_files.file_response(
+        full_path=tmp_path / "favicon.ico", stat_result=(tmp_path / "favicon.ico").stat(), scope=_get_scope(b"br")
+    )
+    assert "cache-control" not in result.headers
+    assert "vary" not in result.headers
+
+
+def test_compress_assets(tmp_path: Path) -> None:
+    (tmp_path / "assets").mkdir()
+    script = tmp_path / "assets" / "index-4f3a2b1c.js"
+    script.write_bytes(b"console.log('Hallo');\n" * 100)
+    (tmp_path / "small.css").write_bytes(b"body {}")
+    (tmp_path / "image.png").write_bytes(b"a" * 2000)
+
+    written = compress_assets.compress_assets(tmp_path)
+    assert script.with_name(script.name + ".gz") in written
+    assert all(path.parent == script.parent for path in written)
+    assert gzip.decompress(script.with_name(script.name + ".gz").read_bytes()) == script.read_bytes()
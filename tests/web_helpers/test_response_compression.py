@@ -0,0 +1,82 @@
+import gzip
+from typing import AsyncGenerator
+
+import pytest
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from duty_board.web_helpers.response_compression import CompressionMiddleware, choose_encoding, is_compressible
+
+_LARGE_PAYLOAD = {"events": [{"start_event": "2024-01-01 00:00:00 CET", "person_uid": 1}] * 100}
+
+
+async def _large(_: Request) -> Response:
+    return JSONResponse(_LARGE_PAYLOAD, headers={"ETag": '"abc"'})
+
+
+async def _small(_: Request) -> Response:
+    return JSONResponse({"a": 1})
+
+
+async def _already_encoded(_: Request) -> Response:
+    return Response(gzip.compress(b"a" * 2000), media_type="text/plain", headers={"Content-Encoding": "gzip"})
+
+
+async def _event_stream(_: Request) -> Response:
+    async def events() -> AsyncGenerator[str, None]:
+        yield "event: snapshot\ndata: " + "a" * 2000 + "\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@pytest.fixture()
+def client() -> TestClient:
+    routes = [
+        Route("/large", _large),
+        Route("/small", _small),
+        Route("/already_encoded", _already_encoded),
+        Route("/event_stream", _event_stream),
+    ]
+    app = Starlette(routes=routes)
+    app.add_middleware(CompressionMiddleware, minimum_size=1024)
+    return TestClient(app)
+
+
+def test_choose_encoding() -> None:
+    assert choose_encoding("gzip, deflate") == "gzip"
+    assert choose_encoding("gzip;q=0, deflate") is None
+    assert choose_encoding("") is None
+    assert is_compressible("application/json")
+    assert is_compressible("text/html; charset=utf-8")
+    assert not is_compressible("text/event-stream; charset=utf-8")
+    assert not is_compressible("image/webp")
+
+
+def test_compression_middleware(client: TestClient) -> None:
+    result = client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert result.headers["content-encoding"] == "gzip"
+    assert result.headers["vary"] == "Accept-Encoding"
+    assert result.headers["etag"] == 'W/"abc"'
+    assert int(result.headers["content-length"]) < len(result.content)
+    assert result.json() == _LARGE_PAYLOAD
+
+    result = client.get("/large", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in result.headers
+    assert result.headers["vary"] == "Accept-Encoding"
+    assert result.headers["etag"] == '"abc"'
+
+    # Below the threshold, compressing is not worth it.
+    result = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in result.headers
+    assert result.json() == {"a": 1}
+
+    result = client.get("/already_encoded", headers={"Accept-Encoding": "gzip"})
+    assert result.headers["content-encoding"] == "gzip"
+    assert result.content == b"a" * 2000
+
+    result = client.get("/event_stream", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in result.headers
+    assert "vary" not in result.headers
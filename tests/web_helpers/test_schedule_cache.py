@@ -0,0 +1,117 @@
+import asyncio
+import json
+from datetime import timedelta
+from typing import List, Optional
+
+import pytest
+from pendulum.datetime import DateTime
+from sqlalchemy import delete, select
+from sqlalchemy.orm.session import Session as SASession
+
+from duty_board.alchemy import data_version, settings
+from duty_board.alchemy.session import create_session
+from duty_board.models.calendar import Calendar
+from duty_board.models.on_call_event import OnCallEvent
+from duty_board.models.person import Person
+from duty_board.web_helpers.response_types import CurrentSchedule
+from duty_board.web_helpers.schedule_cache import ScheduleCache, ScheduleResponseCache, SerializedSchedule
+from duty_board.web_helpers.schedule_snapshot import ScheduleSnapshot
+
+
+@pytest.mark.asyncio()
+@pytest.mark.usefixtures("_get_fake_dataset", "_dispose_async_engine")
+async def test_schedule_cache_rebuilds_on_data_version_change() -> None:
+    session: SASession
+    with create_session() as session:
+        calendar = session.scalars(select(Calendar).where(Calendar.uid == "data_platform_duty")).one()
+        person = session.scalars(select(Person).where(Person.username == "bart")).one()
+        session.add(
+            OnCallEvent(
+                calendar=calendar,
+                start_event_utc=DateTime.utcnow() - timedelta(hours=1),
+                end_event_utc=DateTime.utcnow() + timedelta(days=1),
+                person=person,
+            )
+        )
+
+    schedule_cache = ScheduleCache(version_check_interval=timedelta(seconds=0))
+    first_snapshot = await schedule_cache.get_snapshot()
+    assert [c.uid for c in first_snapshot.calendars] == [
+        "data_platform_duty",
+        "infrastructure_duty",
+        "machine_learning",
+    ]
+    assert len(first_snapshot.calendars[0].events) == 1
+    assert first_snapshot.calendars[0].events[0].person_uid == person.uid
+    assert first_snapshot.persons[person.uid].username == "bart"
+    # Nothing changed, so we get the exact same snapshot.
+    assert await schedule_cache.get_snapshot() is first_snapshot
+
+    # Changing something that is not part of the schedule keeps the snapshot.
+    with create_session() as session:
+        person = session.scalars(select(Person).where(Person.username == "bart")).one()
+        person.extra_attributes_json = json.dumps({})
+    assert await schedule_cache.get_snapshot() is first_snapshot
+
+    # Changing the calendar leads to a new snapshot.
+    with create_session() as session:
+        calendar = session.scalars(select(Calendar).where(Calendar.uid == "data_platform_duty")).one()
+        calendar.name = "Renamed Data Platform Duty"
+    second_snapshot = await schedule_cache.get_snapshot()
+    assert second_snapshot.version > first_snapshot.version
+    assert second_snapshot.calendars[0].name == "Renamed Data Platform Duty"
+
+    # Bulk statements bypass the flush, but should also lead to a new snapshot.
+    with create_session() as session:
+        session.execute(delete(OnCallEvent))
+    third_snapshot = await schedule_cache.get_snapshot()
+    assert third_snapshot.version > second_snapshot.version
+    assert third_snapshot.calendars[0].events == []
+
+    with create_session() as session:
+        assert data_version.get_data_version(session) == third_snapshot.version
+
+
+def test_schedule_response_cache() -> None:
+    now = DateTime.utcnow()
+    response_cache = ScheduleResponseCache(max_size=2)
+
+    def create(version: int, valid_until_utc: Optional[DateTime]) -> SerializedSchedule:
+        schedule = CurrentSchedule.model_construct(config=None, calendars=[], persons={})
+        return SerializedSchedule(
+            version=version, schedule=schedule, body=b"{}", etag='"abc"', valid_until_utc=valid_until_utc
+        )
+
+    response_cache.put("Europe/Amsterdam", create(version=1, valid_until_utc=None))
+    assert response_cache.get("Europe/Amsterdam", version=1, now=now) is not None
+    assert response_cache.get("Europe/Amsterdam", version=2, now=now) is None
+    assert response_cache.get("Asia/Tokyo", version=1, now=now) is None
+
+    # Once an event ended, the rendered schedule is outdated.
+    response_cache.put("Asia/Tokyo", create(version=1, valid_until_utc=now + timedelta(minutes=1)))
+    assert response_cache.get("Asia/Tokyo", version=1, now=now) is not None
+    assert response_cache.get("Asia/Tokyo", version=1, now=now + timedelta(minutes=2)) is None
+
+    # The least recently used item is evicted.
+    response_cache.put("Asia/Tokyo", create(version=1, valid_until_utc=None))
+    assert response_cache.get("Europe/Amsterdam", version=1, now=now) is not None
+    response_cache.put("UTC", create(version=1, valid_until_utc=None))
+    assert response_cache.get("Asia/Tokyo", version=1, now=now) is None
+    assert response_cache.get("Europe/Amsterdam", version=1, now=now) is not None
+    assert response_cache.get("UTC", version=1, now=now) is not None
+
+
+def test_schedule_cache_can_be_used_from_several_event_loops() -> None:
+    # The cache is created outside of an event loop, like the one of the server, which is created when it is imported.
+    schedule_cache = ScheduleCache(version_check_interval=timedelta(seconds=0))
+
+    async def get_snapshots_concurrently() -> List[ScheduleSnapshot]:
+        try:
+            return await asyncio.gather(schedule_cache.get_snapshot(), schedule_cache.get_snapshot())
+        finally:
+            await settings.get_async_engine().dispose()
+
+    for _ in range(2):
+        schedule_cache.invalidate()
+        first_snapshot, second_snapshot = asyncio.run(get_snapshots_concurrently())
+        assert first_snapshot is second_snapshot
@@ -0,0 +1,100 @@
+import json
+from datetime import timedelta
+from typing import List
+
+import pytest
+
+from duty_board.web_helpers.response_types import CurrentSchedule, _Calendar, _Config, _Events, _PersonEssentials
+from duty_board.web_helpers.schedule_cache import SerializedSchedule
+from duty_board.web_helpers.schedule_stream import compute_schedule_delta, stream_schedule
+
+CONFIG = _Config(
+    timezone="UTC",
+    text_color="white",
+    background_color="black",
+    categories=[],
+    git_repository_url=None,
+    enable_admin_button=False,
+    announcement_text_color="white",
+    announcement_background_color="red",
+    announcements=[],
+    footer_html=None,
+)
+
+
+def _create_calendar(uid: str, person_uids: List[int]) -> _Calendar:
+    return _Calendar(
+        uid=uid,
+        name=uid,
+        description=None,
+        category="Cat",
+        order=1,
+        last_update="2023-01-01 00:00:00 UTC",
+        error_msg="",
+        sync=True,
+        events=[
+            _Events(start_event="2023-01-01 00:00:00 UTC", end_event="2023-01-02 00:00:00 UTC", person_uid=person_uid)
+            for person_uid in person_uids
+        ],
+    )
+
+
+def _create_schedule(calendars: List[_Calendar]) -> CurrentSchedule:
+    persons = {
+        event.person_uid: _PersonEssentials(uid=event.person_uid, username=f"user{event.person_uid}", email=None)
+        for calendar in calendars
+        for event in calendar.events
+    }
+    return CurrentSchedule(config=CONFIG, calendars=calendars, persons=persons)
+
+
+def _serialize(schedule: CurrentSchedule) -> SerializedSchedule:
+    body = schedule.model_dump_json().encode()
+    return SerializedSchedule(version=1, schedule=schedule, body=body, etag=str(hash(body)), valid_until_utc=None)
+
+
+def test_compute_schedule_delta() -> None:
+    previous = _create_schedule([_create_calendar("a", [1]), _create_calendar("b", [2])])
+    assert compute_schedule_delta(previous, previous) is None
+
+    current = _create_schedule([_create_calendar("a", [1]), _create_calendar("c", [3])])
+    delta = compute_schedule_delta(previous, current)
+    assert delta is not None
+    assert [calendar.uid for calendar in delta.calendars] == ["c"]
+    assert delta.removed_calendar_uids == ["b"]
+    assert list(delta.persons) == [3]
+
+
+@pytest.mark.asyncio()
+async def test_stream_schedule() -> None:
+    schedules = [
+        _serialize(_create_schedule([_create_calendar("a", [1])])),
+        _serialize(_create_schedule([_create_calendar("a", [1])])),
+        _serialize(_create_schedule([_create_calendar("a", [2])])),
+    ]
+    polls = iter(schedules + [schedules[-1]] * 10)
+
+    async def get_serialized_schedule() -> SerializedSchedule:
+        return next(polls)
+
+    async def is_disconnected() -> bool:
+        return False
+
+    events = stream_schedule(
+        get_serialized_schedule=get_serialized_schedule,
+        is_disconnected=is_disconnected,
+        poll_interval=timedelta(seconds=0),
+        heartbeat_interval=timedelta(seconds=0),
+    )
+    snapshot = await events.__anext__()
+    assert snapshot.startswith("event: snapshot\ndata: ")
+    assert json.loads(snapshot.split("data: ", 1)[1])["calendars"][0]["uid"] == "a"
+    # The second poll has the same content, hence nothing is sent but a heartbeat.
+    assert await events.__anext__() == ": heartbeat\n\n"
+    delta = await events.__anext__()
+    assert delta.startswith("event: delta\ndata: ")
+    delta_content = json.loads(delta.split("data: ", 1)[1])
+    assert delta_content["calendars"][0]["events"][0]["person_uid"] == 2
+    assert delta_content["removed_calendar_uids"] == []
+    assert list(delta_content["persons"]) == ["2"]
+    await events.aclose()